@@ -7,7 +7,311 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation import tracer
+
+try:
+    import pyarrow  # noqa: F401  (enables pandas Parquet support)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+def _safe_div(numerator, denominator) -> np.ndarray:
+    """Element-wise division that yields NaN instead of inf where the denominator is 0 or missing."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=(denominator != 0) & ~np.isnan(denominator))
+    return out
+
+
+class KPIEngine:
+    """
+    Compute every KPI for every (ticker, quarter) in whole-column operations.
+
+    Statements are long-format frames with a `Quarter` column ("Q2 2024"
+    or "2024Q2") and optionally a `Ticker` column; single-company frames
+    without one are treated as ticker `DEFAULT_TICKER`.
+    """
+    
+    DEFAULT_TICKER = 'COMPANY'
+    KEY = ['Ticker', 'Quarter']
+    
+    @staticmethod
+    def period_number(quarters: pd.Series) -> np.ndarray:
+        """Map quarter labels to consecutive integers (year * 4 + quarter - 1)."""
+        codes, labels = pd.factorize(quarters)
+        parts = pd.Series(labels).str.extract(r'^\s*(?:Q([1-4])\s*(\d{4})|(\d{4})\s*-?Q([1-4]))\s*$')
+        if parts.isna().all(axis=1).any():
+            bad = labels[parts.isna().all(axis=1).to_numpy()][0]
+            raise ValueError(f"Unrecognized quarter label: {bad!r}")
+        year = parts[1].fillna(parts[2]).astype(int).to_numpy()
+        quarter = parts[0].fillna(parts[3]).astype(int).to_numpy()
+        return (year * 4 + quarter - 1)[codes]
+    
+    @classmethod
+    def row_keys(cls, df: pd.DataFrame) -> pd.MultiIndex:
+        """(Ticker, Period) of every row, so differently formatted quarter labels still match."""
+        ticker = df['Ticker'] if 'Ticker' in df.columns else pd.Series(cls.DEFAULT_TICKER, index=df.index)
+        return pd.MultiIndex.from_arrays([ticker, cls.period_number(df['Quarter'])])
+    
+    @classmethod
+    def _keyed(cls, df: pd.DataFrame) -> pd.DataFrame:
+        if 'Ticker' not in df.columns:
+            df = df.assign(Ticker=cls.DEFAULT_TICKER)
+        return df.set_index(cls.KEY)
+    
+    @classmethod
+    def align(cls, income: pd.DataFrame, balance: pd.DataFrame, cashflow: pd.DataFrame) -> pd.DataFrame:
+        """Join the three statements on (Ticker, Quarter), sorted by ticker then period."""
+        income, balance, cashflow = cls._keyed(income), cls._keyed(balance), cls._keyed(cashflow)
+        merged = income.join(balance, how='left', rsuffix='_balance')
+        merged = merged.join(cashflow, how='left', rsuffix='_cashflow').reset_index()
+        merged['Period'] = cls.period_number(merged['Quarter'])
+        return merged.sort_values(['Ticker', 'Period'], kind='stable').reset_index(drop=True)
+    
+    @staticmethod
+    def lagged(frame: pd.DataFrame, column: str, periods: int) -> np.ndarray:
+        """
+        Value of `column` for the same ticker `periods` quarters earlier,
+        matched on period number so gaps in the history give NaN rather
+        than comparing against the wrong quarter.
+        """
+        values = pd.Series(frame[column].to_numpy(dtype=float),
+                           index=pd.MultiIndex.from_arrays([frame['Ticker'], frame['Period']]))
+        lag_key = pd.MultiIndex.from_arrays([frame['Ticker'], frame['Period'] - periods])
+        return values.reindex(lag_key).to_numpy()
+    
+    @classmethod
+    def compute(cls, income: pd.DataFrame, balance: pd.DataFrame, cashflow: pd.DataFrame) -> pd.DataFrame:
+        """One row per (ticker, quarter) with every KPI column."""
+        f = cls.align(income, balance, cashflow)
+        revenue = f['Revenue'].to_numpy(dtype=float)
+        cogs = f['COGS'].to_numpy(dtype=float)
+        opex = f['Operating_Expense'].to_numpy(dtype=float)
+        net_income = f['Net_Income'].to_numpy(dtype=float)
+        equity = f['Shareholders_Equity'].to_numpy(dtype=float)
+        
+        kpis = f[cls.KEY + ['Period']].copy()
+        # Profitability metrics
+        kpis['Gross_Margin_%'] = _safe_div(revenue - cogs, revenue) * 100
+        kpis['Operating_Margin_%'] = _safe_div(revenue - cogs - opex, revenue) * 100
+        kpis['Net_Margin_%'] = _safe_div(net_income, revenue) * 100
+        
+        # Leverage & Liquidity
+        kpis['Debt_to_Equity'] = _safe_div(f['Total_Liabilities'], equity)
+        kpis['Current_Ratio'] = f['Current_Ratio'].to_numpy(dtype=float)
+        kpis['ROE_%'] = _safe_div(net_income, equity) * 100
+        
+        # Growth metrics (YoY against the same quarter one year earlier)
+        prior_revenue = cls.lagged(f, 'Revenue', 4)
+        kpis['YoY_Revenue_Growth_%'] = _safe_div(revenue - prior_revenue, prior_revenue) * 100
+        return kpis
+
+
+class DeltaEngine:
+    """
+    QoQ, YoY, trailing-twelve-month and CAGR deltas for every numeric
+    column of one statement, computed in a single vectorized pass.
+
+    The engine keeps the last `history` quarters per ticker as rolling
+    state, so `append_quarter` only computes the new rows instead of
+    recomputing the whole history.
+    """
+    
+    def __init__(self, cagr_years: int = 3, ttm: bool = True):
+        self.cagr_years = cagr_years
+        self.ttm = ttm
+        self.history = max(4 * cagr_years, 4)
+        self.value_columns = None
+        self._state = None
+        self._parts = []
+    
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Every delta row computed so far."""
+        if len(self._parts) > 1:
+            frame = pd.concat(self._parts, ignore_index=True)
+            # A restated quarter was appended again: its latest deltas win
+            latest = ~KPIEngine.row_keys(frame).duplicated(keep='last')
+            self._parts = [frame[latest].reset_index(drop=True)]
+        return self._parts[0] if self._parts else pd.DataFrame()
+    
+    @staticmethod
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+        if 'Ticker' not in df.columns:
+            df = df.assign(Ticker=KPIEngine.DEFAULT_TICKER)
+        df = df.assign(Period=KPIEngine.period_number(df['Quarter']))
+        # A quarter reported twice keeps its later (restated) row
+        df = df.drop_duplicates(['Ticker', 'Period'], keep='last')
+        return df.sort_values(['Ticker', 'Period'], kind='stable')
+    
+    def _deltas(self, known: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+        """Deltas for `rows`, looking up lagged values among `known` (which includes `rows`)."""
+        cols = self.value_columns
+        values = known.set_index(['Ticker', 'Period'])[cols].astype(float)
+        current = rows[cols].to_numpy(dtype=float)
+        
+        def lag(periods: int) -> np.ndarray:
+            key = pd.MultiIndex.from_arrays([rows['Ticker'], rows['Period'] - periods])
+            return values.reindex(key).to_numpy()
+        
+        prev_q, prev_y = lag(1), lag(4)
+        out = {'Ticker': rows['Ticker'].to_numpy(), 'Quarter': rows['Quarter'].to_numpy()}
+        blocks = {
+            'QoQ_%': _safe_div(current - prev_q, prev_q) * 100,
+            'QoQ_abs': current - prev_q,
+            'YoY_%': _safe_div(current - prev_y, prev_y) * 100,
+            'YoY_abs': current - prev_y,
+        }
+        if self.ttm:
+            # NaN unless all four quarters are present
+            blocks['TTM'] = current + prev_q + lag(2) + lag(3)
+        ratio = _safe_div(current, lag(4 * self.cagr_years))
+        with np.errstate(invalid='ignore'):
+            cagr = np.where(ratio > 0, ratio ** (1.0 / self.cagr_years) - 1, np.nan) * 100
+        blocks[f'CAGR_{self.cagr_years}y_%'] = cagr
+        
+        for j, col in enumerate(cols):
+            for suffix, block in blocks.items():
+                out[f'{col}_{suffix}'] = block[:, j]
+        return pd.DataFrame(out)
+    
+    def _keep_history(self, frame: pd.DataFrame):
+        """Retain the last `history` quarters per ticker, indexed by ticker for fast lookup."""
+        latest = frame.groupby('Ticker', sort=False)['Period'].transform('max')
+        state = frame[frame['Period'] > latest - self.history - 1]
+        self._state = state.set_index('Ticker', drop=False).sort_index(kind='stable')
+    
+    def compute(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Full recompute over a statement's history; resets the rolling state."""
+        frame = self._prepare(df)
+        self.value_columns = [c for c in frame.select_dtypes(include=[np.number]).columns
+                              if c != 'Period']
+        result = self._deltas(frame, frame)
+        self._parts = [result]
+        self._keep_history(frame)
+        return result
+    
+    def append_quarter(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add newly reported or restated quarter(s) and return their delta rows.
+        Cost scales with the new rows, not the stored history.
+        
+        A restated quarter replaces its earlier row, and the later quarters
+        that lag against it are recomputed and returned as well.
+        """
+        if self._state is None:
+            return self.compute(rows)
+        rows = self._prepare(rows)
+        tickers = rows['Ticker'].unique()
+        prior = self._state.loc[self._state.index.intersection(tickers)].reset_index(drop=True)
+        known = pd.concat([prior, rows], ignore_index=True)
+        known = known.drop_duplicates(['Ticker', 'Period'], keep='last')
+        
+        targets = rows
+        restated = rows[rows.set_index(['Ticker', 'Period']).index.isin(prior.set_index(['Ticker', 'Period']).index)]
+        if not restated.empty:
+            first = known['Ticker'].map(restated.groupby('Ticker')['Period'].min())
+            later = (known['Period'] > first) & (known['Period'] <= first + 4 * self.cagr_years)
+            targets = pd.concat([rows, known[later]], ignore_index=True)
+            targets = targets.drop_duplicates(['Ticker', 'Period']).sort_values(['Ticker', 'Period'], kind='stable')
+        
+        result = self._deltas(known, targets)
+        self._parts.append(result)
+        
+        untouched = self._state[~self._state.index.isin(tickers)].reset_index(drop=True)
+        refreshed = known.sort_values(['Ticker', 'Period'], kind='stable')
+        self._keep_history(pd.concat([untouched, refreshed], ignore_index=True))
+        return result
+
+
+class ColumnarTableStore:
+    """
+    Directory of independently loadable tables, one file per table plus a
+    schema.json sidecar. Uses Parquet when pyarrow is installed, otherwise
+    an uncompressed .npz with one member per column. Both formats can read
+    a subset of columns without deserializing the rest.
+    """
+    
+    SCHEMA_FILE = "schema.json"
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._schema = None
+    
+    @property
+    def schema(self) -> Dict:
+        if self._schema is None:
+            with open(self.path / self.SCHEMA_FILE) as f:
+                self._schema = json.load(f)
+        return self._schema
+    
+    def write(self, tables: Dict[str, pd.DataFrame], fmt: Optional[str] = None) -> Path:
+        fmt = fmt or ('parquet' if HAS_PARQUET else 'npz')
+        self.path.mkdir(parents=True, exist_ok=True)
+        schema = {'format': fmt, 'tables': {}}
+        
+        for name, df in tables.items():
+            df = df.reset_index(drop=True)
+            columns = [str(c) for c in df.columns]
+            if fmt == 'parquet':
+                df.set_axis(columns, axis=1).to_parquet(self.path / f"{name}.parquet", index=False)
+            else:
+                arrays = {}
+                for i, col in enumerate(df.columns):
+                    values = df[col].to_numpy()
+                    if values.dtype == object:
+                        # Strings can't hold NaN/None: record nulls in a mask member
+                        missing = pd.isna(values)
+                        if missing.any():
+                            arrays[f"n{i}"] = missing
+                        values = values.astype(str)
+                    arrays[f"c{i}"] = values
+                np.savez(self.path / f"{name}.npz", **arrays)
+            schema['tables'][name] = {
+                'columns': columns,
+                'dtypes': [str(t) for t in df.dtypes],
+                'rows': len(df),
+            }
+        
+        with open(self.path / self.SCHEMA_FILE, 'w') as f:
+            json.dump(schema, f, indent=2)
+        self._schema = schema
+        return self.path
+    
+    def tables(self) -> List[str]:
+        return list(self.schema['tables'])
+    
+    def read(self, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load one table, touching only the requested columns on disk."""
+        info = self.schema['tables'][table]
+        columns = columns or info['columns']
+        if self.schema['format'] == 'parquet':
+            return pd.read_parquet(self.path / f"{table}.parquet", columns=columns)
+        
+        positions = {c: i for i, c in enumerate(info['columns'])}
+        data = {}
+        with np.load(self.path / f"{table}.npz") as npz:
+            for col in columns:
+                i = positions[col]
+                values = npz[f"c{i}"]
+                if f"n{i}" in npz.files:
+                    values = values.astype(object)
+                    values[npz[f"n{i}"]] = None
+                data[col] = values
+        return pd.DataFrame(data, columns=columns)
+
+
+def load_kpis(analysis_dir: str = "data/financial_analysis") -> Dict[str, float]:
+    """Read just the latest-quarter KPI table from an exported analysis ({} if none were computed)."""
+    table = ColumnarTableStore(analysis_dir).read('kpis')
+    if table.empty:
+        return {}
+    return {k: float(v) for k, v in table.iloc[0].items() if pd.notna(v)}
+
 
 class FinancialDataProcessor:
     """Process financial statements and compute KPIs."""
@@ -17,6 +321,8 @@ class FinancialDataProcessor:
         self.data_dir.mkdir(exist_ok=True)
         self.statements = {}
         self.kpis = {}
+        self.kpi_frame = None
+        self.delta_engines = {}
     
     def load_sample_data(self) -> pd.DataFrame:
         """
@@ -48,67 +354,128 @@ class FinancialDataProcessor:
             'Financing_Cash_Flow': [2000, 1500, 1000, 500, 0, -1000],
         }
         
-        self.statements['income'] = pd.DataFrame(sample_income_stmt)
-        self.statements['balance'] = pd.DataFrame(sample_balance_sheet)
-        self.statements['cashflow'] = pd.DataFrame(sample_cash_flow)
+        with tracer.span('load_sample_data', stage='validate'):
+            self.statements['income'] = pd.DataFrame(sample_income_stmt)
+            self.statements['balance'] = pd.DataFrame(sample_balance_sheet)
+            self.statements['cashflow'] = pd.DataFrame(sample_cash_flow)
         
         return self.statements
     
+    STATEMENTS = ('income', 'balance', 'cashflow')
+    
+    def load_statements(self, paths: Dict[str, str], ticker: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Load the income, balance and cashflow statements from CSV, Excel or
+        Parquet files. Files covering several companies are narrowed to `ticker`.
+        """
+        with tracer.span('load_statements', stage='validate', ticker=ticker) as span:
+            for stmt_name in self.STATEMENTS:
+                if stmt_name not in paths:
+                    raise ValueError(f"Missing {stmt_name} statement; expected keys {self.STATEMENTS}")
+                path = Path(paths[stmt_name])
+                if path.suffix == '.parquet':
+                    df = pd.read_parquet(path)
+                elif path.suffix in ('.xlsx', '.xls'):
+                    df = pd.read_excel(path)  # needs openpyxl
+                else:
+                    df = pd.read_csv(path)
+                if ticker is not None and 'Ticker' in df.columns:
+                    df = df[df['Ticker'] == ticker].reset_index(drop=True)
+                self.statements[stmt_name] = df
+            span.set(rows=sum(len(df) for df in self.statements.values()))
+        return self.statements
+    
+    # Balance sheet items are point-in-time, so summing four quarters is meaningless
+    FLOW_STATEMENTS = ('income', 'cashflow')
+    
     def compute_yoy_qoq_deltas(self) -> Dict[str, pd.DataFrame]:
-        """Compute Year-over-Year and Quarter-over-Quarter changes."""
+        """Compute Year-over-Year, Quarter-over-Quarter, TTM and CAGR changes."""
         deltas = {}
         
-        for stmt_name, df in self.statements.items():
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            delta_df = df[['Quarter']].copy()
-            
-            for col in numeric_cols:
-                # QoQ % change
-                delta_df[f'{col}_QoQ_%'] = df[col].pct_change() * 100
-                # Absolute change
-                delta_df[f'{col}_QoQ_abs'] = df[col].diff()
-            
-            deltas[f'{stmt_name}_qoq'] = delta_df
+        with tracer.span('compute_yoy_qoq_deltas', stage='kpis'):
+            for stmt_name, df in self.statements.items():
+                engine = DeltaEngine(ttm=stmt_name in self.FLOW_STATEMENTS)
+                deltas[f'{stmt_name}_qoq'] = engine.compute(df)
+                self.delta_engines[stmt_name] = engine
         
         return deltas
     
-    def compute_kpis(self) -> Dict[str, float]:
-        """Compute key financial KPIs."""
-        kpis = {}
+    def append_quarter(self, statements: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        Append newly reported quarter rows per statement and update deltas
+        incrementally from the cached rolling state. Rows for a quarter that
+        is already loaded replace it (a restatement).
+        """
+        deltas = {}
+        for stmt_name, rows in statements.items():
+            history = self.statements.get(stmt_name)
+            engine = self.delta_engines.get(stmt_name)
+            if engine is None:
+                # No compute_yoy_qoq_deltas yet: seed the rolling state from the loaded history
+                engine = self.delta_engines[stmt_name] = DeltaEngine(ttm=stmt_name in self.FLOW_STATEMENTS)
+                if history is not None:
+                    engine.compute(history)
+            if history is not None:
+                history = history[~KPIEngine.row_keys(history).isin(KPIEngine.row_keys(rows))]
+            self.statements[stmt_name] = rows if history is None else pd.concat([history, rows], ignore_index=True)
+            deltas[f'{stmt_name}_qoq'] = engine.append_quarter(rows)
+        return deltas
+    
+    def compute_kpi_frame(self) -> pd.DataFrame:
+        """Compute every KPI for every ticker and quarter in the loaded statements."""
+        self.kpi_frame = KPIEngine.compute(
+            self.statements['income'], self.statements['balance'], self.statements['cashflow']
+        )
+        return self.kpi_frame
+    
+    def compute_kpis(self, period: Optional[str] = None, ticker: Optional[str] = None) -> Dict[str, float]:
+        """
+        Compute key financial KPIs for the latest quarter, or for `period` when given.
         
-        income = self.statements['income']
-        balance = self.statements['balance']
-        cashflow = self.statements['cashflow']
+        Statements covering several tickers need an explicit `ticker`.
+        """
+        with tracer.span('compute_kpis', stage='kpis', period=period, ticker=ticker) as span:
+            kpi_frame = self.compute_kpi_frame()
+            span.set(rows=len(kpi_frame))
+        if ticker is not None:
+            kpi_frame = kpi_frame[kpi_frame['Ticker'] == ticker]
+            if kpi_frame.empty:
+                raise ValueError(f"No statements for ticker {ticker!r}")
+        else:
+            tickers = kpi_frame['Ticker'].unique()
+            if len(tickers) > 1:
+                raise ValueError(f"Statements cover {len(tickers)} tickers; pass `ticker` to choose one")
+        if period is not None:
+            wanted = KPIEngine.period_number(pd.Series([period]))[0]
+            kpi_frame = kpi_frame[kpi_frame['Period'] == wanted]
+            if kpi_frame.empty:
+                raise ValueError(f"No statements for period {period!r}")
         
         # Use latest quarter data
-        latest_idx = -1
-        
-        # Profitability metrics
-        kpis['Gross_Margin_%'] = ((income.loc[latest_idx, 'Revenue'] - income.loc[latest_idx, 'COGS']) 
-                                   / income.loc[latest_idx, 'Revenue'] * 100)
-        kpis['Operating_Margin_%'] = ((income.loc[latest_idx, 'Revenue'] - income.loc[latest_idx, 'COGS'] 
-                                       - income.loc[latest_idx, 'Operating_Expense']) 
-                                      / income.loc[latest_idx, 'Revenue'] * 100)
-        kpis['Net_Margin_%'] = (income.loc[latest_idx, 'Net_Income'] / income.loc[latest_idx, 'Revenue'] * 100)
-        
-        # Leverage & Liquidity
-        kpis['Debt_to_Equity'] = (balance.loc[latest_idx, 'Total_Liabilities'] 
-                                  / balance.loc[latest_idx, 'Shareholders_Equity'])
-        kpis['Current_Ratio'] = balance.loc[latest_idx, 'Current_Ratio']
-        kpis['ROE_%'] = (income.loc[latest_idx, 'Net_Income'] 
-                         / balance.loc[latest_idx, 'Shareholders_Equity'] * 100)
-        
-        # Growth metrics (YoY from 4 quarters ago if available)
-        if len(income) >= 5:
-            revenue_growth = ((income.loc[latest_idx, 'Revenue'] - income.iloc[-5, 'Revenue']) 
-                             / income.iloc[-5, 'Revenue'] * 100)
-            kpis['YoY_Revenue_Growth_%'] = revenue_growth
+        latest = kpi_frame.iloc[-1].drop(KPIEngine.KEY + ['Period'])
+        kpis = {k: float(v) for k, v in latest.items() if pd.notna(v)}
         
         self.kpis = kpis
         return kpis
     
-    def export_analysis(self, output_file: str = "financial_analysis.json"):
-        """Export statements and KPIs to JSON."""
+    def _analysis_tables(self) -> Dict[str, pd.DataFrame]:
+        tables = dict(self.statements)
+        tables['kpis'] = pd.DataFrame([self.kpis])
+        if self.kpi_frame is not None:
+            tables['kpi_frame'] = self.kpi_frame
+        for stmt_name, engine in self.delta_engines.items():
+            tables[f'{stmt_name}_deltas'] = engine.frame
+        return tables
+    
+    def export_analysis(self, output_dir: str = "financial_analysis", fmt: Optional[str] = None) -> Path:
+        """Export statements, KPIs and deltas as a columnar table directory."""
+        with tracer.span('export_analysis'):
+            output_path = ColumnarTableStore(self.data_dir / output_dir).write(self._analysis_tables(), fmt)
+        print(f"✓ Analysis exported to {output_path}")
+        return output_path
+    
+    def export_analysis_json(self, output_file: str = "financial_analysis.json") -> Path:
+        """Export statements and KPIs to JSON (legacy format)."""
         export_data = {
             'statements': {k: v.to_dict() for k, v in self.statements.items()},
             'kpis': self.kpis
@@ -117,10 +484,42 @@ class FinancialDataProcessor:
         output_path = self.data_dir / output_file
         with open(output_path, 'w') as f:
             json.dump(export_data, f, indent=2, default=str)
-        
-        print(f"✓ Analysis exported to {output_path}")
         return output_path
-
+    
+    def benchmark_export(self, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+        """
+        Best-of-`repeat` write time, KPI read time and on-disk size of the
+        legacy JSON export versus the columnar one.
+        """
+        def best(fn):
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - t0)
+            return min(times)
+        
+        json_path = self.data_dir / "benchmark_analysis.json"
+        columnar_path = self.data_dir / "benchmark_analysis"
+        
+        def read_json_kpis():
+            with open(json_path) as f:
+                return json.load(f)['kpis']
+        
+        results = {
+            'json': {
+                'write_s': best(lambda: self.export_analysis_json(json_path.name)),
+                'read_kpis_s': best(read_json_kpis),
+                'bytes': json_path.stat().st_size,
+            },
+            'columnar': {
+                'write_s': best(lambda: ColumnarTableStore(columnar_path).write(self._analysis_tables())),
+                'read_kpis_s': best(lambda: load_kpis(columnar_path)),
+                'bytes': sum(p.stat().st_size for p in columnar_path.iterdir()),
+            },
+        }
+        results['columnar']['format'] = ColumnarTableStore(columnar_path).schema['format']
+        return results
 
 if __name__ == "__main__":
     processor = FinancialDataProcessor()
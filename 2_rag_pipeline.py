@@ -3,10 +3,238 @@ RAG pipeline: Chunk financial filings and create embeddings.
 Uses ChromaDB for vector storage and retrieval.
 """
 
+import io
 import json
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from collections.abc import Mapping
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, TextIO, Tuple, Union
 import hashlib
+import html
+import re
+import shutil
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from instrumentation import tracer
+
+# Chunk ids are this many bytes of the chunk text's MD5, written as hex
+CHUNK_ID_BYTES = 6
+
+
+class _SectionStream:
+    """Read-only text stream over one section's text, pulled lazily from the parser."""
+    
+    def __init__(self, events: Iterator[Tuple[str, Optional[str]]]):
+        self._events = events
+        self._buffer = ''
+        self._done = False
+        self.next_item = None  # item code of the section that follows, None at end of filing
+    
+    def _pull(self) -> bool:
+        kind, value = next(self._events, ('end', None))
+        if kind == 'text':
+            self._buffer += value
+            return True
+        self._done = True
+        self.next_item = value
+        return False
+    
+    def read(self, size: int = -1) -> str:
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            self._pull()
+        if size < 0:
+            size = len(self._buffer)
+        out, self._buffer = self._buffer[:size], self._buffer[size:]
+        return out
+    
+    def drain(self):
+        """Skip whatever the consumer left unread."""
+        self._buffer = ''
+        while not self._done:
+            self._pull()
+            self._buffer = ''
+
+
+class SECFilingParser:
+    """
+    Single-pass parser for 10-K filings in HTML or plain text.
+
+    The file is read in `buffer_size` pieces; markup is stripped as it
+    streams (block tags become line breaks, script/style bodies are
+    dropped, entities are decoded) and "Item N." headings are detected
+    line by line. A heading only starts a section once `min_section_chars`
+    of text follow it before the next heading, which skips the table of
+    contents. Memory is bounded by a buffer, one line and that look-ahead.
+    """
+    
+    SECTIONS = {
+        '1': 'Item_1_Business',
+        '1A': 'Item_1A_Risk_Factors',
+        '7': 'Item_7_MD&A',
+        '7A': 'Item_7A_Market_Risk',
+    }
+    
+    # Only the item token ignores case: a capitalized title may follow it, prose may not
+    _HEADING_RE = re.compile(r'\s*(?i:item)\s*(\d{1,2}(?i:[a-d])?)\s*(?:[.:–—-]|\s+[A-Z]|\s*$)')
+    _MARKUP_RE = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][\w:-]*)?[^>]*>', re.S)
+    _BLOCK_TAGS = frozenset('p div br tr td th li h1 h2 h3 h4 h5 h6 table title hr document type'.split())
+    _SKIP_TAGS = frozenset(('script', 'style', 'head'))
+    
+    def __init__(self, sections: Optional[Dict[str, str]] = None, buffer_size: int = 1 << 16,
+                 min_section_chars: int = 2000, max_line_chars: int = 1 << 16):
+        self.sections = sections or self.SECTIONS
+        self.buffer_size = buffer_size
+        self.min_section_chars = min_section_chars
+        self.max_line_chars = max_line_chars
+    
+    @staticmethod
+    def _looks_like_html(head: str) -> bool:
+        head = head.lower()
+        return any(tag in head for tag in ('<html', '<body', '<div', '<p>', '<p ', '<table', '<font'))
+    
+    def _strip_markup(self, stream: TextIO, first: str) -> Iterator[str]:
+        """Text of an HTML stream with tags removed, one piece per buffer."""
+        carry, buffer = '', first
+        skipping = None  # tag whose body is being dropped
+        while True:
+            text = carry + buffer
+            final = not buffer
+            carry = ''
+            if not final:
+                # Hold back an unfinished tag, comment or entity for the next buffer
+                cut = len(text)
+                lt = text.rfind('<')
+                if lt >= 0 and len(text) - lt < 4096 and text.find('>', lt) < 0:
+                    cut = lt
+                comment = text.rfind('<!--', 0, cut)
+                if comment >= 0 and text.find('-->', comment) < 0:
+                    cut = comment
+                amp = text.rfind('&', max(0, cut - 10), cut)
+                if amp >= 0 and ';' not in text[amp:cut]:
+                    cut = amp
+                text, carry = text[:cut], text[cut:]
+            
+            pieces, pos = [], 0
+            for match in self._MARKUP_RE.finditer(text):
+                if skipping is None:
+                    pieces.append(text[pos:match.start()])
+                pos = match.end()
+                name = (match.group(2) or '').lower()
+                closing = bool(match.group(1))
+                if skipping is not None:
+                    if closing and name == skipping:
+                        skipping = None
+                elif name in self._SKIP_TAGS and not closing:
+                    skipping = name
+                elif name in self._BLOCK_TAGS:
+                    pieces.append('\n')
+            if skipping is None:
+                pieces.append(text[pos:])
+            
+            piece = ''.join(pieces)
+            if '&' in piece:
+                piece = html.unescape(piece)
+            if piece:
+                yield piece
+            if final:
+                return
+            buffer = stream.read(self.buffer_size)
+    
+    def iter_text(self, stream: TextIO) -> Iterator[str]:
+        """Plain text of a filing stream, markup stripped when it is HTML."""
+        first = stream.read(self.buffer_size)
+        if self._looks_like_html(first[:4096]):
+            yield from self._strip_markup(stream, first)
+            return
+        while first:
+            yield first
+            first = stream.read(self.buffer_size)
+    
+    def _iter_lines(self, stream: TextIO) -> Iterator[str]:
+        """Lines of text (with newlines); over-long runs without a break are split."""
+        carry = ''
+        for piece in self.iter_text(stream):
+            lines = (carry + piece).split('\n')
+            carry = lines.pop()
+            for line in lines:
+                yield line + '\n'
+            while len(carry) > self.max_line_chars:
+                yield carry[:self.max_line_chars]
+                carry = carry[self.max_line_chars:]
+        if carry:
+            yield carry
+    
+    def _heading(self, line: str) -> Optional[str]:
+        if len(line) > 200:
+            return None
+        match = self._HEADING_RE.match(line)
+        return match.group(1).upper() if match else None
+    
+    def _section_events(self, stream: TextIO) -> Iterator[Tuple[str, Optional[str]]]:
+        """('start', item) when a section is confirmed, then ('text', piece) for its text."""
+        item, confirmed = None, False
+        pending, pending_chars = [], 0
+        out, out_chars = [], 0
+        for line in self._iter_lines(stream):
+            heading = self._heading(line)
+            if heading is not None:
+                if out:
+                    yield 'text', ''.join(out)
+                    out, out_chars = [], 0
+                # An unconfirmed heading followed this quickly was a table-of-contents entry
+                item, confirmed = heading, False
+                pending, pending_chars = [line], 0
+                continue
+            if item is None:
+                continue  # cover page before the first heading
+            if confirmed:
+                out.append(line)
+                out_chars += len(line)
+                if out_chars >= self.buffer_size:
+                    yield 'text', ''.join(out)
+                    out, out_chars = [], 0
+                continue
+            pending.append(line)
+            pending_chars += len(line.strip())
+            if pending_chars >= self.min_section_chars:
+                confirmed = True
+                yield 'start', item
+                yield 'text', ''.join(pending)
+                pending = []
+        
+        if out:
+            yield 'text', ''.join(out)
+        elif item is not None and not confirmed and pending_chars:
+            # The last section of the filing can't be a table-of-contents entry
+            yield 'start', item
+            yield 'text', ''.join(pending)
+    
+    def iter_sections(self, source: Union[str, Path, TextIO]) -> Iterator[Tuple[str, TextIO]]:
+        """
+        Yield (section name, text stream) for each wanted section in filing
+        order. Like itertools.groupby, a stream is only valid until the
+        next pair is requested; unread text is skipped.
+        """
+        if isinstance(source, (str, Path)):
+            with open(source, encoding='utf-8', errors='replace') as f:
+                yield from self.iter_sections(f)
+            return
+        
+        events = self._section_events(source)
+        next_item = next((value for kind, value in events if kind == 'start'), None)
+        while next_item is not None:
+            section = _SectionStream(events)
+            if next_item in self.sections:
+                yield self.sections[next_item], section
+            section.drain()
+            next_item = section.next_item
+
 
 class FilingChunker:
     """Chunk financial filings for RAG."""
@@ -14,12 +242,12 @@ class FilingChunker:
     def __init__(self, chunk_size: int = 500, overlap: int = 100):
         self.chunk_size = chunk_size
         self.overlap = overlap
-        self.chunks = []
+        self.chunks = ChunkTable(initial_capacity=0)
     
     def create_synthetic_filings(self) -> Dict[str, str]:
         """
         Create synthetic filing text.
-        In production, parse actual SEC HTML/text filings.
+        For real SEC HTML/text filings use `iter_filing_document`.
         """
         filing_text = {
             'Item_1_Business': """
@@ -46,84 +274,1962 @@ class FilingChunker:
         }
         return filing_text
     
-    def chunk_text(self, text: str, source_id: str) -> List[Dict]:
-        """Split text into overlapping chunks."""
-        words = text.split()
-        chunks = []
+    # Code points str.split() treats as whitespace (all are below U+3001)
+    _WHITESPACE = np.array([c for c in range(0x3001) if chr(c).isspace()], dtype=np.uint32)
+    
+    def _make_chunk(self, words: List[str], source_id: str, start_pos: int,
+                    char_start: int, char_end: int) -> Optional[Dict]:
+        chunk_text = ' '.join(words).strip()
+        if len(chunk_text) <= 50:  # Skip very small chunks
+            return None
+        return {
+            'id': hashlib.md5(chunk_text.encode()).hexdigest()[:2 * CHUNK_ID_BYTES],
+            'text': chunk_text,
+            'source': source_id,
+            'start_pos': start_pos,
+            'word_count': len(words),
+            'char_start': char_start,
+            'char_end': char_end,
+        }
+    
+    @classmethod
+    def _word_spans(cls, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Start/end character offsets of each whitespace-separated word."""
+        is_space = np.isin(np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32), cls._WHITESPACE)
+        edges = np.diff(np.concatenate(([0], (~is_space).view(np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    
+    def iter_chunks(self, stream: TextIO, source_id: str, buffer_size: int = 1 << 20) -> Iterator[Dict]:
+        """
+        Lazily chunk a text stream read in fixed-size buffers.
+
+        Yields the same chunks as `chunk_text` on the full text, plus the
+        character offsets each chunk spans. Memory is bounded by one
+        buffer plus one window of `chunk_size` words.
+        """
+        step = self.chunk_size - self.overlap
+        if step <= 0:
+            raise ValueError("overlap must be smaller than chunk_size")
         
-        for i in range(0, len(words), self.chunk_size - self.overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            chunk_text = ' '.join(chunk_words).strip()
-            
-            if len(chunk_text) > 50:  # Skip very small chunks
-                chunk_id = hashlib.md5(chunk_text.encode()).hexdigest()[:12]
-                chunks.append({
-                    'id': chunk_id,
-                    'text': chunk_text,
-                    'source': source_id,
-                    'start_pos': i,
-                    'word_count': len(chunk_words)
-                })
+        # Words read but not yet behind the current window, with absolute offsets
+        words = []
+        starts = np.empty(0, dtype=np.int64)
+        ends = np.empty(0, dtype=np.int64)
+        pos = 0  # window start, relative to `words`; may run past it if step > chunk_size
+        start_pos = 0  # window start as an absolute word index
+        offset = 0  # absolute position of `carry` in the stream
+        carry = ''
+        produced = 0
         
-        return chunks
+        while True:
+            buffer = stream.read(buffer_size)
+            text = carry + buffer
+            # Hold back a word that may continue in the next buffer
+            cut = len(text)
+            if buffer:
+                while cut and not text[cut - 1].isspace():
+                    cut -= 1
+            segment = text[:cut]
+            carry = text[cut:]
+            
+            new_words = segment.split()
+            if new_words:
+                new_starts, new_ends = self._word_spans(segment)
+                words.extend(new_words)
+                starts = np.concatenate((starts, new_starts + offset))
+                ends = np.concatenate((ends, new_ends + offset))
+            offset += cut
+            
+            final = not buffer
+            while pos < len(words) and (final or len(words) - pos >= self.chunk_size):
+                stop = min(pos + self.chunk_size, len(words))
+                chunk = self._make_chunk(words[pos:stop], source_id, start_pos,
+                                         int(starts[pos]), int(ends[stop - 1]))
+                if chunk:
+                    produced += 1
+                    yield chunk
+                pos += step
+                start_pos += step
+            
+            if final:
+                tracer.count('chunks_produced', produced)
+                tracer.count('chars_chunked', offset)
+                break
+            
+            dropped = min(pos, len(words))
+            del words[:dropped]
+            starts, ends = starts[dropped:], ends[dropped:]
+            pos -= dropped
     
-    def process_filings(self) -> List[Dict]:
-        """Process all filing sections into chunks."""
-        filings = self.create_synthetic_filings()
-        all_chunks = []
-        
-        for section, text in filings.items():
-            chunks = self.chunk_text(text, section)
-            all_chunks.extend(chunks)
+    def chunk_text(self, text: str, source_id: str) -> List[Dict]:
+        """Split text into overlapping chunks."""
+        return list(self.iter_chunks(io.StringIO(text), source_id))
+    
+    def iter_filings(self, filings: Optional[Dict[str, Union[str, TextIO]]] = None,
+                     buffer_size: int = 1 << 20) -> Iterator[Dict]:
+        """
+        Stream chunks for every filing section. Values may be text, open
+        file handles, or paths to text files (opened and read in buffers).
+        """
+        if filings is None:
+            filings = self.create_synthetic_filings()
         
-        self.chunks = all_chunks
-        return all_chunks
+        for section, source in filings.items():
+            if isinstance(source, Path):
+                with open(source, encoding='utf-8', errors='replace') as f:
+                    yield from self.iter_chunks(f, section, buffer_size)
+            elif isinstance(source, str):
+                yield from self.iter_chunks(io.StringIO(source), section, buffer_size)
+            else:
+                yield from self.iter_chunks(source, section, buffer_size)
+    
+    def iter_filing_document(self, source: Union[str, Path, TextIO],
+                             parser: Optional[SECFilingParser] = None,
+                             buffer_size: int = 1 << 20) -> Iterator[Dict]:
+        """Stream chunks of the wanted sections of a whole 10-K (HTML or text) in one pass."""
+        parser = parser or SECFilingParser()
+        for section, stream in parser.iter_sections(source):
+            yield from self.iter_chunks(stream, section, buffer_size)
+    
+    def process_filings(self, filings: Optional[Dict[str, Union[str, TextIO]]] = None,
+                        **metadata) -> 'ChunkTable':
+        """
+        Process all filing sections (the synthetic ones by default) into a
+        columnar chunk table. Keyword fields (e.g. ticker, period) are set
+        on every chunk.
+        """
+        with tracer.span('process_filings', stage='embeddings') as span:
+            chunks = self.iter_filings(filings)
+            if metadata:
+                chunks = (dict(c, **metadata) for c in chunks)
+            self.chunks = ChunkTable.from_chunks(chunks)
+            span.set(chunks=len(self.chunks))
+        return self.chunks
     
     def save_chunks(self, output_file: str = "data/chunks.json"):
         """Save chunks for embedding."""
         Path("data").mkdir(exist_ok=True)
         with open(output_file, 'w') as f:
-            json.dump(self.chunks, f, indent=2)
+            json.dump([dict(c) for c in self.chunks], f, indent=2)
         print(f"✓ {len(self.chunks)} chunks saved to {output_file}")
+    
+    def save_chunks_jsonl(self, chunks: Iterable[Dict], output_file: str = "data/chunks.jsonl") -> int:
+        """Write chunks one JSON line at a time as they are produced; returns the count."""
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with open(output_file, 'w') as f:
+            for chunk in chunks:
+                f.write(json.dumps(dict(chunk)))
+                f.write('\n')
+                count += 1
+        print(f"✓ {count} chunks streamed to {output_file}")
+        return count
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9$%.]+")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Embedder(ABC):
+    """Interface for embedding backends: a batch of texts in, an (n, dim) matrix out."""
+    
+    name = "embedder"
+    dim = 0
+    
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 embeddings."""
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic offline embedder using signed feature hashing of word
+    unigrams and bigrams. Needs no model download, so every run and every
+    machine produces identical vectors for identical text.
+    """
+    
+    def __init__(self, dim: int = 384, max_vocab_cache: int = 1_000_000):
+        self.dim = dim
+        self.name = f"hashing-{dim}-v1"
+        self.max_vocab_cache = max_vocab_cache
+        self._hashes = {}
+    
+    def _hash(self, feature: str) -> int:
+        h = self._hashes.get(feature)
+        if h is None:
+            h = zlib.crc32(feature.encode('utf-8'))
+            if len(self._hashes) < self.max_vocab_cache:
+                self._hashes[feature] = h
+        return h
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            tokens = _tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            hashes.extend(self._hash(f) for f in features)
+            rows.extend([row] * len(features))
+        
+        hashes = np.array(hashes, dtype=np.uint32)
+        buckets = np.array(rows, dtype=np.int64) * self.dim + (hashes % self.dim)
+        # Top hash bit picks the sign so collisions cancel out on average
+        signs = np.where(hashes >> 31, -1.0, 1.0)
+        counts = np.bincount(buckets, weights=signs, minlength=len(texts) * self.dim)
+        return counts.reshape(len(texts), self.dim).astype(np.float32)
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed on content-addressed chunk ids.
+
+    Each namespace (one per embedder) is a pair of append-only files:
+    fixed-width ascii ids and the matching raw float32 vectors.
+    """
+    
+    ID_WIDTH = 16
+    
+    def __init__(self, namespace: str, dim: int, cache_dir: str = "data/embedding_cache"):
+        self.dim = dim
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._ids_path = cache_dir / f"{namespace}.ids"
+        self._vectors_path = cache_dir / f"{namespace}.f32"
+        self._rows = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+    
+    def _load(self):
+        if not self._ids_path.exists() or not self._vectors_path.exists():
+            return
+        ids = np.fromfile(self._ids_path, dtype=f'S{self.ID_WIDTH}')
+        row_bytes = self.dim * 4
+        # A crash mid-append can leave the two files at different lengths
+        count = min(len(ids), self._vectors_path.stat().st_size // row_bytes)
+        if count:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                      shape=(count, self.dim))
+        self._rows = {cid.decode('ascii'): i for i, cid in enumerate(ids[:count])}
+    
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending)
+    
+    def get(self, chunk_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(chunk_id)
+        if row is not None:
+            self.hits += 1
+            return self._vectors[row]
+        vector = self._pending.get(chunk_id)
+        if vector is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return vector
+    
+    def put_many(self, chunk_ids: List[str], vectors: np.ndarray):
+        for chunk_id, vector in zip(chunk_ids, vectors):
+            if chunk_id not in self._rows:
+                self._pending[chunk_id] = vector
+    
+    def flush(self):
+        """Append pending entries to disk."""
+        if not self._pending:
+            return
+        ids = np.array([cid.encode('ascii') for cid in self._pending], dtype=f'S{self.ID_WIDTH}')
+        vectors = np.asarray(list(self._pending.values()), dtype=np.float32)
+        with open(self._vectors_path, 'ab') as f:
+            vectors.tofile(f)
+        with open(self._ids_path, 'ab') as f:
+            ids.tofile(f)
+        self._pending = {}
+        self._load()
+    
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class EmbeddingEngine:
+    """Embed chunks in large batches, skipping any chunk id already cached."""
+    
+    def __init__(self, embedder: Optional[Embedder] = None, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 2048):
+        self.embedder = embedder or HashingEmbedder()
+        self.cache = cache
+        self.batch_size = batch_size
+        self.stats = {}
+    
+    @classmethod
+    def with_disk_cache(cls, embedder: Optional[Embedder] = None,
+                        cache_dir: str = "data/embedding_cache", **kwargs) -> 'EmbeddingEngine':
+        embedder = embedder or HashingEmbedder()
+        return cls(embedder, EmbeddingCache(embedder.name, embedder.dim, cache_dir), **kwargs)
+    
+    def embed_chunks(self, chunks: List[Dict]) -> np.ndarray:
+        """Return one embedding row per chunk, in input order."""
+        with tracer.span('embed_chunks', stage='embeddings', chunks=len(chunks)) as span:
+            embeddings = self._embed_chunks(chunks)
+            span.set(cache_hits=self.stats['cache_hits'], embedded=self.stats['embedded'])
+        tracer.count('embedding_cache_hits', self.stats['cache_hits'])
+        tracer.count('embedding_cache_misses', self.stats['embedded'])
+        return embeddings
+    
+    def _embed_chunks(self, chunks: List[Dict]) -> np.ndarray:
+        t0 = time.perf_counter()
+        embeddings = np.empty((len(chunks), self.embedder.dim), dtype=np.float32)
+        
+        missing = []
+        for i, chunk in enumerate(chunks):
+            cached = self.cache.get(chunk['id']) if self.cache is not None else None
+            if cached is None:
+                missing.append(i)
+            else:
+                embeddings[i] = cached
+        
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            vectors = self.embedder.embed([chunks[i]['text'] for i in batch])
+            embeddings[batch] = vectors
+            if self.cache is not None:
+                self.cache.put_many([chunks[i]['id'] for i in batch], vectors)
+        
+        if self.cache is not None:
+            self.cache.flush()
+        
+        elapsed = time.perf_counter() - t0
+        self.stats = {
+            'chunks': len(chunks),
+            'embedded': len(missing),
+            'cache_hits': len(chunks) - len(missing),
+            'hit_rate': (len(chunks) - len(missing)) / len(chunks) if chunks else 0.0,
+            'seconds': elapsed,
+            'chunks_per_s': len(chunks) / elapsed if elapsed > 0 else float('inf'),
+        }
+        return embeddings
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores along the last axis, best first."""
+    k = min(top_k, scores.shape[-1])
+    if k < scores.shape[-1]:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(k), scores.shape[:-1] + (k,))
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1, kind='stable')
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def _write_rows(file: Path, data: np.ndarray, start: int):
+    """
+    Write rows `start:` of `data` into the .npy `file` in place. The file
+    may hold spare rows past the data; when it is missing, too short or of
+    another dtype it is rewritten in full with room for as many rows again.
+    """
+    existing = np.load(file, mmap_mode='r+') if file.exists() else None
+    if (existing is not None and existing.dtype == data.dtype
+            and existing.shape[1:] == data.shape[1:] and len(existing) >= len(data)):
+        if len(data) > start:
+            existing[start:len(data)] = data[start:]
+            existing.flush()
+        return
+    tmp_path = file.with_name(f".{file.name}.tmp")
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=data.dtype,
+                                    shape=(max(2 * len(data), 1),) + data.shape[1:])
+    out[:len(data)] = data
+    out.flush()
+    del out, existing
+    os.replace(tmp_path, file)
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over normalized embeddings.
+
+    Rows are bucketed by their nearest spherical k-means centroid; a query
+    only scores the rows in its `nprobe` closest buckets. Raising `nprobe`
+    trades latency for recall.
+    """
+    
+    def __init__(self, n_lists: int = 256, nprobe: int = 8, n_iter: int = 10,
+                 min_train_size: Optional[int] = None, seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        # Fewer than ~40 points per centroid gives poorly balanced lists
+        self.min_train_size = min_train_size or 39 * n_lists
+        self.seed = seed
+        self.centroids = None
+        self._lists = []
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        """Nearest centroid for each row, scored in batches to bound memory."""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+    
+    def train(self, vectors: np.ndarray):
+        """Fit centroids with spherical k-means on (a sample of) the rows."""
+        rng = np.random.default_rng(self.seed)
+        n_lists = min(self.n_lists, len(vectors))
+        sample_size = min(len(vectors), 256 * n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            self.centroids = centroids
+            assignments = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = ChromaDBVectorStore._normalize(sums)
+        
+        self.centroids = centroids
+        self.n_lists = n_lists
+        self._lists = [[] for _ in range(n_lists)]
+    
+    def add(self, vectors: np.ndarray, start_id: int):
+        """Bucket rows whose store ids start at `start_id`."""
+        assignments = self._assign(vectors)
+        ids = np.arange(start_id, start_id + len(vectors), dtype=np.int64)
+        order = np.argsort(assignments, kind='stable')
+        lists, starts = np.unique(assignments[order], return_index=True)
+        for list_no, block in zip(lists, np.split(ids[order], starts[1:])):
+            self._lists[list_no].append(block)
+    
+    def _list_ids(self, list_no: int) -> np.ndarray:
+        """Ids in one list, compacting appended blocks on first read."""
+        blocks = self._lists[list_no]
+        if not blocks:
+            return np.empty(0, dtype=np.int64)
+        if len(blocks) > 1:
+            blocks[:] = [np.concatenate(blocks)]
+        return blocks[0]
+    
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Store ids in the `nprobe` lists closest to a normalized query."""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probe = _top_k(self.centroids @ query, nprobe)
+        return np.concatenate([self._list_ids(list_no) for list_no in probe])
+    
+    def list_sizes(self) -> np.ndarray:
+        return np.array([sum(len(b) for b in blocks) for blocks in self._lists])
+    
+    def _ids_since(self, list_no: int, since: int) -> np.ndarray:
+        """Ids >= `since` in one list; lists are ascending, so these are a suffix."""
+        tail = []
+        for block in reversed(self._lists[list_no]):
+            cut = int(np.searchsorted(block, since))
+            tail.append(block[cut:])
+            if cut:
+                break
+        return np.concatenate(tail[::-1]) if tail else np.empty(0, dtype=np.int64)
+    
+    def save(self, path: Path, prefix: str = "", since: int = 0) -> Dict:
+        """
+        Write the lists as <prefix>ivf_ids.npy + <prefix>ivf_offsets.npy, only
+        ids >= `since` when appending a segment (centroids are written by
+        whole saves only); returns the store.json entry.
+        """
+        if since:
+            list_ids = [self._ids_since(n, since) for n in range(self.n_lists)]
+        else:
+            list_ids = [self._list_ids(n) for n in range(self.n_lists)]
+            np.save(path / "ivf_centroids.npy", self.centroids)
+        np.save(path / f"{prefix}ivf_ids.npy", np.concatenate(list_ids))
+        np.save(path / f"{prefix}ivf_offsets.npy", np.cumsum([0] + [len(ids) for ids in list_ids]))
+        return self.info()
+    
+    def info(self) -> Dict:
+        return {'type': 'ivf', 'n_lists': self.n_lists, 'nprobe': self.nprobe}
+    
+    @classmethod
+    def load(cls, path: Path, info: Dict, segments: List[str], mmap_mode: Optional[str] = 'r') -> 'IVFIndex':
+        index = cls(n_lists=info['n_lists'], nprobe=info['nprobe'])
+        index.centroids = np.load(path / "ivf_centroids.npy", mmap_mode=mmap_mode)
+        index._lists = [[] for _ in range(index.n_lists)]
+        for prefix in segments:
+            ids = np.load(path / f"{prefix}ivf_ids.npy", mmap_mode=mmap_mode)
+            offsets = np.load(path / f"{prefix}ivf_offsets.npy")
+            for n in range(index.n_lists):
+                if offsets[n + 1] > offsets[n]:
+                    index._lists[n].append(ids[offsets[n]:offsets[n + 1]])
+        return index
+
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class _Quantizer(ABC):
+    """
+    Compressed copy of the store's normalized embeddings used for a cheap
+    candidate pass; the store re-ranks the survivors exactly against the
+    float32 rows. Codes are kept as named row-aligned arrays.
+    """
+    
+    MODE = None
+    
+    def __init__(self, dim: int, arrays: Optional[Dict[str, np.ndarray]] = None, size: Optional[int] = None):
+        self.dim = dim
+        self._arrays = None
+        if arrays:
+            # Saved arrays may carry spare rows past `size`
+            capacity = min(len(a) for a in arrays.values())
+            self._arrays = {name: a[:capacity] for name, a in arrays.items()}
+        self._size = (capacity if size is None else size) if arrays else 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @abstractmethod
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        """Named code arrays for a batch of normalized vectors."""
+    
+    @abstractmethod
+    def _score(self, query: np.ndarray, arrays: Dict[str, np.ndarray]) -> np.ndarray:
+        """Approximate similarity of `query` to the rows in `arrays`."""
+    
+    def add(self, vectors: np.ndarray, start: int):
+        encoded = self._encode(vectors)
+        needed = start + len(vectors)
+        if self._arrays is None:
+            self._arrays = {name: np.empty((0,) + a.shape[1:], dtype=a.dtype) for name, a in encoded.items()}
+        capacity = len(next(iter(self._arrays.values())))
+        if needed > capacity:
+            capacity = max(needed, 2 * capacity)
+            for name, array in self._arrays.items():
+                grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[name] = grown
+        for name, codes in encoded.items():
+            self._arrays[name][start:needed] = codes
+        self._size = needed
+    
+    def take(self, rows: np.ndarray):
+        self._arrays = {name: np.ascontiguousarray(a[rows]) for name, a in self._arrays.items()}
+        self._size = len(rows)
+    
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: a[:self._size] for name, a in (self._arrays or {}).items()}
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values())
+    
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None,
+               block_size: int = 8192) -> np.ndarray:
+        """Approximate similarity of `query` to `rows` (default: every row)."""
+        arrays = self.arrays
+        if rows is not None:
+            return self._score(query, {name: a[rows] for name, a in arrays.items()})
+        out = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, block_size):
+            stop = min(start + block_size, self._size)
+            out[start:stop] = self._score(query, {name: a[start:stop] for name, a in arrays.items()})
+        return out
+
+
+class ScalarQuantizer(_Quantizer):
+    """int8 codes with one float32 absmax scale per row: dim + 4 bytes per vector."""
+    
+    MODE = 'int8'
+    
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return {'codes': codes, 'scales': scales.astype(np.float32)}
+    
+    def _score(self, query: np.ndarray, arrays: Dict[str, np.ndarray]) -> np.ndarray:
+        return (arrays['codes'].astype(np.float32) @ query) * arrays['scales']
+
+
+class BinaryQuantizer(_Quantizer):
+    """
+    One sign bit per dimension packed into uint64 words: dim / 8 bytes per
+    vector. Similarity is 1 - 2 * hamming / dim, counted with popcount.
+    """
+    
+    MODE = 'binary'
+    
+    def _pack(self, vectors: np.ndarray) -> np.ndarray:
+        bits = np.packbits(vectors > 0, axis=1)
+        padded = np.zeros((len(bits), -(-bits.shape[1] // 8) * 8), dtype=np.uint8)
+        padded[:, :bits.shape[1]] = bits
+        return padded.view(np.uint64)
+    
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        return {'bits': self._pack(vectors)}
+    
+    def _score(self, query: np.ndarray, arrays: Dict[str, np.ndarray]) -> np.ndarray:
+        xor = arrays['bits'] ^ self._pack(query[None, :])
+        if hasattr(np, 'bitwise_count'):
+            hamming = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+        else:
+            hamming = _POPCOUNT[xor.view(np.uint8)].sum(axis=1, dtype=np.int32)
+        return 1.0 - 2.0 * hamming.astype(np.float32) / self.dim
+
+
+QUANTIZERS = {q.MODE: q for q in (ScalarQuantizer, BinaryQuantizer)}
+
+
+class _FieldColumn:
+    """
+    Interned values of one filterable metadata field. Posting lists
+    (rows per value) are derived from the code array on first filter.
+    """
+    
+    def __init__(self, values: Optional[List[str]] = None, codes: Optional[np.ndarray] = None):
+        self.values = list(values or [])
+        self._lookup = {v: i for i, v in enumerate(self.values)}
+        self._codes = codes if codes is not None else np.empty(0, dtype=np.int32)
+        self._tail = []
+        self._postings = None
+    
+    @property
+    def codes(self) -> np.ndarray:
+        """Value code per row; -1 where the field is missing."""
+        if self._tail:
+            self._codes = np.concatenate((self._codes, np.array(self._tail, dtype=np.int32)))
+            self._tail = []
+        return self._codes
+    
+    def _intern(self, value: str) -> int:
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+    
+    def extend(self, values: Iterable[Optional[str]]):
+        for value in values:
+            self._tail.append(-1 if value is None else self._intern(str(value)))
+        self._postings = None
+    
+    def extend_from(self, other: '_FieldColumn'):
+        """Append another column's rows, re-coding its values into this column's."""
+        remap = np.array([self._intern(v) for v in other.values] + [-1], dtype=np.int32)
+        self._codes = np.concatenate((self.codes, remap[other.codes]))
+        self._postings = None
+    
+    def take(self, rows: np.ndarray):
+        self._codes = self.codes[rows]
+        self._postings = None
+    
+    def rows(self, wanted) -> np.ndarray:
+        """Sorted rows matching `wanted`: a value, a collection of values, or a predicate on values."""
+        if callable(wanted):
+            codes = [i for i, v in enumerate(self.values) if wanted(v)]
+        elif isinstance(wanted, (list, tuple, set, frozenset)):
+            codes = [self._lookup[str(v)] for v in wanted if str(v) in self._lookup]
+        else:
+            codes = [self._lookup[str(wanted)]] if str(wanted) in self._lookup else []
+        
+        if self._postings is None:
+            order = np.argsort(self.codes, kind='stable')
+            bounds = np.searchsorted(self.codes[order], np.arange(len(self.values) + 1))
+            self._postings = (order, bounds)
+        order, bounds = self._postings
+        if not codes:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([order[bounds[c]:bounds[c + 1]] for c in codes]))
+
+
+class ChunkRow(Mapping):
+    """Read-only dict-like view of one ChunkTable row; values are decoded on access."""
+    
+    __slots__ = ('_table', '_row')
+    
+    def __init__(self, table: 'ChunkTable', row: int):
+        self._table = table
+        self._row = row
+    
+    def __getitem__(self, key: str):
+        return self._table._value(self._row, key)
+    
+    def __iter__(self):
+        return iter(self._table._row_keys(self._row))
+    
+    def __len__(self) -> int:
+        return len(self._table._row_keys(self._row))
+    
+    def __repr__(self) -> str:
+        return f"ChunkRow({dict(self)!r})"
+
+
+class _TextView:
+    """Sequence view over a ChunkTable's text column."""
+    
+    __slots__ = ('_table',)
+    
+    def __init__(self, table: 'ChunkTable'):
+        self._table = table
+    
+    def __len__(self) -> int:
+        return len(self._table)
+    
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self._table)
+        return self._table.text(i)
+    
+    def __iter__(self):
+        for i in range(len(self._table)):
+            yield self._table.text(i)
+
+
+class ChunkTable:
+    """
+    Columnar chunk storage: all text in one UTF-8 buffer addressed by an
+    offsets array, interned string fields, chunk ids as raw digest bytes
+    (CHUNK_ID_BYTES each; the hex id is rebuilt on access) and int32
+    positions (-1 where missing). Indexing yields `ChunkRow` views
+    that read like the chunk dicts they replace, so the chunker, vector
+    store and generator can share one table instead of per-chunk objects.
+    Arrays grow geometrically; tables wrapping existing arrays (see
+    `from_arrays`) append into their spare rows, if any, and copy them
+    once those run out.
+    """
+    
+    FIELDS = ('source', 'section', 'ticker', 'period')
+    POSITIONS = ('start_pos', 'word_count', 'char_start', 'char_end')
+    ID_DTYPE = np.dtype(f'V{CHUNK_ID_BYTES}')
+    
+    def __init__(self, initial_capacity: int = 0):
+        self._size = 0
+        self._blob = np.empty(initial_capacity * 256, dtype=np.uint8)
+        self._offsets = np.zeros(initial_capacity + 1, dtype=np.int64)
+        self._ids = np.empty(initial_capacity, dtype=self.ID_DTYPE)
+        self._positions = np.full((initial_capacity, len(self.POSITIONS)), -1, dtype=np.int32)
+        self.fields = {name: _FieldColumn() for name in self.FIELDS}
+    
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Dict]) -> 'ChunkTable':
+        table = cls()
+        table.extend(chunks)
+        return table
+    
+    @classmethod
+    def from_arrays(cls, blob: np.ndarray, offsets: np.ndarray, ids: np.ndarray,
+                    fields: Dict[str, _FieldColumn], positions: Optional[np.ndarray] = None,
+                    size: Optional[int] = None) -> 'ChunkTable':
+        """
+        Wrap existing (possibly memory-mapped) columns without copying them.
+        Row columns may be longer than `size` (default: all of `ids`); the
+        spare rows take appends. Field codes must cover exactly `size` rows.
+        """
+        table = cls(initial_capacity=0)
+        table._size = len(ids) if size is None else size
+        capacity = min(len(ids), len(offsets) - 1, len(ids) if positions is None else len(positions))
+        table._blob, table._offsets, table._ids = blob, offsets[:capacity + 1], ids[:capacity]
+        if positions is not None:
+            table._positions = positions[:capacity]
+        else:
+            table._positions = np.full((capacity, len(cls.POSITIONS)), -1, dtype=np.int32)
+        for name in cls.FIELDS:
+            column = fields.get(name)
+            if column is None or len(column.codes) < table._size:
+                column = _FieldColumn(codes=np.full(table._size, -1, dtype=np.int32))
+            table.fields[name] = column
+        return table
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ChunkRow(self, row) for row in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("chunk row out of range")
+        return ChunkRow(self, i)
+    
+    def __iter__(self):
+        for row in range(self._size):
+            yield ChunkRow(self, row)
+    
+    @staticmethod
+    def _grow(array: np.ndarray, capacity: int, dtype=None, fill=None) -> np.ndarray:
+        grown = np.empty((capacity,) + array.shape[1:], dtype=dtype or array.dtype)
+        if fill is not None:
+            grown[len(array):] = fill
+        grown[:len(array)] = array
+        return grown
+    
+    def _reserve(self, rows: int, nbytes: int):
+        needed = self._size + rows
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 1)
+            self._ids = self._grow(self._ids, capacity)
+            self._positions = self._grow(self._positions, capacity, fill=-1)
+            self._offsets = self._grow(self._offsets, capacity + 1)
+        end = int(self._offsets[self._size]) + nbytes
+        if end > len(self._blob):
+            self._blob = self._grow(self._blob, max(end, 2 * len(self._blob)))
+    
+    @classmethod
+    def encode_id(cls, chunk_id: str) -> bytes:
+        """
+        Raw bytes of a chunk id. Lowercase hex digests of CHUNK_ID_BYTES
+        bytes (the chunker's ids) round-trip exactly; any other id is stored
+        as the leading bytes of its md5, and reads back as that digest.
+        """
+        try:
+            raw = bytes.fromhex(chunk_id)
+        except (TypeError, ValueError):
+            raw = b''
+        if len(raw) != CHUNK_ID_BYTES or raw.hex() != chunk_id:
+            raw = hashlib.md5(str(chunk_id).encode('utf-8')).digest()[:CHUNK_ID_BYTES]
+        return raw
+    
+    @classmethod
+    def stored_id(cls, chunk_id: str) -> str:
+        """The id `chunk_id` reads back as once stored (see `encode_id`)."""
+        return cls.encode_id(chunk_id).hex()
+    
+    @classmethod
+    def encode_ids(cls, chunk_ids: Iterable[str]) -> np.ndarray:
+        return np.array([cls.encode_id(cid) for cid in chunk_ids], dtype=cls.ID_DTYPE)
+    
+    def append(self, chunk: Dict):
+        chunk_id = self.encode_id(chunk['id'])
+        encoded = chunk['text'].encode('utf-8')
+        self._reserve(1, len(encoded))
+        
+        row = self._size
+        start = int(self._offsets[row])
+        self._blob[start:start + len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        self._offsets[row + 1] = start + len(encoded)
+        self._ids[row] = chunk_id
+        for i, name in enumerate(self.POSITIONS):
+            value = chunk.get(name)
+            self._positions[row, i] = -1 if value is None else value
+        for name, column in self.fields.items():
+            column.extend([chunk.get(name)])
+        self._size += 1
+    
+    def extend(self, chunks: Iterable[Dict]):
+        if isinstance(chunks, ChunkTable):
+            self._extend_table(chunks)
+            return
+        for chunk in chunks:
+            self.append(chunk)
+    
+    def _extend_table(self, other: 'ChunkTable'):
+        """Append another table's rows column by column."""
+        n = len(other)
+        nbytes = int(other._offsets[n])
+        self._reserve(n, nbytes)
+        
+        row = self._size
+        base = int(self._offsets[row])
+        self._blob[base:base + nbytes] = other._blob[:nbytes]
+        self._offsets[row + 1:row + n + 1] = other._offsets[1:n + 1] + base
+        self._ids[row:row + n] = other._ids[:n]
+        self._positions[row:row + n] = other._positions[:n]
+        for name, column in self.fields.items():
+            column.extend_from(other.fields[name])
+        self._size += n
+    
+    def take(self, rows: np.ndarray) -> 'ChunkTable':
+        """New table holding only `rows`, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self._offsets[rows], self._offsets[rows + 1]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=offsets[1:])
+        blob = np.empty(offsets[-1], dtype=np.uint8)
+        if len(rows):
+            # One slice copy per run of consecutive rows (compaction keeps long runs)
+            breaks = (np.flatnonzero(rows[1:] != rows[:-1] + 1) + 1).tolist()
+            for first, last in zip([0] + breaks, breaks + [len(rows)]):
+                blob[offsets[first]:offsets[last]] = self._blob[starts[first]:ends[last - 1]]
+        fields = {name: _FieldColumn(column.values, column.codes[rows]) for name, column in self.fields.items()}
+        return ChunkTable.from_arrays(blob, offsets, self._ids[rows], fields, self._positions[rows])
+    
+    def text(self, row: int) -> str:
+        return bytes(self._blob[self._offsets[row]:self._offsets[row + 1]]).decode('utf-8')
+    
+    def chunk_id(self, row: int) -> str:
+        return self._ids[row].tobytes().hex()
+    
+    @property
+    def texts(self) -> _TextView:
+        return _TextView(self)
+    
+    @property
+    def text_buffer(self) -> np.ndarray:
+        """UTF-8 bytes of every row's text, back to back."""
+        return self._blob[:self._offsets[self._size]]
+    
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offsets[:self._size + 1]
+    
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+    
+    @property
+    def positions(self) -> np.ndarray:
+        """(rows, len(POSITIONS)) int32 array."""
+        return self._positions[:self._size]
+    
+    def source_ids(self, start: int = 0) -> Iterator[Tuple[str, str]]:
+        """(source, chunk id) for each row from `start`."""
+        column = self.fields['source']
+        sources = [column.values[c] if c >= 0 else None for c in column.codes[start:self._size].tolist()]
+        return zip(sources, [raw.hex() for raw in self._ids[start:self._size].tolist()])
+    
+    def _value(self, row: int, key: str):
+        if key == 'id':
+            return self.chunk_id(row)
+        if key == 'text':
+            return self.text(row)
+        if key in self.fields:
+            column = self.fields[key]
+            code = column.codes[row]
+            if code >= 0:
+                return column.values[code]
+        elif key in self.POSITIONS:
+            value = int(self._positions[row, self.POSITIONS.index(key)])
+            if value >= 0:
+                return value
+        raise KeyError(key)
+    
+    def _row_keys(self, row: int) -> List[str]:
+        # Same key order as FilingChunker._make_chunk, then the optional fields
+        keys = ['id', 'text']
+        if self.fields['source'].codes[row] >= 0:
+            keys.append('source')
+        keys.extend(name for i, name in enumerate(self.POSITIONS) if self._positions[row, i] >= 0)
+        keys.extend(name for name in self.FIELDS[1:] if self.fields[name].codes[row] >= 0)
+        return keys
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the rows, excluding spare capacity and interned value lists."""
+        n = self._size
+        return (int(self._offsets[n]) + self._offsets.itemsize * (n + 1) + self._ids.itemsize * n
+                + self._positions.itemsize * self._positions.shape[1] * n + 4 * n * len(self.fields))
+    
+    @classmethod
+    def memory_report(cls, chunks: Iterable[Dict]) -> Dict:
+        """Approximate bytes per chunk held as a list of dicts versus as a ChunkTable."""
+        dicts = [dict(c) for c in chunks]
+        table = cls.from_chunks(dicts)
+        dict_bytes = sys.getsizeof(dicts) + sum(
+            sys.getsizeof(c) + sum(sys.getsizeof(v) for v in c.values()) for c in dicts
+        )
+        n = max(len(dicts), 1)
+        return {
+            'chunks': len(dicts),
+            'dict_bytes_per_chunk': dict_bytes / n,
+            'table_bytes_per_chunk': table.nbytes / n,
+            'reduction': dict_bytes / table.nbytes if table.nbytes else 0.0,
+        }
 
 
 class ChromaDBVectorStore:
-    """Simple in-memory vector store (mock ChromaDB)."""
+    """
+    Simple in-memory vector store (mock ChromaDB).
+
+    Embeddings live in one contiguous float32 matrix whose rows are
+    L2-normalized on insert, so cosine similarity is a single matmul.
+    Pass an `IVFIndex` to search approximately instead of brute force;
+    it is trained automatically once enough documents have been added.
+    `save` writes a directory of flat arrays that `open` can memory-map,
+    so processes opening the same index share it through the page cache;
+    saving again to the same directory appends only what changed.
+    `delete` tombstones rows so searches skip them until `compact` runs.
+    Searches can be pre-filtered on FILTER_FIELDS; only matching rows are
+    scored. Text and metadata live in a `ChunkTable`, which the store owns:
+    added chunks are always copied into it. A `BM25Index` in `lexical`
+    (attached by HybridRetriever) is fed, compacted and saved with the rows.
+    With `quantization` ('int8' or 'binary') the candidate pass scores
+    compact codes held in memory and only the best `rerank_factor * top_k`
+    candidates are re-ranked exactly against the float32 rows, which an
+    opened store leaves memory-mapped.
+    """
+    
+    FORMAT_VERSION = 3  # 1 stored chunk ids as ascii hex; 2 had no segments or spare rows
+    FILTER_FIELDS = ChunkTable.FIELDS
+    COMPACT_RATIO = 0.25  # tombstoned share of rows above which save() compacts
+    MAX_SEGMENTS = 8      # appended segments before save() rewrites the directory
+    
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 0,
+                 index: Optional[IVFIndex] = None, quantization: Optional[str] = None,
+                 rerank_factor: int = 8):
+        if quantization is not None and quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization {quantization!r}; choose from {sorted(QUANTIZERS)}")
+        self.chunks = ChunkTable(initial_capacity)
+        self.dim = dim
+        self.index = index
+        self.quantization = quantization
+        self.quantizer = None
+        self.rerank_factor = rerank_factor
+        self._matrix = np.empty((initial_capacity, dim or 0), dtype=np.float32)
+        self._size = 0
+        self._deleted = set()
+        self._deleted_rows = np.empty(0, dtype=np.int64)
+        self._key_rows = None
+        self.lexical = None
+        self._saved = None  # what the directory last saved to / opened from holds
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @property
+    def documents(self) -> _TextView:
+        return self.chunks.texts
+    
+    @property
+    def metadata(self) -> ChunkTable:
+        """Row views with at least 'source' and 'id'."""
+        return self.chunks
+    
+    @property
+    def _fields(self) -> Dict[str, _FieldColumn]:
+        return self.chunks.fields
+    
+    @property
+    def live_count(self) -> int:
+        """Number of rows not tombstoned."""
+        return self._size - len(self._deleted)
     
-    def __init__(self):
-        self.documents = []
-        self.embeddings = []
-        self.metadata = []
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Normalized embedding matrix, one row per document."""
+        return self._matrix[:self._size]
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize rows in place; all-zero rows are left as zeros."""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        return vectors
+    
+    def _as_matrix(self, vectors) -> np.ndarray:
+        """Coerce a vector or list of vectors to a normalized float32 matrix."""
+        matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+        if self.dim is not None and matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {matrix.shape[1]}")
+        return self._normalize(matrix)
+    
+    def _reserve(self, extra: int):
+        """Grow the backing matrix geometrically so appends stay amortized O(1)."""
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0] and self._matrix.shape[1] == self.dim:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 1)
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        if self._size:
+            grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
     
     def add_documents(self, chunks: List[Dict], embeddings: List[List[float]]):
         """Add chunks and their embeddings."""
-        self.documents.extend([c['text'] for c in chunks])
-        self.embeddings.extend(embeddings)
-        self.metadata.extend([{'source': c['source'], 'id': c['id']} for c in chunks])
+        if len(chunks) != len(embeddings):
+            raise ValueError(f"Got {len(chunks)} chunks but {len(embeddings)} embeddings")
+        if not chunks:
+            return
+        with tracer.span('add_documents', stage='index', chunks=len(chunks)):
+            self._add_documents(chunks, embeddings)
+    
+    def _add_documents(self, chunks: List[Dict], embeddings: List[List[float]]):
+        matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        matrix = self._as_matrix(matrix)
+        
+        self._reserve(len(matrix))
+        start = self._size
+        self._matrix[start:start + len(matrix)] = matrix
+        self._size += len(matrix)
+        
+        self.chunks.extend(chunks)
+        if self.lexical is not None:
+            self.lexical.add(self.chunks.text(row) for row in range(start, self._size))
+        if self._key_rows is not None:
+            for row, key in enumerate(self.chunks.source_ids(start), start):
+                self._key_rows.setdefault(key, []).append(row)
+        
+        if self.quantization is not None:
+            if self.quantizer is None:
+                self.quantizer = QUANTIZERS[self.quantization](self.dim)
+            self.quantizer.add(matrix, start)
+        
+        if self.index is not None:
+            if self.index.is_trained:
+                self.index.add(matrix, start)
+            elif self._size >= self.index.min_train_size:
+                self.build_index()
+    
+    def attach_lexical(self, lexical: Optional['BM25Index'] = None) -> 'BM25Index':
+        """Use `lexical` as the store's BM25 index, or build one from the rows if it has none yet."""
+        if lexical is not None:
+            self.lexical = lexical
+        elif self.lexical is None:
+            # A store saved without a lexical index: build it once; the store keeps it from here on
+            self.lexical = BM25Index()
+            self.lexical.add(self.documents)
+        return self.lexical
+    
+    def quantize(self, mode: Optional[str]):
+        """Encode every stored embedding for `mode` ('int8', 'binary'), or drop the codes with None."""
+        if mode is not None and mode not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization {mode!r}; choose from {sorted(QUANTIZERS)}")
+        self.quantization = mode
+        self.quantizer = None
+        if mode is not None and self._size:
+            self.quantizer = QUANTIZERS[mode](self.dim)
+            self.quantizer.add(self.embeddings, 0)
+    
+    def memory_footprint(self) -> Dict:
+        """Bytes held by the float32 embeddings and the candidate-pass codes."""
+        float_bytes = self._size * (self.dim or 0) * 4
+        code_bytes = self.quantizer.nbytes if self.quantizer is not None else 0
+        return {
+            'mode': self.quantization or 'float32',
+            'vectors': self._size,
+            'float32_bytes': float_bytes,
+            'float32_mmapped': isinstance(self._matrix, np.memmap),
+            'code_bytes': code_bytes,
+            'candidate_bytes_per_vector': (code_bytes or float_bytes) / max(self._size, 1),
+        }
+    
+    def build_index(self, index: Optional[IVFIndex] = None):
+        """(Re)train the ANN index on every stored embedding."""
+        if index is not None:
+            self.index = index
+        if self.index is None:
+            self.index = IVFIndex()
+        if not self._size:
+            return
+        with tracer.span('build_index', stage='index', vectors=self._size):
+            self.index.train(self.embeddings)
+            self.index.add(self.embeddings, 0)
+    
+    def _key_index(self) -> Dict[Tuple[str, str], List[int]]:
+        """(source, chunk id) -> rows, built on first use and kept current by add_documents."""
+        if self._key_rows is None:
+            self._key_rows = {}
+            for row, key in enumerate(self.chunks.source_ids()):
+                if row not in self._deleted:
+                    self._key_rows.setdefault(key, []).append(row)
+        return self._key_rows
+    
+    def delete(self, keys: Iterable[Tuple[str, str]]) -> int:
+        """Tombstone every row matching the given (source, chunk id) keys; returns rows removed."""
+        key_rows = self._key_index()
+        removed = 0
+        for source, chunk_id in keys:
+            for row in key_rows.pop((source, ChunkTable.stored_id(chunk_id)), ()):
+                self._deleted.add(row)
+                removed += 1
+        if removed:
+            self._deleted_rows = np.fromiter(sorted(self._deleted), dtype=np.int64, count=len(self._deleted))
+        return removed
+    
+    def compact(self):
+        """Physically drop tombstoned rows, re-bucketing the ANN index without retraining."""
+        if not self._deleted:
+            return
+        keep = np.setdiff1d(np.arange(self._size), self._deleted_rows)
+        self._matrix = np.ascontiguousarray(self.embeddings[keep])
+        self.chunks = self.chunks.take(keep)
+        self._size = len(keep)
+        self._deleted = set()
+        self._deleted_rows = np.empty(0, dtype=np.int64)
+        self._key_rows = None
+        if self.quantizer is not None:
+            self.quantizer.take(keep)
+        if self.lexical is not None:
+            self.lexical.take(keep)
+        if self.index is not None and self.index.is_trained:
+            self.index._lists = [[] for _ in range(self.index.n_lists)]
+            self.index.add(self.embeddings, 0)
+    
+    def filter_rows(self, filters: Dict) -> np.ndarray:
+        """
+        Live rows matching every field in `filters`. Each value may be a
+        single value, a collection of values, or a predicate on values.
+        """
+        rows = None
+        for name, wanted in filters.items():
+            if name not in self._fields:
+                raise ValueError(f"Cannot filter on {name!r}; filterable fields are {self.FILTER_FIELDS}")
+            matched = self._fields[name].rows(wanted)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        if rows is None:
+            rows = np.arange(self._size)
+        if self._deleted:
+            rows = rows[~np.isin(rows, self._deleted_rows)]
+        return rows
+    
+    def _exact_scores(self, queries: np.ndarray) -> np.ndarray:
+        """Brute-force scores against every row; tombstoned rows score -inf."""
+        scores = queries @ self.embeddings.T
+        if self._deleted:
+            scores[..., self._deleted_rows] = -np.inf
+        return scores
+    
+    def _search(self, query: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+                rows: Optional[np.ndarray] = None):
+        """
+        Top-k (ids, scores) for one normalized query: over `rows` only when
+        given, else via the ANN index if trained, else brute force.
+        """
+        if self.quantizer is not None:
+            return self._quantized_search(query, top_k, nprobe, rows)
+        if rows is not None:
+            scores = self.embeddings[rows] @ query
+            top = _top_k(scores, top_k)
+            return rows[top], scores[top]
+        
+        if self.index is None or not self.index.is_trained:
+            scores = self._exact_scores(query)
+            top = _top_k(scores, top_k)
+            top = top[scores[top] > -np.inf]
+            return top, scores[top]
+        
+        candidates = self.index.candidates(query, nprobe)
+        if self._deleted:
+            candidates = candidates[~np.isin(candidates, self._deleted_rows)]
+        scores = self.embeddings[candidates] @ query
+        top = _top_k(scores, top_k)
+        return candidates[top], scores[top]
+    
+    def _quantized_search(self, query: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+                          rows: Optional[np.ndarray] = None):
+        """Score codes for the candidate rows, then re-rank the best few exactly."""
+        depth = top_k * self.rerank_factor
+        if rows is None and self.index is not None and self.index.is_trained:
+            rows = self.index.candidates(query, nprobe)
+            if self._deleted:
+                rows = rows[~np.isin(rows, self._deleted_rows)]
+        if rows is None:
+            coarse = self.quantizer.scores(query)
+            if self._deleted:
+                coarse[self._deleted_rows] = -np.inf
+            candidates = _top_k(coarse, depth)
+            candidates = candidates[coarse[candidates] > -np.inf]
+        else:
+            candidates = rows[_top_k(self.quantizer.scores(query, rows), depth)]
+        
+        # Sorted rows keep reads of a memory-mapped matrix sequential
+        candidates = np.sort(candidates)
+        scores = self.embeddings[candidates] @ query
+        top = _top_k(scores, top_k)
+        return candidates[top], scores[top]
     
-    def retrieve_similar(self, query_embedding: List[float], top_k: int = 3) -> List[Dict]:
-        """Retrieve top-k similar documents (mock cosine similarity)."""
-        if not self.embeddings:
+    def _result(self, row: int, **scores) -> Dict:
+        """One result: text, source, the given scores, chunk id and the word position ContextPacker merges on."""
+        result = {'text': self.chunks.text(row), 'source': self.chunks[row]['source'], **scores,
+                  'chunk_id': self.chunks.chunk_id(row)}
+        for i, name in enumerate(('start_pos', 'word_count')):
+            value = int(self.chunks.positions[row, i])
+            if value >= 0:
+                result[name] = value
+        return result
+    
+    def _format_results(self, indices: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        return [self._result(idx, similarity=float(score)) for idx, score in zip(indices, scores)]
+    
+    @tracer.timed('retrieve_similar')
+    def retrieve_similar(self, query_embedding: List[float], top_k: int = 3,
+                         nprobe: Optional[int] = None, filters: Optional[Dict] = None) -> List[Dict]:
+        """Retrieve top-k documents by cosine similarity, optionally pre-filtered on metadata."""
+        if not self._size or top_k <= 0:
             return []
         
-        similarities = []
-        for i, emb in enumerate(self.embeddings):
-            # Simple dot product as mock similarity
-            sim = sum(a * b for a, b in zip(query_embedding, emb)) / (len(query_embedding) + 1e-10)
-            similarities.append((i, sim))
-        
-        # Sort by similarity and return top_k
-        top_indices = sorted(similarities, key=lambda x: x[1], reverse=True)[:top_k]
-        results = [
-            {
-                'text': self.documents[idx],
-                'source': self.metadata[idx]['source'],
-                'similarity': sim,
-                'chunk_id': self.metadata[idx]['id']
-            }
-            for idx, sim in top_indices
-        ]
+        query = self._as_matrix(query_embedding)[0]
+        rows = self.filter_rows(filters) if filters else None
+        return self._format_results(*self._search(query, top_k, nprobe, rows))
+    
+    def retrieve_similar_many(self, queries: List[List[float]], top_k: int = 3,
+                              nprobe: Optional[int] = None, filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Retrieve top-k documents for a batch of queries."""
+        if not self._size or top_k <= 0:
+            return [[] for _ in queries]
+        
+        query_matrix = self._as_matrix(queries)
+        if filters:
+            rows = self.filter_rows(filters)
+            return [self._format_results(*self._search(q, top_k, nprobe, rows)) for q in query_matrix]
+        if self.quantizer is not None or (self.index is not None and self.index.is_trained):
+            return [self._format_results(*self._search(q, top_k, nprobe)) for q in query_matrix]
+        
+        # Brute force: score the whole batch with one matmul
+        scores = self._exact_scores(query_matrix)
+        top = _top_k(scores, top_k)
+        results = []
+        for row in range(len(top)):
+            ids = top[row][scores[row, top[row]] > -np.inf]
+            results.append(self._format_results(ids, scores[row, ids]))
         return results
+    
+    def recall_report(self, queries: List[List[float]], top_k: int = 10,
+                      nprobe_values: Tuple[int, ...] = (1, 2, 4, 8, 16, 32)) -> List[Dict]:
+        """Recall@k and mean latency of the ANN index against brute force per nprobe."""
+        if self.index is None or not self.index.is_trained:
+            raise RuntimeError("ANN index is not trained; call build_index() first")
+        
+        query_matrix = self._as_matrix(queries)
+        t0 = time.perf_counter()
+        exact = []
+        for q in query_matrix:
+            scores = self._exact_scores(q)
+            top = _top_k(scores, top_k)
+            exact.append(set(top[scores[top] > -np.inf].tolist()))
+        brute_ms = (time.perf_counter() - t0) * 1000 / len(query_matrix)
+        
+        report = []
+        for nprobe in nprobe_values:
+            hits = 0
+            t0 = time.perf_counter()
+            for q, truth in zip(query_matrix, exact):
+                ids, _ = self._search(q, top_k, nprobe)
+                hits += len(truth.intersection(ids.tolist()))
+            ann_ms = (time.perf_counter() - t0) * 1000 / len(query_matrix)
+            report.append({
+                'nprobe': nprobe,
+                f'recall@{top_k}': hits / sum(len(t) for t in exact),
+                'ann_ms': ann_ms,
+                'brute_force_ms': brute_ms,
+            })
+        return report
+    
+    def quantization_report(self, queries: List[List[float]], top_k: int = 10,
+                            modes: Tuple[Optional[str], ...] = (None, 'int8', 'binary')) -> List[Dict]:
+        """
+        Recall@k against exact float32 search, mean latency and candidate
+        bytes per vector for each quantization mode (None is float32).
+        The store's own mode is restored afterwards.
+        """
+        query_matrix = self._as_matrix(queries)
+        exact = []
+        for q in query_matrix:
+            scores = self._exact_scores(q)
+            top = _top_k(scores, top_k)
+            exact.append(set(top[scores[top] > -np.inf].tolist()))
+        
+        saved = (self.quantization, self.quantizer)
+        report = []
+        try:
+            for mode in modes:
+                self.quantize(mode)
+                hits = 0
+                t0 = time.perf_counter()
+                for q, truth in zip(query_matrix, exact):
+                    ids, _ = self._search(q, top_k)
+                    hits += len(truth.intersection(ids.tolist()))
+                ms = (time.perf_counter() - t0) * 1000 / len(query_matrix)
+                footprint = self.memory_footprint()
+                report.append({
+                    'mode': footprint['mode'],
+                    f'recall@{top_k}': hits / max(sum(len(t) for t in exact), 1),
+                    'ms': ms,
+                    'bytes_per_vector': footprint['candidate_bytes_per_vector'],
+                    'code_bytes': footprint['code_bytes'],
+                })
+        finally:
+            self.quantization, self.quantizer = saved
+        return report
+    
+    def _layout(self) -> Tuple:
+        """Objects whose replacement (compaction, re-quantizing, retraining) invalidates saved files."""
+        centroids = self.index.centroids if self.index is not None else None
+        return (self.chunks, self.quantizer, centroids, self.lexical)
+    
+    def _can_append(self, path: Path) -> bool:
+        saved = self._saved
+        if saved is None or saved['path'] != path.resolve() or self._size < saved['count']:
+            return False
+        if len(saved['segments']) >= self.MAX_SEGMENTS or len(self._deleted) > self.COMPACT_RATIO * self._size:
+            return False
+        if any(a is not b for a, b in zip(saved['layout'], self._layout())):
+            return False
+        try:
+            with open(path / "store.json") as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            return False
+        # Another writer may have replaced the directory since
+        return info['count'] == saved['count'] and info.get('segments', [""]) == saved['segments']
+    
+    def _remember_saved(self, path: Path, segments: List[str]):
+        self._saved = {'path': path.resolve(), 'count': self._size, 'segments': segments,
+                       'deleted': len(self._deleted), 'layout': self._layout()}
+    
+    def _store_info(self, fields: Dict, index_info: Optional[Dict], lexical_info: Optional[Dict],
+                    segments: List[str]) -> Dict:
+        return {
+            'format_version': self.FORMAT_VERSION,
+            'count': self._size,
+            'dim': self.dim,
+            'sources': self._fields['source'].values,
+            'fields': fields,
+            'index': index_info,
+            'quantization': self.quantization,
+            'rerank_factor': self.rerank_factor,
+            'lexical': lexical_info,
+            'segments': segments,
+        }
+    
+    @tracer.timed('save_store', stage='index')
+    def save(self, path: str) -> Path:
+        """
+        Write the store to a directory:
+        embeddings.npy (float32), documents.bin + document_offsets.npy,
+        source_codes.npy + store.json (interned sources), chunk_ids.npy,
+        chunk_positions.npy, field_<name>.npy codes for the other filter
+        fields in use, quant_<name>.npy codes when quantized, ivf_*.npy when
+        indexed, bm25_*.npy when the store has a lexical index and
+        deleted_rows.npy for tombstones.
+
+        Saving back to the directory the store was opened from or last saved
+        to only appends: rows added since are written into the row files'
+        spare rows (files grow geometrically), new IVF list entries and BM25
+        postings go into a segment of their own (seg<k>_*.npy), and
+        store.json, replaced last, commits them. Until then readers, and a
+        crashed writer's next `open`, see the previous version.
+
+        Otherwise (a new directory, compaction, re-quantizing, retraining,
+        tombstones above COMPACT_RATIO or MAX_SEGMENTS segments) the store is
+        compacted and written whole to a scratch directory whose files are
+        renamed into place, so readers that have the previous version
+        memory-mapped (including this store) keep working.
+        """
+        path = Path(path)
+        if self._can_append(path):
+            self._append(path)
+        else:
+            self._rewrite(path)
+        return path
+    
+    def _rewrite(self, final_path: Path):
+        self.compact()
+        path = final_path / ".tmp-save"
+        if path.exists():
+            # Left by an interrupted save: never promote its files
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+        
+        np.save(path / "embeddings.npy", np.ascontiguousarray(self.embeddings))
+        
+        with open(path / "documents.bin", 'wb') as f:
+            f.write(self.chunks.text_buffer)
+        np.save(path / "document_offsets.npy", self.chunks.offsets)
+        
+        np.save(path / "source_codes.npy", self._fields['source'].codes)
+        np.save(path / "chunk_ids.npy", self.chunks.ids)
+        np.save(path / "chunk_positions.npy", self.chunks.positions)
+        fields = {}
+        for name, column in self._fields.items():
+            if name != 'source' and column.values:
+                np.save(path / f"field_{name}.npy", column.codes)
+                fields[name] = column.values
+        
+        index_info = None
+        if self.index is not None and self.index.is_trained:
+            index_info = self.index.save(path)
+        if self.quantizer is not None:
+            for name, array in self.quantizer.arrays.items():
+                np.save(path / f"quant_{name}.npy", array)
+        lexical_info = self.lexical.save(path) if self.lexical is not None else None
+        
+        with open(path / "store.json", 'w') as f:
+            json.dump(self._store_info(fields, index_info, lexical_info, [""]), f, indent=2)
+        
+        written = {p.name for p in path.iterdir()}
+        for stale in final_path.glob("*.npy"):
+            if stale.name not in written:
+                stale.unlink()
+        # store.json goes last so it never describes files not yet in place
+        for name in sorted(written, key=lambda n: n == "store.json"):
+            os.replace(path / name, final_path / name)
+        path.rmdir()
+        self._remember_saved(final_path, [""])
+    
+    def _append(self, path: Path):
+        """Write what changed since the last save into `path` in place (see `save`)."""
+        since, n = self._saved['count'], self._size
+        chunks = self.chunks
+        _write_rows(path / "embeddings.npy", self.embeddings, since)
+        _write_rows(path / "document_offsets.npy", chunks.offsets, since + 1)
+        _write_rows(path / "source_codes.npy", self._fields['source'].codes, since)
+        _write_rows(path / "chunk_ids.npy", chunks.ids, since)
+        _write_rows(path / "chunk_positions.npy", chunks.positions, since)
+        fields = {}
+        for name, column in self._fields.items():
+            if name != 'source' and column.values:
+                _write_rows(path / f"field_{name}.npy", column.codes, since)
+                fields[name] = column.values
+        if self.quantizer is not None:
+            for name, array in self.quantizer.arrays.items():
+                _write_rows(path / f"quant_{name}.npy", array, since)
+        
+        start, end = int(chunks.offsets[since]), int(chunks.offsets[n])
+        with open(path / "documents.bin", 'r+b') as f:
+            if os.fstat(f.fileno()).st_size < end:
+                f.truncate(2 * end)  # spare bytes for a writable open to append into
+            f.seek(start)
+            f.write(chunks.text_buffer[start:end])
+        
+        if len(self._deleted) != self._saved['deleted']:
+            tmp_path = path / ".deleted_rows.tmp.npy"
+            np.save(tmp_path, self._deleted_rows)
+            os.replace(tmp_path, path / "deleted_rows.npy")
+        
+        segments = list(self._saved['segments'])
+        index_info = lexical_info = None
+        prefix = f"seg{len(segments)}_"
+        if self.index is not None and self.index.is_trained:
+            index_info = self.index.save(path, prefix, since) if n > since else self.index.info()
+        if self.lexical is not None:
+            lexical_info = self.lexical.save(path, prefix, since) if n > since else self.lexical.info()
+        if n > since and (index_info or lexical_info):
+            segments.append(prefix)
+        
+        tmp_path = path / ".store.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._store_info(fields, index_info, lexical_info, segments), f, indent=2)
+        os.replace(tmp_path, path / "store.json")
+        self._remember_saved(path, segments)
+    
+    @classmethod
+    @tracer.timed('open_store')
+    def open(cls, path: str, mmap: bool = True, writable: bool = False) -> 'ChromaDBVectorStore':
+        """
+        Open a store written by `save`. With mmap=True nothing is read up
+        front: embeddings, text and ids are paged in on access. Adding
+        documents copies the embedding matrix into memory first, unless
+        the store is opened `writable`: then the row files are mapped
+        read-write and added rows go straight into their spare rows, which
+        only a `save` back to `path` makes visible to readers.
+        Quantization codes are always read into memory, since every
+        candidate pass touches them.
+        """
+        path = Path(path)
+        with open(path / "store.json") as f:
+            info = json.load(f)
+        if info['format_version'] not in (1, 2, cls.FORMAT_VERSION):
+            raise ValueError(f"Unsupported store format version {info['format_version']}")
+        
+        count = info['count']
+        segments = info.get('segments', [""])
+        mmap_mode = ('r+' if writable else 'r') if mmap else None
+        
+        def load(name, rows=count):
+            array = np.load(path / name, mmap_mode=mmap_mode)
+            # Spare rows past `count` may only be appended into through a writable map
+            return array[:rows] if mmap_mode == 'r' else array
+        
+        store = cls(dim=info['dim'], initial_capacity=0)
+        store._matrix = load("embeddings.npy")
+        store._size = count
+        
+        offsets = load("document_offsets.npy", count + 1)
+        blob_path = path / "documents.bin"
+        if mmap and blob_path.stat().st_size:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode=mmap_mode)
+            if not writable:
+                blob = blob[:offsets[count]]
+        else:
+            blob = np.fromfile(blob_path, dtype=np.uint8)
+        fields = {'source': _FieldColumn(info['sources'], load("source_codes.npy")[:count])}
+        for name, values in info.get('fields', {}).items():
+            fields[name] = _FieldColumn(values, load(f"field_{name}.npy")[:count])
+        positions = load("chunk_positions.npy") if (path / "chunk_positions.npy").exists() else None
+        ids = load("chunk_ids.npy")
+        if info['format_version'] == 1:
+            ids = ChunkTable.encode_ids(np.char.decode(ids[:count], 'ascii').tolist())
+        store.chunks = ChunkTable.from_arrays(blob, offsets, ids, fields, positions, size=count)
+        
+        if (path / "deleted_rows.npy").exists():
+            store._deleted_rows = np.load(path / "deleted_rows.npy")
+            store._deleted = set(store._deleted_rows.tolist())
+        
+        index_info = info.get('index')
+        if index_info and index_info['type'] == 'ivf':
+            store.index = IVFIndex.load(path, index_info, segments, 'r' if mmap else None)
+        
+        store.rerank_factor = info.get('rerank_factor', store.rerank_factor)
+        mode = info.get('quantization')
+        if mode:
+            arrays = {p.stem[len("quant_"):]: np.load(p) for p in sorted(path.glob("quant_*.npy"))}
+            store.quantization = mode
+            store.quantizer = QUANTIZERS[mode](info['dim'], arrays, size=count)
+        if info.get('lexical'):
+            store.lexical = BM25Index.load(path, info['lexical'], segments, count, mmap)
+        
+        store._remember_saved(path, segments)
+        return store
+
+
+class BM25Index:
+    """
+    Lexical inverted index with Okapi BM25 scoring. Row numbers match the
+    vector store's rows, so the same filter rows and tombstones apply; a
+    store that owns the index (`store.lexical`) renumbers it on compact
+    and saves it next to the vectors. A saved index is opened as
+    memory-mapped CSR postings, found by binary search over sorted terms;
+    each appending save of the store adds one more such segment.
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> (rows, tfs): lists while growing, arrays once renumbered or loaded
+        self._arrays = {}    # term -> list postings as arrays, rebuilt when the term changes
+        self._lengths = np.empty(0, dtype=np.float32)
+        self._total_length = 0
+        self._segments = []  # (sorted terms, offsets, rows, tfs) per saved segment of an opened index
+        self._dirty = set()  # terms given rows since the last save
+    
+    def __len__(self) -> int:
+        return len(self._lengths)
+    
+    def _lookup(self, term: str, cache: bool = True):
+        postings = self._postings.get(term)
+        if postings is None and self._segments:
+            key = term.encode('ascii')  # _tokenize only yields ascii
+            found = []
+            for terms, offsets, rows, tfs in self._segments:
+                i = int(np.searchsorted(terms, key))
+                if i < len(terms) and terms[i] == key:
+                    found.append((rows[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]))
+            if found:
+                postings = found[0] if len(found) == 1 else tuple(np.concatenate(p) for p in zip(*found))
+                if cache:
+                    self._postings[term] = postings
+        return postings
+    
+    def add(self, texts: Iterable[str]):
+        row = len(self._lengths)
+        lengths = []
+        for text in texts:
+            terms = Counter(_tokenize(text))
+            for term, tf in terms.items():
+                postings = self._lookup(term)
+                if postings is None:
+                    postings = self._postings[term] = ([], [])
+                elif isinstance(postings[0], np.ndarray):
+                    postings = self._postings[term] = (postings[0].tolist(), postings[1].tolist())
+                postings[0].append(row)
+                postings[1].append(tf)
+                self._arrays.pop(term, None)
+                self._dirty.add(term)
+            lengths.append(sum(terms.values()))
+            row += 1
+        self._lengths = np.concatenate((self._lengths, np.array(lengths, dtype=np.float32)))
+        self._total_length += sum(lengths)
+    
+    def _term_arrays(self, term: str, postings):
+        rows, tfs = postings
+        if isinstance(rows, np.ndarray):
+            return rows, tfs
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            arrays = self._arrays[term] = (np.array(rows, dtype=np.int64), np.array(tfs, dtype=np.float32))
+        return arrays
+    
+    def _all_postings(self) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """(term, rows, tfs) for every term, in sorted term order."""
+        terms = set(self._postings)
+        for segment in self._segments:
+            terms.update(t.decode('ascii') for t in segment[0].tolist())
+        for term in sorted(terms):
+            yield (term, *self._term_arrays(term, self._lookup(term, cache=False)))
+    
+    def take(self, rows: np.ndarray):
+        """Keep only `rows` (sorted), renumbered from 0 the way `ChromaDBVectorStore.compact` does."""
+        remap = np.full(len(self._lengths), -1, dtype=np.int64)
+        remap[rows] = np.arange(len(rows))
+        postings = {}
+        for term, term_rows, tfs in self._all_postings():
+            new_rows = remap[term_rows]
+            keep = new_rows >= 0
+            if keep.any():
+                postings[term] = (new_rows[keep], tfs[keep])
+        self._postings, self._arrays, self._segments = postings, {}, []
+        self._dirty = set(postings)
+        self._lengths = self._lengths[rows]
+        self._total_length = int(self._lengths.sum())
+    
+    def save(self, path: Path, prefix: str = "", since: int = 0) -> Dict:
+        """
+        Write sorted terms and CSR postings as <prefix>bm25_*.npy, only the
+        postings of rows >= `since` when appending a segment, and the row
+        lengths as bm25_lengths.npy; returns the store.json entry.
+        """
+        if since:
+            postings = []
+            for term in sorted(self._dirty):
+                term_rows, term_tfs = self._term_arrays(term, self._lookup(term, cache=False))
+                cut = int(np.searchsorted(term_rows, since))
+                postings.append((term, term_rows[cut:], term_tfs[cut:]))
+            _write_rows(path / "bm25_lengths.npy", self._lengths, since)
+        else:
+            postings = self._all_postings()
+            np.save(path / "bm25_lengths.npy", self._lengths)
+        terms, rows, tfs = [], [], []
+        for term, term_rows, term_tfs in postings:
+            if len(term_rows):
+                terms.append(term.encode('ascii'))
+                rows.append(term_rows)
+                tfs.append(term_tfs)
+        np.save(path / f"{prefix}bm25_terms.npy", np.array(terms, dtype=bytes) if terms else np.empty(0, dtype='S1'))
+        np.save(path / f"{prefix}bm25_offsets.npy", np.cumsum([0] + [len(r) for r in rows], dtype=np.int64))
+        np.save(path / f"{prefix}bm25_rows.npy", np.concatenate(rows) if rows else np.empty(0, dtype=np.int64))
+        np.save(path / f"{prefix}bm25_tfs.npy", np.concatenate(tfs) if tfs else np.empty(0, dtype=np.float32))
+        self._dirty = set()
+        return self.info()
+    
+    def info(self) -> Dict:
+        return {'k1': self.k1, 'b': self.b}
+    
+    @classmethod
+    def load(cls, path: Path, info: Dict, segments: List[str], count: int, mmap: bool = True) -> 'BM25Index':
+        mmap_mode = 'r' if mmap else None
+        index = cls(info['k1'], info['b'])
+        index._segments = [tuple(np.load(path / f"{prefix}bm25_{name}.npy", mmap_mode=mmap_mode)
+                                 for name in ('terms', 'offsets', 'rows', 'tfs'))
+                           for prefix in segments]
+        # Every search reads the lengths of its hits, so keep them in memory
+        index._lengths = np.load(path / "bm25_lengths.npy")[:count]
+        index._total_length = int(index._lengths.sum())
+        return index
+    
+    def search(self, query: str, top_k: int, rows: Optional[np.ndarray] = None,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (rows, scores). `rows` restricts scoring to those rows;
+        `exclude` drops rows (e.g. tombstones). Work is proportional to the
+        query terms' posting lists, never the whole corpus.
+        """
+        n_docs = len(self._lengths)
+        if not n_docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        avg_length = self._total_length / n_docs
+        
+        hit_rows, contributions = [], []
+        for term in set(_tokenize(query)):
+            postings = self._lookup(term)
+            if postings is None:
+                continue
+            term_rows, tfs = self._term_arrays(term, postings)
+            idf = np.log(1 + (n_docs - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            keep = None
+            if rows is not None:
+                keep = np.isin(term_rows, rows)
+            if exclude is not None and len(exclude):
+                dropped = np.isin(term_rows, exclude, invert=True)
+                keep = dropped if keep is None else keep & dropped
+            if keep is not None:
+                term_rows, tfs = term_rows[keep], tfs[keep]
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[term_rows] / avg_length)
+            hit_rows.append(term_rows)
+            contributions.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        
+        if not hit_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        unique_rows, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = _top_k(scores, top_k)
+        return unique_rows[top], scores[top]
+
+
+class HybridRetriever:
+    """
+    Lexical + vector retrieval over one store, fused with reciprocal rank
+    fusion: score = sum over rankings of 1 / (rrf_k + rank). Filters are
+    resolved once into matching rows which both rankers are limited to.
+    """
+    
+    def __init__(self, store: ChromaDBVectorStore, engine: EmbeddingEngine,
+                 lexical: Optional[BM25Index] = None, rrf_k: int = 60, candidates: int = 50):
+        self.store = store
+        self.engine = engine
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        store.attach_lexical(lexical)
+    
+    @property
+    def lexical(self) -> BM25Index:
+        return self.store.lexical
+    
+    def add_chunks(self, chunks: List[Dict]):
+        """Embed and add chunks to the store, which also indexes them lexically."""
+        self.store.add_documents(chunks, self.engine.embed_chunks(chunks))
+    
+    @tracer.timed('hybrid_retrieve')
+    def retrieve(self, query: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        if not len(self.store) or top_k <= 0:
+            return []
+        rows = self.store.filter_rows(filters) if filters else None
+        if rows is not None and not len(rows):
+            return []
+        depth = max(self.candidates, top_k)
+        
+        query_vector = self.store._as_matrix(self.engine.embedder.embed([query]))[0]
+        vector_rows, similarities = self.store._search(query_vector, depth, rows=rows)
+        lexical_rows, bm25_scores = self.lexical.search(
+            query, depth, rows=rows, exclude=self.store._deleted_rows if rows is None else None
+        )
+        
+        fused = {}
+        for ranking in (vector_rows, lexical_rows):
+            for rank, row in enumerate(ranking.tolist()):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        best = sorted(fused, key=lambda r: -fused[r])[:top_k]
+        
+        similarity = dict(zip(vector_rows.tolist(), similarities.tolist()))
+        bm25 = dict(zip(lexical_rows.tolist(), bm25_scores.tolist()))
+        return [
+            self.store._result(row, similarity=similarity.get(row, 0.0), bm25=bm25.get(row, 0.0),
+                               rrf_score=fused[row])
+            for row in best
+        ]
+
+
+class IndexManifest:
+    """
+    Record of which chunk ids each filing section produced on the last
+    run, plus a hash of the section text so unchanged sections can skip
+    re-chunking entirely.
+    """
+    
+    def __init__(self, path: str = "data/vector_store/manifest.json"):
+        self.path = Path(path)
+        self.sections = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.sections = json.load(f)['sections']
+    
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'sections': self.sections}, f)
+        os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def hash_source(source: Union[str, Path]) -> str:
+        """Content hash of a section given as text or a file path."""
+        digest = hashlib.md5()
+        if isinstance(source, Path):
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        else:
+            digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+
+class IncrementalIndexer:
+    """
+    Re-index filings by applying only the chunk-level diff against the
+    manifest: sections whose text hash is unchanged are skipped, removed
+    chunks are tombstoned, and only new chunks are embedded and added.
+    The store is opened writable and saved back in place, so an update
+    writes what changed rather than the whole corpus. Adds are idempotent
+    by (section, chunk id): after a crash between the store save and the
+    manifest save, the rerun skips rows the store already holds.
+    """
+    
+    def __init__(self, chunker: FilingChunker, engine: EmbeddingEngine,
+                 store_dir: str = "data/vector_store"):
+        self.chunker = chunker
+        self.engine = engine
+        self.store_dir = Path(store_dir)
+        self.manifest = IndexManifest(self.store_dir / "manifest.json")
+        if (self.store_dir / "store.json").exists() and self.manifest.path.exists():
+            self.store = ChromaDBVectorStore.open(self.store_dir, writable=True)
+        else:
+            # Rows no manifest accounts for can't be diffed; start over
+            self.store = ChromaDBVectorStore()
+        self.store.attach_lexical()
+        self.stats = {}
+    
+    def update(self, filings: Optional[Dict[str, Union[str, Path]]] = None) -> Dict:
+        """Bring the store in line with `filings` and persist it with the manifest."""
+        if filings is None:
+            filings = self.chunker.create_synthetic_filings()
+        hashes = {section: IndexManifest.hash_source(source) for section, source in filings.items()}
+        return self._apply(hashes, lambda section: list(self.chunker.iter_filings({section: filings[section]})))
+    
+    def update_chunks(self, chunks: Iterable[Dict]) -> Dict:
+        """Like `update`, for chunks already cut (e.g. data/chunks.json); each 'source' is a section."""
+        sections = {}
+        for chunk in chunks:
+            sections.setdefault(chunk['source'], []).append(dict(chunk))
+        hashes = {
+            section: hashlib.md5(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+            for section, rows in sections.items()
+        }
+        return self._apply(hashes, sections.__getitem__)
+    
+    def _apply(self, hashes: Dict[str, str], chunk_section: Callable[[str], List[Dict]]) -> Dict:
+        added, removed = [], []
+        unchanged_sections = 0
+        new_sections = {}
+        
+        for section, source_hash in hashes.items():
+            previous = self.manifest.sections.get(section)
+            if previous and previous['hash'] == source_hash:
+                new_sections[section] = previous
+                unchanged_sections += 1
+                continue
+            
+            chunks = chunk_section(section)
+            old_ids = set(previous['chunk_ids']) if previous else set()
+            new_ids = {c['id'] for c in chunks}
+            added.extend(c for c in chunks if c['id'] not in old_ids)
+            removed.extend((section, cid) for cid in old_ids - new_ids)
+            new_sections[section] = {'hash': source_hash, 'chunk_ids': [c['id'] for c in chunks]}
+        
+        for section in set(self.manifest.sections) - set(hashes):
+            removed.extend((section, cid) for cid in self.manifest.sections[section]['chunk_ids'])
+        
+        removed_rows = self.store.delete(removed)
+        present = self.store._key_index()
+        fresh = [c for c in added if (c['source'], ChunkTable.stored_id(c['id'])) not in present]
+        if fresh:
+            self.store.add_documents(fresh, self.engine.embed_chunks(fresh))
+        
+        if fresh or removed_rows:
+            self.store.save(self.store_dir)
+        self.manifest.sections = new_sections
+        self.manifest.save()
+        
+        self.stats = {
+            'sections': len(hashes),
+            'unchanged_sections': unchanged_sections,
+            'added': len(fresh),
+            'already_present': len(added) - len(fresh),
+            'removed': removed_rows,
+            'live_chunks': self.store.live_count,
+        }
+        return self.stats
 
 
 if __name__ == "__main__":
@@ -134,8 +2240,23 @@ if __name__ == "__main__":
     print(f"✓ Created {len(chunks)} chunks")
     for chunk in chunks[:3]:
         print(f"  - {chunk['source']}: {chunk['word_count']} words")
+    memory = ChunkTable.memory_report(chunks)
+    print(f"✓ Chunk memory: {memory['dict_bytes_per_chunk']:.0f} B/chunk as dicts, "
+          f"{memory['table_bytes_per_chunk']:.0f} B/chunk as a table")
     
     print("\n💾 Saving chunks...")
     chunker.save_chunks()
     
+    print("\n🧮 Embedding chunks...")
+    engine = EmbeddingEngine.with_disk_cache()
+    embeddings = engine.embed_chunks(chunks)
+    stats = engine.stats
+    print(f"✓ {stats['chunks']} chunks embedded ({stats['hit_rate']:.0%} cache hits, "
+          f"{stats['chunks_per_s']:.0f} chunks/s)")
+    
+    store = ChromaDBVectorStore()
+    store.add_documents(chunks, embeddings)
+    store.save("data/vector_store")
+    print("✓ Vector store saved to data/vector_store")
+    
     print("\n✅ RAG pipeline setup complete!")
@@ -4,25 +4,487 @@ Uses Vercel AI SDK for LLM access.
 """
 
 import json
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, Dict
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 import asyncio
+import random
+
+from instrumentation import tracer
+from pipeline_engine import load_stage_module
+
+
+def _run_sync(coro, name: str, alternative: str):
+    """asyncio.run for the synchronous wrappers, failing clearly inside a running loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError(f"{name}() cannot run inside a running event loop; {alternative} instead")
+
+
+def _fsync_dir(path: Path):
+    """Make a rename inside `path` durable (skipped where directories can't be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class LLMError(Exception):
+    """Raised when the LLM backend returns an unusable response."""
+
+
+class LLMClient(ABC):
+    """Interface for async LLM completion backends."""
+    
+    @abstractmethod
+    async def acomplete(self, prompt: str, **params) -> str:
+        """Completion text for `prompt`."""
+
+
+class HTTPLLMClient(LLMClient):
+    """
+    Minimal JSON-over-HTTP completion client built on asyncio streams:
+    POSTs {"prompt": ..., **params} and expects {"text": ...} back.
+    """
+    
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+    
+    async def acomplete(self, prompt: str, **params) -> str:
+        body = json.dumps({'prompt': prompt, **params}).encode()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            payload = await reader.read()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        
+        parts = status_line.split()
+        status = int(parts[1]) if len(parts) > 1 else 0
+        if status != 200:
+            raise LLMError(f"LLM server returned HTTP {status}")
+        return json.loads(payload)['text']
+
+
+class StubLLMServer:
+    """
+    Local stand-in for an LLM endpoint, for tests and benchmarks. Every
+    request sleeps `latency` (+ up to `jitter`) seconds; every
+    `fail_every`-th request gets a 503 to exercise retries.
+    """
+    
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, fail_every: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_every = fail_every
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/complete"
+    
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.url
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def __aenter__(self) -> 'StubLLMServer':
+        await self.start()
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.stop()
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.requests += 1
+        request_no = self.requests
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            request = json.loads(await reader.readexactly(length))
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            
+            if self.fail_every and request_no % self.fail_every == 0:
+                status, payload = "503 Service Unavailable", {'error': 'overloaded'}
+            else:
+                heading = request['prompt'].strip().splitlines()[0].lstrip('# ')
+                status, payload = "200 OK", {'text': f"[stub completion for {heading}]"}
+            body = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.CancelledError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # client gave up (e.g. timed out) or the server is shutting down
+        finally:
+            self.in_flight -= 1
+            writer.close()
+
+
+class LLMResponseCache:
+    """
+    Disk-backed cache of LLM completions in SQLite.
+
+    Entries expire after `max_age` seconds; once the stored text exceeds
+    `max_bytes`, least recently used entries are evicted. SQLite's file
+    locking (in WAL mode) makes one cache file safe to share between
+    worker processes; each process opens its own connection, shared by
+    its threads under a lock so async callers can use `asyncio.to_thread`.
+    """
+    
+    def __init__(self, path: str = "data/llm_cache.sqlite", max_bytes: int = 256 * 1024 * 1024,
+                 max_age: float = 30 * 24 * 3600):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.RLock()
+    
+    # cache_size holds SUM(size), kept current by triggers, so eviction
+    # checks don't scan the table
+    _SCHEMA = """
+        BEGIN IMMEDIATE;
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+            created REAL NOT NULL, accessed REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+        CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+        CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL);
+        INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM responses;
+        CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses
+            BEGIN UPDATE cache_size SET total = total + NEW.size; END;
+        CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses
+            BEGIN UPDATE cache_size SET total = total - OLD.size; END;
+        CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses
+            BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size; END;
+        COMMIT;
+    """
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Connections must not cross a fork
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # REPLACE only fires the delete trigger with recursive triggers on
+            self._conn.execute("PRAGMA recursive_triggers=ON")
+            self._conn.executescript(self._SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+    
+    @staticmethod
+    def make_key(section: str, prompt: str, kpis: Dict, params: Dict) -> str:
+        """Stable hash of everything that determines a section's completion."""
+        payload = json.dumps(
+            {'section': section, 'prompt': prompt, 'kpis': kpis, 'params': params},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.evictions += 1
+                self.misses += 1
+                tracer.count('llm_cache_misses')
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            tracer.count('llm_cache_hits')
+            return row[0]
+    
+    def put(self, key: str, value: str):
+        with self._lock:
+            now = time.time()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode()), now, now),
+            )
+            self.evict()
+    
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM cache_size").fetchone()[0]
+    
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+                ).rowcount
+                total = self._total(conn)
+                if total > self.max_bytes:
+                    excess = total - self.max_bytes
+                    doomed = []
+                    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                        if excess <= 0:
+                            break
+                        doomed.append((key,))
+                        excess -= size
+                    conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                    removed += len(doomed)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.evictions += removed
+    
+    @property
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._total(self.conn)
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': size,
+            }
+
+
+def _chunk_id(chunk: Dict) -> str:
+    """Citation id of a chunk from either the chunker ('id') or the vector store ('chunk_id')."""
+    return chunk.get('chunk_id') or chunk.get('id', 'N/A')
+
+
+class ContextPacker:
+    """
+    Turn retrieved chunks into a compact, de-duplicated prompt context.
+
+    1. Chunks from the same source whose word ranges overlap or touch
+       (per `start_pos`/`word_count`) are merged, dropping the repeated
+       overlap words.
+    2. A passage is dropped when at least `dup_threshold` of the word
+       5-grams of the smaller of it and a higher-scoring passage are shared
+       (overlap coefficient), which also catches passages contained in
+       another.
+    3. Remaining passages are packed greedily, best score first, until
+       `token_budget` (estimated by `count_tokens`) is used up.
+
+    Every passage keeps the ids of the chunks it was built from.
+    """
+    
+    SHINGLE = 5
+    
+    def __init__(self, token_budget: int = 3000, dup_threshold: float = 0.8, count_tokens=None):
+        self.token_budget = token_budget
+        self.dup_threshold = dup_threshold
+        # ~4 characters per token is the usual rule of thumb for English text
+        self.count_tokens = count_tokens or (lambda text: max(1, len(text) // 4))
+    
+    @staticmethod
+    def _score(chunk: Dict, rank: int) -> float:
+        """
+        Fused hybrid score if present (lexical-only hits have similarity
+        0.0), else retrieval similarity, else earlier chunks rank higher.
+        """
+        if 'rrf_score' in chunk:
+            return chunk['rrf_score']
+        return chunk.get('similarity', 1.0 / (rank + 1))
+    
+    def merge_adjacent(self, chunks: List[Dict]) -> List[Dict]:
+        passages = [
+            {
+                'source': c.get('source', ''),
+                'words': c['text'].split(),
+                'start_pos': c.get('start_pos'),
+                'chunk_ids': [_chunk_id(c)],
+                'score': self._score(c, rank),
+            }
+            for rank, c in enumerate(chunks)
+        ]
+        positioned = sorted((p for p in passages if p['start_pos'] is not None),
+                            key=lambda p: (p['source'], p['start_pos']))
+        merged = [p for p in passages if p['start_pos'] is None]
+        for p in positioned:
+            prev = merged[-1] if merged and merged[-1]['start_pos'] is not None else None
+            if prev and prev['source'] == p['source']:
+                prev_end = prev['start_pos'] + len(prev['words'])
+                if p['start_pos'] <= prev_end:
+                    overlap = prev_end - p['start_pos']
+                    prev['words'].extend(p['words'][overlap:])
+                    prev['chunk_ids'].extend(i for i in p['chunk_ids'] if i not in prev['chunk_ids'])
+                    prev['score'] = max(prev['score'], p['score'])
+                    continue
+            merged.append(p)
+        
+        for p in merged:
+            p['text'] = ' '.join(p.pop('words'))
+        return merged
+    
+    def _shingles(self, text: str) -> set:
+        words = text.lower().split()
+        if len(words) < self.SHINGLE:
+            return {tuple(words)}
+        return {tuple(words[i:i + self.SHINGLE]) for i in range(len(words) - self.SHINGLE + 1)}
+    
+    def drop_near_duplicates(self, passages: List[Dict]) -> List[Dict]:
+        """Keep passages in score order, skipping any too similar to one already kept."""
+        kept, kept_shingles = [], []
+        for p in sorted(passages, key=lambda p: -p['score']):
+            shingles = self._shingles(p['text'])
+            if any(len(shingles & s) / min(len(shingles), len(s)) >= self.dup_threshold
+                   for s in kept_shingles):
+                continue
+            kept.append(p)
+            kept_shingles.append(shingles)
+        return kept
+    
+    def trim(self, text: str, budget: int) -> str:
+        """Longest word prefix of `text` within `budget` tokens (at least one word)."""
+        words = text.split()
+        lo, hi = 1, len(words)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count_tokens(' '.join(words[:mid])) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        return ' '.join(words[:lo])
+    
+    def pack(self, chunks: List[Dict]) -> List[Dict]:
+        """Best passages (by score) that fit in the token budget."""
+        packed, used = [], 0
+        for p in self.drop_near_duplicates(self.merge_adjacent(chunks)):
+            tokens = self.count_tokens(p['text'])
+            if used + tokens > self.token_budget:
+                if packed:
+                    continue
+                # Never return an empty context: trim the best passage to fit
+                p['text'] = self.trim(p['text'], self.token_budget)
+                tokens = self.count_tokens(p['text'])
+            packed.append(p)
+            used += tokens
+        return packed
+
 
 # Mock LLM response for demonstration
 class MDAndAGenerator:
-    """Generate MD&A narratives with LLM and citations."""
+    """
+    Generate MD&A narratives with LLM and citations.
+
+    Without an `llm` client, sections are rendered from the built-in mock
+    templates. With one, each section is a completion request; requests
+    run concurrently, bounded by a semaphore that may be shared across
+    generators, with a per-call timeout and exponential-backoff retries.
+    Completions are looked up in `cache` first when one is given.
+    With a `retriever` (e.g. HybridRetriever), cited chunks come from a
+    filtered hybrid search instead of a scan over `chunks`; `filters`
+    (e.g. {'ticker': 'AAPL'}) narrow every retrieval on a shared index.
+    """
     
-    def __init__(self, kpis: Dict, chunks: List[Dict]):
+    # (key, title) in document order
+    SECTIONS = (
+        ('revenue', 'Revenue Analysis'),
+        ('profitability', 'Profitability & Operating Margins'),
+        ('liquidity', 'Liquidity & Capital Resources'),
+        ('risks', 'Risk Factors'),
+    )
+    
+    # Retrieval query and source filter for the sections that cite filings
+    RETRIEVAL = {
+        'revenue': ("revenue growth drivers customers segments", lambda source: 'Business' in source),
+        'risks': ("risk factors competition regulation supply chain", lambda source: 'Risk' in source),
+    }
+    
+    def __init__(self, kpis: Dict, chunks: List[Dict], llm: Optional[LLMClient] = None,
+                 max_concurrency: int = 4, semaphore: Optional[asyncio.Semaphore] = None,
+                 timeout: float = 60.0, max_retries: int = 2, retry_backoff: float = 0.5,
+                 llm_params: Optional[Dict] = None, cache: Optional[LLMResponseCache] = None,
+                 packer: Optional[ContextPacker] = None, retriever=None, top_k: int = 2,
+                 filters: Optional[Dict] = None):
         self.kpis = kpis
         self.chunks = chunks
         self.sections = {}
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.semaphore = semaphore
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.llm_params = llm_params or {}
+        self.cache = cache
+        self.packer = packer or ContextPacker()
+        self.retriever = retriever
+        self.top_k = top_k
+        self.filters = filters or {}
+    
+    @staticmethod
+    def _render_context(section_type: str, passages: List[Dict]) -> str:
+        parts = [f"## {section_type}\n\nRelevant excerpts from filings:\n"]
+        for i, passage in enumerate(passages, 1):
+            parts.append(f"\n[Chunk {i} from {passage['source']} | ids: {', '.join(passage['chunk_ids'])}]\n"
+                         f"{passage['text']}\n")
+        return ''.join(parts)
     
     def _build_context(self, section_type: str, relevant_chunks: List[Dict]) -> str:
-        """Build context from relevant chunks for LLM prompt."""
-        context = f"## {section_type}\n\nRelevant excerpts from filings:\n"
-        for i, chunk in enumerate(relevant_chunks, 1):
-            context += f"\n[Chunk {i} from {chunk['source']}]\n{chunk['text']}\n"
-        return context
+        """Build context from relevant chunks for LLM prompt, packed to the token budget."""
+        return self._render_context(section_type, self.packer.pack(relevant_chunks))
     
     def generate_revenue_analysis(self, retrieved_chunks: List[Dict]) -> Dict:
         """Generate revenue trends section."""
@@ -49,12 +511,12 @@ upsell and cross-sell initiatives.
 Based on current pipeline and market dynamics, we expect Q3 2024 revenue to reach $72-75 million, 
 representing continued momentum in the market.
 
-*Citations: [{', '.join([c.get('chunk_id', 'N/A') for c in retrieved_chunks])}]*
+*Citations: [{', '.join([_chunk_id(c) for c in retrieved_chunks])}]*
 """
         return {
             'title': 'Revenue Analysis',
             'narrative': narrative,
-            'citations': [c['chunk_id'] for c in retrieved_chunks]
+            'citations': [_chunk_id(c) for c in retrieved_chunks]
         }
     
     def generate_profitability_analysis(self) -> Dict:
@@ -137,36 +599,92 @@ We continue to monitor and manage supply chain resilience.
 Foreign exchange exposure is limited given our USD-denominated revenue base. Interest rate sensitivity 
 remains moderate due to our low leverage position.
 
-*Citations: [{', '.join([c.get('chunk_id', 'N/A') for c in retrieved_chunks])}]*
+*Citations: [{', '.join([_chunk_id(c) for c in retrieved_chunks])}]*
 """
         return {
             'title': 'Risk Factors',
             'narrative': narrative,
-            'citations': [c['chunk_id'] for c in retrieved_chunks]
+            'citations': [_chunk_id(c) for c in retrieved_chunks]
         }
     
-    def generate_full_mda(self) -> str:
-        """Generate complete MD&A document."""
-        # Simulate retrieval of relevant chunks
-        revenue_chunks = [c for c in self.chunks if 'Business' in c.get('source', '')][:2]
-        risk_chunks = [c for c in self.chunks if 'Risk' in c.get('source', '')][:2]
-        
-        self.sections = {
-            'revenue': self.generate_revenue_analysis(revenue_chunks),
-            'profitability': self.generate_profitability_analysis(),
-            'liquidity': self.generate_liquidity_analysis(),
-            'risks': self.generate_risk_discussion(risk_chunks)
-        }
+    def _select_chunks(self) -> Tuple[List[Dict], List[Dict]]:
+        """Pick the chunks cited by the revenue and risk sections."""
+        selected = {}
+        with tracer.span('select_chunks', indexed=self.retriever is not None):
+            for key, (query, source_filter) in self.RETRIEVAL.items():
+                if self.retriever is not None:
+                    filters = {**self.filters, 'source': source_filter}
+                    selected[key] = self.retriever.retrieve(query, self.top_k, filters=filters)
+                else:
+                    # No index: fall back to a scan over the raw chunks
+                    selected[key] = [c for c in self.chunks if source_filter(c.get('source', ''))][:self.top_k]
+        return selected['revenue'], selected['risks']
+    
+    def _render_section(self, key: str, chunks: List[Dict]) -> Dict:
+        """Section from the built-in mock templates."""
+        if key == 'revenue':
+            return self.generate_revenue_analysis(chunks)
+        if key == 'profitability':
+            return self.generate_profitability_analysis()
+        if key == 'liquidity':
+            return self.generate_liquidity_analysis()
+        return self.generate_risk_discussion(chunks)
+    
+    def _section_prompt(self, title: str, passages: List[Dict]) -> str:
+        kpi_lines = "".join(f"- {k}: {v:.2f}\n" for k, v in self.kpis.items())
+        return self._render_context(title, passages) + "\nKey financial KPIs:\n" + kpi_lines
+    
+    async def _call_llm(self, prompt: str, semaphore: asyncio.Semaphore) -> str:
+        """One completion under the concurrency limit, with timeout and retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    with tracer.span('llm_call', attempt=attempt):
+                        return await asyncio.wait_for(
+                            self.llm.acomplete(prompt, **self.llm_params), self.timeout
+                        )
+            except (asyncio.TimeoutError, ConnectionError, LLMError):
+                tracer.count('llm_errors')
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+    
+    async def agenerate_section(self, key: str, title: str, chunks: List[Dict],
+                                semaphore: Optional[asyncio.Semaphore] = None) -> Dict:
+        """Generate one section, via the LLM client if configured."""
+        with tracer.span('generate_section', section=key):
+            return await self._agenerate_section(key, title, chunks, semaphore)
+    
+    async def _agenerate_section(self, key: str, title: str, chunks: List[Dict],
+                                 semaphore: Optional[asyncio.Semaphore]) -> Dict:
+        if self.llm is None:
+            return self._render_section(key, chunks)
         
-        # Assemble document
-        mda_doc = """# MANAGEMENT DISCUSSION AND ANALYSIS
+        with tracer.span('build_context', section=key, chunks=len(chunks)):
+            passages = self.packer.pack(chunks)
+            prompt = self._section_prompt(title, passages)
+        text = None
+        if self.cache is not None:
+            params = {'model': getattr(self.llm, 'model', type(self.llm).__name__), **self.llm_params}
+            cache_key = self.cache.make_key(key, prompt, self.kpis, params)
+            text = await asyncio.to_thread(self.cache.get, cache_key)
+        if text is None:
+            semaphore = semaphore or self.semaphore or asyncio.Semaphore(self.max_concurrency)
+            text = await self._call_llm(prompt, semaphore)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, cache_key, text)
+        citations = [cid for p in passages for cid in p['chunk_ids']]
+        narrative = f"\n### {title}\n\n{text.strip()}\n"
+        if citations:
+            narrative += f"\n*Citations: [{', '.join(citations)}]*\n"
+        return {'title': title, 'narrative': narrative, 'citations': citations}
+    
+    HEADER = """# MANAGEMENT DISCUSSION AND ANALYSIS
 ## Q2 2024 Financial Results
 
 """
-        for section_key, section_data in self.sections.items():
-            mda_doc += section_data['narrative'] + "\n\n"
-        
-        mda_doc += """
+    
+    FOOTER = """
 ---
 
 ## Document Information
@@ -174,26 +692,129 @@ remains moderate due to our low leverage position.
 - Data Period: Q2 2024
 - Sections: Revenue Analysis, Profitability, Liquidity, Risk Factors
 """
-        
-        return mda_doc
     
-    def save_mda(self, output_file: str = "output/mda_draft.md"):
-        """Save generated MD&A to markdown file."""
-        Path("output").mkdir(exist_ok=True)
-        mda_content = self.generate_full_mda()
+    def _assemble(self) -> str:
+        """Assemble self.sections (already in SECTIONS order) into the document."""
+        return ''.join([self.HEADER, *(s['narrative'] + "\n\n" for s in self.sections.values()), self.FOOTER])
+    
+    async def aiter_sections(self, ordered: bool = True) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Yield (key, section) as sections finish. All sections are requested
+        at once; with `ordered`, each is yielded as soon as it and every
+        section before it are done, so the first arrives after one LLM
+        round trip. Otherwise sections come in completion order.
+        """
+        # A fresh semaphore per call: asyncio primitives are bound to one event loop
+        semaphore = self.semaphore or asyncio.Semaphore(self.max_concurrency)
+        self.sections = {}
+        with tracer.span('generate_mda', stage='mda', llm=self.llm is not None):
+            # Retrieval is CPU-bound numpy work: keep it off the event loop
+            revenue_chunks, risk_chunks = await asyncio.to_thread(self._select_chunks)
+            section_chunks = {'revenue': revenue_chunks, 'risks': risk_chunks}
+            
+            async def generate(key: str, title: str) -> Tuple[str, Dict]:
+                return key, await self.agenerate_section(key, title, section_chunks.get(key, []), semaphore)
+            
+            tasks = [asyncio.ensure_future(generate(key, title)) for key, title in self.SECTIONS]
+            try:
+                for next_done in (tasks if ordered else asyncio.as_completed(tasks)):
+                    key, section = await next_done
+                    self.sections[key] = section
+                    yield key, section
+            finally:
+                # The consumer stopped early or a section failed: don't leave requests running
+                for task in tasks:
+                    task.cancel()
+        if not ordered:
+            self.sections = {key: self.sections[key] for key, _ in self.SECTIONS}
+    
+    async def aiter_mda(self) -> AsyncIterator[str]:
+        """The document as text pieces: header, each section in order, footer."""
+        yield self.HEADER
+        async for _, section in self.aiter_sections():
+            yield section['narrative'] + "\n\n"
+        yield self.FOOTER
+    
+    def iter_mda(self) -> Iterator[str]:
+        """Synchronous `aiter_mda`, driven on a private event loop (not from inside a running loop)."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("iter_mda() cannot run inside a running event loop; iterate aiter_mda() instead")
+        loop = asyncio.new_event_loop()
+        pieces = asyncio.Queue()
         
-        with open(output_file, 'w') as f:
-            f.write(mda_content)
+        async def pump():
+            # One task runs the whole generator, so its context (spans, progress) stays consistent
+            try:
+                async for piece in self.aiter_mda():
+                    await pieces.put(piece)
+            finally:
+                await pieces.put(None)
         
+        task = loop.create_task(pump())
+        try:
+            while (piece := loop.run_until_complete(pieces.get())) is not None:
+                yield piece
+            loop.run_until_complete(task)  # re-raise a failed section
+        finally:
+            task.cancel()
+            loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+            loop.close()
+    
+    async def agenerate_full_mda(self) -> str:
+        """Generate all sections concurrently and assemble them in document order."""
+        return ''.join([piece async for piece in self.aiter_mda()])
+    
+    def generate_full_mda(self) -> str:
+        """Generate complete MD&A document."""
+        return _run_sync(self.agenerate_full_mda(), 'generate_full_mda',
+                         "await agenerate_full_mda() or iterate aiter_mda()")
+    
+    async def awrite_mda(self, output_file: str, on_section: Optional[Callable[[str, Dict], None]] = None) -> Path:
+        """
+        Stream the document into `output_file` as sections complete, calling
+        `on_section(key, section)` for each. Pieces go to a temporary file
+        that is flushed per section, fsynced and renamed over `output_file`
+        at the end, so readers never see a partial final file.
+        """
+        path = Path(output_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.HEADER)
+                async for key, section in self.aiter_sections():
+                    f.write(section['narrative'] + "\n\n")
+                    f.flush()
+                    if on_section is not None:
+                        on_section(key, section)
+                f.write(self.FOOTER)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        _fsync_dir(path.parent)
+        return path
+    
+    def write_mda(self, output_file: str, on_section: Optional[Callable[[str, Dict], None]] = None) -> Path:
+        """Synchronous `awrite_mda`."""
+        return _run_sync(self.awrite_mda(output_file, on_section), 'write_mda', "await awrite_mda()")
+    
+    def save_mda(self, output_file: str = "output/mda_draft.md"):
+        """Save generated MD&A to markdown file, streaming sections as they complete."""
+        self.write_mda(output_file)
         print(f"✓ MD&A saved to {output_file}")
         return output_file
 
-
 if __name__ == "__main__":
-    # Load KPIs and chunks
-    with open("data/financial_analysis.json", 'r') as f:
-        analysis = json.load(f)
-        kpis = analysis['kpis']
+    # Load KPIs (only the KPI table, not every statement) and chunks
+    setup_data = load_stage_module("1_setup_data.py")
+    kpis = setup_data.load_kpis("data/financial_analysis")
     
     with open("data/chunks.json", 'r') as f:
         chunks = json.load(f)
@@ -1,57 +1,128 @@
 """
 Main execution script: Run the complete MD&A generation pipeline.
+
+Stages are content-addressed (see pipeline_engine.py): a re-run skips
+every stage whose inputs are unchanged, and independent stages such as
+KPI computation and filing chunking run in parallel.
+
+With --batch MANIFEST, every company in the manifest is processed across
+a process pool instead (see BatchRunner).
 """
 
+import argparse
+import json
 import sys
+import time
 from pathlib import Path
+from typing import List, Optional
 
 # Add scripts to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from scripts.setup_data import FinancialDataProcessor
-from scripts.rag_pipeline import FilingChunker, ChromaDBVectorStore
-from scripts.mda_generator import MDAndAGenerator
+from instrumentation import tracer
+from pipeline_engine import BatchRunner, Pipeline, Stage, load_stage_module
 
-def main():
-    print("=" * 60)
-    print("AUTOMATED MD&A GENERATION PIPELINE")
-    print("=" * 60)
+
+def build_stages(chunk_size: int = 100, overlap: int = 20, ticker: Optional[str] = None,
+                 embedder=None) -> List[Stage]:
+    """
+    The four pipeline stages with the files each reads and writes. Chunks
+    are tagged with `ticker` (default: the sample company's) so a batch
+    run can share the store (--store data/vector_store). `embedder`
+    (default: HashingEmbedder) embeds both the index and the queries.
+    """
+    if ticker is None:
+        ticker = load_stage_module("1_setup_data.py").KPIEngine.DEFAULT_TICKER
+    if embedder is None:
+        embedder = load_stage_module("2_rag_pipeline.py").HashingEmbedder()
     
-    # Step 1: Process financial data
-    print("\n[1/4] Processing financial statements...")
-    processor = FinancialDataProcessor()
-    processor.load_sample_data()
-    kpis = processor.compute_kpis()
-    processor.compute_yoy_qoq_deltas()
-    processor.export_analysis()
+    def financials():
+        setup_data = load_stage_module("1_setup_data.py")
+        processor = setup_data.FinancialDataProcessor()
+        processor.load_sample_data()
+        kpis = processor.compute_kpis()
+        processor.compute_yoy_qoq_deltas()
+        processor.export_analysis()
+        
+        print("\n     KPIs computed:")
+        for k, v in list(kpis.items())[:5]:
+            print(f"     • {k}: {v:.2f}")
     
-    print("\n     KPIs computed:")
-    for k, v in list(kpis.items())[:5]:
-        print(f"     • {k}: {v:.2f}")
+    def chunks():
+        rag = load_stage_module("2_rag_pipeline.py")
+        chunker = rag.FilingChunker(chunk_size=chunk_size, overlap=overlap)
+        chunker.process_filings(ticker=ticker)
+        chunker.save_chunks()
     
-    # Step 2: Create RAG chunks
-    print("\n[2/4] Creating filing chunks for RAG...")
-    chunker = FilingChunker(chunk_size=100, overlap=20)
-    chunks = chunker.process_filings()
-    chunker.save_chunks()
-    print(f"     {len(chunks)} chunks created and indexed")
+    def index():
+        rag = load_stage_module("2_rag_pipeline.py")
+        with open("data/chunks.json") as f:
+            chunks = json.load(f)
+        engine = rag.EmbeddingEngine.with_disk_cache(embedder)
+        # Only sections whose chunks changed are re-embedded and appended to the store
+        indexer = rag.IncrementalIndexer(rag.FilingChunker(chunk_size, overlap), engine, "data/vector_store")
+        stats = indexer.update_chunks(chunks)
+        print(f"     {stats['live_chunks']} chunks indexed: {stats['added']} added, {stats['removed']} removed, "
+              f"{stats['unchanged_sections']}/{stats['sections']} sections unchanged")
+        if stats['added']:
+            print(f"     Embedding cache: {engine.stats['hit_rate']:.0%} hits, "
+                  f"{engine.stats['chunks_per_s']:.0f} chunks/s")
     
-    # Step 3: Generate MD&A
-    print("\n[3/4] Generating MD&A narrative...")
-    generator = MDAndAGenerator(kpis, chunks)
-    mda_file = generator.save_mda()
+    def mda():
+        setup_data = load_stage_module("1_setup_data.py")
+        rag = load_stage_module("2_rag_pipeline.py")
+        mda_generator = load_stage_module("3_mda_generator.py")
+        kpis = setup_data.load_kpis("data/financial_analysis")
+        store = rag.ChromaDBVectorStore.open("data/vector_store")
+        retriever = rag.HybridRetriever(store, rag.EmbeddingEngine.with_disk_cache(embedder))
+        generator = mda_generator.MDAndAGenerator(kpis, store.chunks, retriever=retriever)
+        mda_file = generator.save_mda()
+        print(f"     ✓ Sections generated: Revenue, Profitability, Liquidity, Risks")
+        print(f"     ✓ Output: {mda_file}")
     
-    print(f"     ✓ Sections generated: Revenue, Profitability, Liquidity, Risks")
-    print(f"     ✓ Output: {mda_file}")
+    return [
+        Stage("financials", financials,
+              inputs=["1_setup_data.py"],
+              outputs=["data/financial_analysis"]),
+        Stage("chunks", chunks,
+              inputs=["2_rag_pipeline.py"],
+              outputs=["data/chunks.json"],
+              params={'chunk_size': chunk_size, 'overlap': overlap, 'ticker': ticker}),
+        Stage("index", index,
+              inputs=["2_rag_pipeline.py", "data/chunks.json"],
+              outputs=["data/vector_store"],
+              # The indexer re-chunks with these settings, and the store is only valid for this embedder
+              params={'chunk_size': chunk_size, 'overlap': overlap,
+                      'embedder': embedder.name, 'dim': embedder.dim}),
+        Stage("mda", mda,
+              inputs=["1_setup_data.py", "2_rag_pipeline.py", "3_mda_generator.py",
+                      "data/financial_analysis", "data/vector_store"],
+              outputs=["output/mda_draft.md"]),
+    ]
+
+
+def main(force: bool = False):
+    print("=" * 60)
+    print("AUTOMATED MD&A GENERATION PIPELINE")
+    print("=" * 60)
+    
+    print("\nRunning stages (unchanged stages are skipped)...")
+    t0 = time.perf_counter()
+    results = Pipeline(build_stages()).run(force=force)
+    elapsed = time.perf_counter() - t0
+    ran = [name for name, r in results.items() if r['status'] == 'ran']
+    print(f"\nPipeline complete in {elapsed:.2f}s: "
+          f"{len(ran)} stage(s) ran, {len(results) - len(ran)} skipped")
+    if tracer.enabled:
+        print_trace_summary()
     
-    # Step 4: Summary
-    print("\n[4/4] Pipeline complete!")
     print("\n" + "=" * 60)
     print("DELIVERABLES")
     print("=" * 60)
     print("✓ output/mda_draft.md - Full MD&A narrative with citations")
-    print("✓ data/financial_analysis.json - KPIs and deltas")
+    print("✓ data/financial_analysis/ - KPIs, deltas and statements (columnar)")
     print("✓ data/chunks.json - Filing chunks for retrieval")
+    print("✓ data/vector_store/ - Embedded, memory-mappable vector index")
     print("\nNext steps:")
     print("  1. Review output/mda_draft.md for accuracy")
     print("  2. Integrate real SEC filing data via EDGAR API")
@@ -60,5 +131,54 @@ def main():
     print("=" * 60)
 
 
+def print_trace_summary():
+    """Counters and latency percentiles collected in this process; also appended to the trace."""
+    summary = tracer.summary()
+    tracer.flush()
+    print(f"\nTrace written to {tracer.path} (peak RSS {summary['peak_rss_mb']:.0f} MB)")
+    for name, value in sorted(summary['counters'].items()):
+        print(f"  • {name}: {value:,}")
+    for name, stats in sorted(summary['percentiles'].items()):
+        print(f"  • {name}: p50 {stats['p50']:.2f} ms, p90 {stats['p90']:.2f} ms, "
+              f"max {stats['max']:.2f} ms over {stats['count']}")
+
+
+def run_batch(manifest: str, workers: Optional[int] = None, retries: int = 1,
+              store_dir: Optional[str] = None, output_dir: str = "output/batch"):
+    print("=" * 60)
+    print("BATCH MD&A GENERATION")
+    print("=" * 60)
+    
+    runner = BatchRunner(workers=workers, retries=retries, store_dir=store_dir, output_dir=output_dir)
+    jobs = BatchRunner.load_manifest(manifest)
+    print(f"\nProcessing {len(jobs)} companies on {runner.workers} workers...")
+    summary = runner.run(jobs)
+    
+    print(f"\n✓ {summary['succeeded']}/{summary['companies']} companies in {summary['seconds']:.1f}s "
+          f"({summary['companies_per_s']:.2f} companies/s, {summary['chunks_per_s']:.0f} chunks/s)")
+    print(f"  Mean per company: {summary['mean_company_s']:.2f}s; retried: {summary['retried']}")
+    if summary['failed']:
+        print(f"⚠️  {summary['failed']} companies failed:")
+        for ticker, period, error in summary['failures'][:10]:
+            print(f"  • {ticker} {period}: {error}")
+    print(f"✓ Output: {output_dir}/ (results in batch_results.jsonl)")
+    print("=" * 60)
+    return summary
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="re-run every stage")
+    parser.add_argument("--batch", metavar="MANIFEST", help="JSON/JSON-lines manifest of companies to process")
+    parser.add_argument("--workers", type=int, default=None, help="batch worker processes (default: CPU count)")
+    parser.add_argument("--retries", type=int, default=1, help="retries per failed company")
+    parser.add_argument("--store", default=None, help="shared vector store directory for batch retrieval")
+    parser.add_argument("--output-dir", default="output/batch", help="batch MD&A output directory")
+    parser.add_argument("--trace", metavar="PATH", help="write a JSON-lines trace (same as MDA_TRACE=PATH)")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.configure(args.trace)
+    if args.batch:
+        run_batch(args.batch, args.workers, args.retries, args.store, args.output_dir)
+    else:
+        main(force=args.force)
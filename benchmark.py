@@ -0,0 +1,251 @@
+"""
+Benchmark suite: time every pipeline stage on synthetic data at several
+scales and write machine-readable JSON for comparing runs.
+
+    python benchmark.py --scales small,medium --output bench/latest.json
+    python benchmark.py --compare bench/baseline.json --output bench/latest.json
+
+With --compare, benchmarks slower than the baseline by more than
+--threshold are reported and the exit code is 1.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from pipeline_engine import load_stage_module
+
+# Statement size (tickers x quarters), filing size (sections x words) and
+# vector store size (chunks, queries) per scale
+SCALES = {
+    'small': {'tickers': 10, 'quarters': 12, 'sections': 3, 'words': 20_000, 'queries': 50},
+    'medium': {'tickers': 200, 'quarters': 20, 'sections': 5, 'words': 200_000, 'queries': 100},
+    'large': {'tickers': 2000, 'quarters': 40, 'sections': 10, 'words': 1_000_000, 'queries': 200},
+}
+
+_VOCABULARY = (
+    "revenue growth enterprise customers contracts margin operating cash flow liquidity "
+    "credit facility capital expenditure risk competition regulation privacy supply chain "
+    "vendor diversification segment subscription services support guidance quarter fiscal"
+).split()
+
+
+def synthetic_statements(n_tickers: int, n_quarters: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Income, balance and cashflow statements for `n_tickers` x `n_quarters` (long format)."""
+    rng = np.random.default_rng(seed)
+    tickers = np.repeat([f"T{i:05d}" for i in range(n_tickers)], n_quarters)
+    period = np.tile(np.arange(n_quarters), n_tickers) + 2010 * 4
+    quarters = [f"Q{p % 4 + 1} {p // 4}" for p in period]
+    n = len(tickers)
+    
+    growth = 1 + rng.normal(0.02, 0.03, n)
+    revenue = 1000 * rng.uniform(1, 100, n_tickers).repeat(n_quarters) * np.cumprod(
+        growth.reshape(n_tickers, n_quarters), axis=1).ravel()
+    equity = revenue * rng.uniform(3, 8, n)
+    liabilities = equity * rng.uniform(0.2, 1.5, n)
+    return {
+        'income': pd.DataFrame({
+            'Ticker': tickers, 'Quarter': quarters, 'Revenue': revenue,
+            'COGS': revenue * rng.uniform(0.3, 0.6, n),
+            'Operating_Expense': revenue * rng.uniform(0.1, 0.3, n),
+            'Net_Income': revenue * rng.uniform(0.05, 0.3, n),
+            'EPS': rng.uniform(0.1, 5, n),
+        }),
+        'balance': pd.DataFrame({
+            'Ticker': tickers, 'Quarter': quarters,
+            'Total_Assets': equity + liabilities, 'Total_Liabilities': liabilities,
+            'Shareholders_Equity': equity, 'Current_Ratio': rng.uniform(0.8, 3, n),
+        }),
+        'cashflow': pd.DataFrame({
+            'Ticker': tickers, 'Quarter': quarters,
+            'Operating_Cash_Flow': revenue * rng.uniform(0.1, 0.3, n),
+            'Investing_Cash_Flow': -revenue * rng.uniform(0.02, 0.1, n),
+            'Financing_Cash_Flow': revenue * rng.normal(0, 0.05, n),
+        }),
+    }
+
+
+def synthetic_filings(n_sections: int, words_per_section: int, seed: int = 0) -> Dict[str, str]:
+    """Filing sections of random vocabulary words with sentence breaks and figures."""
+    rng = np.random.default_rng(seed)
+    names = ['Item_1_Business', 'Item_1A_Risk_Factors', 'Item_7_MD&A', 'Item_7A_Market_Risk']
+    vocabulary = np.array(_VOCABULARY + [f"${x}M" for x in range(1, 200)] + [f"{x}%" for x in range(1, 100)])
+    filings = {}
+    for i in range(n_sections):
+        words = vocabulary[rng.integers(0, len(vocabulary), words_per_section)]
+        words[rng.integers(0, words_per_section, words_per_section // 15)] = "results."
+        filings[f"{names[i % len(names)]}_{i}"] = ' '.join(words.tolist())
+    return filings
+
+
+class BenchmarkSuite:
+    """Best-of-`repeat` timings for each pipeline stage at each scale."""
+    
+    def __init__(self, repeat: int = 3, seed: int = 0):
+        self.repeat = repeat
+        self.seed = seed
+        self.setup_data = load_stage_module("1_setup_data.py")
+        self.rag = load_stage_module("2_rag_pipeline.py")
+        self.mda = load_stage_module("3_mda_generator.py")
+        self.results = []
+    
+    def _time(self, scale: str, name: str, fn: Callable, items: int, unit: str,
+              setup: Optional[Callable] = None) -> List:
+        """
+        Record the best wall time of `fn` (after `setup`, untimed) and its
+        peak traced memory. Returns what `fn` returned on each timed run;
+        the extra run under tracemalloc is slower and is left out.
+        """
+        times, returned = [], []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            t0 = time.perf_counter()
+            returned.append(fn())
+            times.append(time.perf_counter() - t0)
+        
+        tracemalloc.start()
+        if setup is not None:
+            setup()
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        
+        best = min(times)
+        self.results.append({
+            'scale': scale,
+            'benchmark': name,
+            'seconds': best,
+            'median_seconds': float(np.median(times)),
+            'items': items,
+            'unit': unit,
+            'items_per_s': items / best if best > 0 else None,
+            'peak_mb': peak / 1e6,
+        })
+        print(f"  {name:<28} {best * 1000:10.1f} ms  {items / best if best > 0 else 0:14,.0f} {unit}/s")
+        return returned
+    
+    def run_scale(self, scale: str, params: Dict):
+        print(f"\n⏱️  Scale '{scale}': {params}")
+        statements = synthetic_statements(params['tickers'], params['quarters'], self.seed)
+        rows = params['tickers'] * params['quarters']
+        
+        processor = self.setup_data.FinancialDataProcessor()
+        processor.statements = statements
+        ticker = statements['income']['Ticker'].iloc[0]
+        self._time(scale, 'compute_kpis', lambda: processor.compute_kpis(ticker=ticker), rows, 'rows')
+        self._time(scale, 'compute_yoy_qoq_deltas', processor.compute_yoy_qoq_deltas, 3 * rows, 'rows')
+        
+        filings = synthetic_filings(params['sections'], params['words'], self.seed)
+        words = params['sections'] * params['words']
+        chunker = self.rag.FilingChunker()
+        self._time(scale, 'process_filings', lambda: chunker.process_filings(filings), words, 'words')
+        chunks = chunker.chunks
+        
+        engine = self.rag.EmbeddingEngine()
+        self._time(scale, 'embed_chunks', lambda: engine.embed_chunks(chunks), len(chunks), 'chunks')
+        embeddings = engine.embed_chunks(chunks)
+        
+        state = {}
+        
+        def fresh_store():
+            state['store'] = self.rag.ChromaDBVectorStore(dim=embeddings.shape[1])
+        
+        self._time(scale, 'add_documents', lambda: state['store'].add_documents(chunks, embeddings),
+                   len(chunks), 'chunks', setup=fresh_store)
+        store = state['store']
+        
+        rng = np.random.default_rng(self.seed)
+        queries = embeddings[rng.integers(0, len(embeddings), params['queries'])]
+        
+        def retrieve_all():
+            latencies = []
+            for q in queries:
+                t0 = time.perf_counter()
+                store.retrieve_similar(q, top_k=5)
+                latencies.append(time.perf_counter() - t0)
+            return latencies
+        
+        runs = self._time(scale, 'retrieve_similar', retrieve_all, len(queries), 'queries')
+        latencies = np.concatenate(runs)
+        self.results[-1]['p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+        self.results[-1]['p95_ms'] = float(np.percentile(latencies, 95) * 1000)
+        
+        retriever = self.rag.HybridRetriever(store, engine)
+        kpis = processor.compute_kpis(ticker=ticker)
+        generator = self.mda.MDAndAGenerator(kpis, chunks, retriever=retriever)
+        self._time(scale, 'generate_full_mda', generator.generate_full_mda, 1, 'documents')
+    
+    def run(self, scales: List[str]) -> Dict:
+        for scale in scales:
+            self.run_scale(scale, SCALES[scale])
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'platform': platform.platform(),
+                'repeat': self.repeat,
+                'seed': self.seed,
+            },
+            'results': self.results,
+        }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 1.25) -> List[Dict]:
+    """Benchmarks whose best time grew by more than `threshold` x against the baseline."""
+    previous = {(r['scale'], r['benchmark']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        before = previous.get((r['scale'], r['benchmark']))
+        if before and r['seconds'] > before * threshold:
+            regressions.append({'scale': r['scale'], 'benchmark': r['benchmark'],
+                                'baseline_s': before, 'current_s': r['seconds'],
+                                'ratio': r['seconds'] / before})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="small,medium", help=f"comma-separated from {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench/latest.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="previous results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression")
+    args = parser.parse_args()
+    
+    scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+    
+    report = BenchmarkSuite(repeat=args.repeat).run(scales)
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n⚠️  {len(regressions)} regression(s) over {args.threshold:.2f}x:")
+            for r in regressions:
+                print(f"  • {r['scale']}/{r['benchmark']}: {r['baseline_s'] * 1000:.1f} ms → "
+                      f"{r['current_s'] * 1000:.1f} ms ({r['ratio']:.2f}x)")
+            sys.exit(1)
+        print("✓ No regressions against baseline")
@@ -0,0 +1,355 @@
+"""
+Instrumentation: spans, counters and latency samples written to a JSON-lines
+trace, plus stage progress events for the UI.
+
+Tracing is off unless the MDA_TRACE environment variable is set, either to
+a trace file path or to "1" for data/trace.jsonl. MDA_TRACE_MALLOC=1 also
+records the tracemalloc peak of each outermost span (nested spans fall
+within it), which slows Python allocation down, so it is separate. When
+tracing is off, `span` returns a shared no-op context manager and
+`count`/`observe` return after one attribute check. Samples behind the
+summary percentiles are kept in fixed-size reservoirs, so a resident
+service doesn't accumulate them.
+
+Stage progress events (STAGES, matching processing-status.tsx) are always
+sent to listeners, traced or not. Progress only moves forward through
+STAGES, so stages that run concurrently still read as one sequence.
+Listeners are either global (`add_listener`) or scoped to one job with
+`with tracer.progress(callback):`, which follows the job's context into
+asyncio tasks and `asyncio.to_thread` calls.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage keys and the labels processing-status.tsx displays, in order
+STAGES = {
+    'validate': "Validating financial statements...",
+    'kpis': "Computing KPIs and deltas...",
+    'embeddings': "Generating embeddings...",
+    'index': "Creating RAG index...",
+    'mda': "Generating MD&A narrative...",
+    'complete': "Complete!",
+}
+
+_STAGE_ORDER = {key: i for i, key in enumerate(STAGES)}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_current_progress = contextvars.ContextVar('current_progress', default=None)
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size (Linux), else None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Reservoir:
+    """Uniform sample of at most `size` values (algorithm R), plus the exact count and max."""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.max = float('-inf')
+    
+    def add(self, value: float):
+        self.count += 1
+        self.max = max(self.max, value)
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.size:
+                self.values[slot] = value
+
+
+class _Progress:
+    """Listeners plus the furthest stage reached so far."""
+    
+    def __init__(self, listeners: Optional[List[Callable[[str], None]]] = None):
+        self.listeners = listeners or []
+        self.position = -1
+        self.lock = threading.Lock()
+    
+    def advance(self, key: str) -> bool:
+        order = _STAGE_ORDER.get(key)
+        with self.lock:
+            if order is not None:
+                if order <= self.position:
+                    return False
+                self.position = order
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(STAGES.get(key, key))
+        return True
+
+
+class _Span:
+    def __init__(self, tracer: 'Tracer', name: str, stage: Optional[str], attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.stage = stage
+        self.attrs = attrs
+        self.span_id = next(tracer._ids)
+        self._token = None
+        self._malloc_owner = False
+    
+    def set(self, **attrs):
+        """Attach attributes (e.g. result sizes) to the span record."""
+        self.attrs.update(attrs)
+    
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self.span_id)
+        if self.tracer.trace_malloc:
+            self._malloc_owner = self.tracer._start_malloc()
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass  # closed from another context, e.g. an async generator finalized elsewhere
+        rss = _rss_mb()
+        record = {
+            'type': 'span',
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent': self.parent,
+            'stage': self.stage,
+            'start': self.start,
+            'duration_ms': duration * 1000,
+            'rss_mb': rss,
+            'peak_rss_mb': max(_peak_rss_mb(), rss or 0.0),
+            'pid': os.getpid(),
+        }
+        if self.tracer.trace_malloc:
+            peak = self.tracer._stop_malloc(self._malloc_owner)
+            if peak is not None:
+                record['tracemalloc_peak_mb'] = peak
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        record.update(self.attrs)
+        self.tracer.observe(f"{self.name}_ms", duration * 1000)
+        self.tracer._write(record)
+        return False
+
+
+class Tracer:
+    """Collects spans, counters and samples; see the module docstring."""
+    
+    def __init__(self, path: Optional[str] = None, enabled: bool = False, trace_malloc: bool = False,
+                 max_samples: int = 4096):
+        self.enabled = enabled
+        self.path = Path(path) if path else Path("data/trace.jsonl")
+        self.trace_malloc = trace_malloc
+        self.counters = {}
+        self.samples = {}
+        self.max_samples = max_samples
+        self._progress = _Progress()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = None
+        self._malloc_depth = 0
+        self._dirty = False
+    
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        setting = os.environ.get('MDA_TRACE', '')
+        enabled = setting not in ('', '0', 'false', 'off')
+        path = setting if enabled and setting not in ('1', 'true', 'on') else None
+        return cls(path, enabled, trace_malloc=os.environ.get('MDA_TRACE_MALLOC') == '1')
+    
+    def configure(self, path: Optional[str] = None, enabled: bool = True, trace_malloc: Optional[bool] = None):
+        """Switch tracing on/off at runtime (modules keep the same tracer object)."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if path:
+                self.path = Path(path)
+            self.enabled = enabled
+            if trace_malloc is not None:
+                self.trace_malloc = trace_malloc
+    
+    # --- recording -------------------------------------------------------
+    
+    def span(self, name: str, stage: Optional[str] = None, **attrs):
+        """
+        Context manager timing a block. `stage` (a STAGES key) also reports
+        progress to listeners when the block starts.
+        """
+        if stage is not None:
+            self.stage(stage)
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, stage, attrs)
+    
+    def timed(self, name: Optional[str] = None, stage: Optional[str] = None):
+        """Decorator form of `span` for plain functions."""
+        def decorate(fn):
+            span_name = name or fn.__qualname__
+            
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+    
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self._dirty = True
+    
+    def observe(self, name: str, value: float):
+        """Record one sample (e.g. a latency in ms) for percentile summaries."""
+        if not self.enabled:
+            return
+        with self._lock:
+            reservoir = self.samples.get(name)
+            if reservoir is None:
+                reservoir = self.samples[name] = _Reservoir(self.max_samples)
+            reservoir.add(value)
+            self._dirty = True
+    
+    def stage(self, key: str):
+        """Report that the pipeline entered a UI stage; stages already passed are ignored."""
+        progress = _current_progress.get() or self._progress
+        if progress.advance(key) and self.enabled:
+            self._write({'type': 'stage', 'stage': STAGES.get(key, key), 'key': key,
+                         'time': time.time(), 'pid': os.getpid()})
+    
+    def reset_stage(self):
+        """Start progress from the first stage again (e.g. for a new pipeline run)."""
+        progress = _current_progress.get() or self._progress
+        with progress.lock:
+            progress.position = -1
+    
+    @contextlib.contextmanager
+    def progress(self, listener: Callable[[str], None]):
+        """Send stage events raised inside the block (this context only) to `listener`."""
+        token = _current_progress.set(_Progress([listener]))
+        try:
+            yield
+        finally:
+            _current_progress.reset(token)
+    
+    def add_listener(self, listener: Callable[[str], None]):
+        with self._progress.lock:
+            self._progress.listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[str], None]):
+        with self._progress.lock:
+            if listener in self._progress.listeners:
+                self._progress.listeners.remove(listener)
+    
+    # --- output ----------------------------------------------------------
+    
+    def _write(self, record: Dict):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', buffering=1)
+            self._file.write(line)
+    
+    def _start_malloc(self) -> bool:
+        """Start tracing for the outermost open span; True when the caller owns the peak."""
+        with self._lock:
+            self._malloc_depth += 1
+            if self._malloc_depth > 1:
+                return False  # resetting the peak here would clobber the enclosing span's
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            return True
+    
+    def _stop_malloc(self, owner: bool) -> Optional[float]:
+        with self._lock:
+            peak = tracemalloc.get_traced_memory()[1] / 1e6 if owner else None
+            self._malloc_depth -= 1
+            if self._malloc_depth == 0:
+                tracemalloc.stop()
+            return peak
+    
+    @staticmethod
+    def _percentiles(values: List[float], count: int, maximum: float) -> Dict[str, float]:
+        ordered = sorted(values)
+        
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+        return {'count': count, 'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'max': maximum}
+    
+    def summary(self) -> Dict:
+        """Counters, sample percentiles and peak RSS so far."""
+        with self._lock:
+            counters = dict(self.counters)
+            samples = {name: (list(r.values), r.count, r.max) for name, r in self.samples.items()}
+        return {
+            'counters': counters,
+            'percentiles': {name: self._percentiles(*s) for name, s in samples.items() if s[0]},
+            'peak_rss_mb': _peak_rss_mb(),
+        }
+    
+    def flush(self):
+        """Append a summary record to the trace."""
+        if self.enabled:
+            self._dirty = False
+            self._write({'type': 'summary', 'time': time.time(), 'pid': os.getpid(), **self.summary()})
+
+
+tracer = Tracer.from_env()
+
+
+@atexit.register
+def _flush_at_exit():
+    if tracer.enabled and tracer._dirty:
+        tracer.flush()
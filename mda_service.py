@@ -0,0 +1,507 @@
+"""
+Resident MD&A service: a local HTTP API for the upload frontend.
+
+Pandas/numpy, the pipeline scripts, the vector store (memory-mapped, BM25
+index included), the embedder and the LLM client/cache are loaded when
+the service starts, so a request only pays for its own work.
+
+    python mda_service.py --port 8765 --workers 2
+
+Endpoints:
+    POST /api/jobs                  submit statements/filings (multipart or JSON) -> 202 + job
+    POST /api/process-financials    same, for the upload form's existing route
+    GET  /api/jobs/<id>             job state, current stage and timings
+    GET  /api/jobs/<id>/events      stage progress and finished sections as Server-Sent Events
+    GET  /api/jobs/<id>/mda         the generated MD&A (text/markdown)
+    GET  /api/health                queue depth, workers and what is loaded
+
+Multipart uploads take CSV, Excel or Parquet files named income/balance/
+cashflow, or one combined statement file named "file" (as
+file-upload-dropzone.tsx sends), plus optional "filing" files (whole
+10-Ks) and ticker/period fields. JSON bodies
+use {"ticker", "period", "statements": {name: csv text} or csv text,
+"filings": {section: text}, "documents": [10-K text, ...]}.
+
+Jobs wait in a bounded queue (503 when full) and `workers` of them run at
+once; stage events use the labels processing-status.tsx displays.
+"""
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import importlib.util
+import json
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from instrumentation import STAGES, tracer
+from pipeline_engine import load_stage_module
+
+
+class HTTPError(Exception):
+    """An error answered with `status` and a JSON {"error": message} body."""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+_REASONS = {200: "OK", 202: "Accepted", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+            415: "Unsupported Media Type", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class Job:
+    """One submitted company: its inputs, state and the events streamed to clients."""
+    
+    def __init__(self, job_id: str, ticker: Optional[str], period: Optional[str],
+                 statements: Optional[Dict[str, str]], filings: Dict[str, str], documents: List[str]):
+        self.id = job_id
+        self.ticker = ticker
+        self.period = period
+        self.statements = statements
+        self.filings = filings
+        self.documents = documents
+        self.state = 'queued'
+        self.stage = None
+        self.error = None
+        self.output = None
+        self.mda = None
+        self.events = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._changed = asyncio.Event()
+    
+    @property
+    def done(self) -> bool:
+        return self.state in ('succeeded', 'failed')
+    
+    def publish(self, event: Dict):
+        """Record an event and wake every stream waiting on this job (event loop thread only)."""
+        event = {'time': time.time(), **event}
+        if event['event'] == 'stage':
+            self.stage = event['stage']
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    async def wait_events(self, start: int, timeout: float) -> List[Dict]:
+        """Events from index `start` on, waiting up to `timeout` seconds for new ones."""
+        if len(self.events) <= start and not self.done:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.events[start:]
+    
+    def finish(self, state: str, error: Optional[str] = None):
+        self.state = state
+        self.error = error
+        self.finished = time.time()
+        self.publish({'event': 'done', 'state': state, 'error': error})
+    
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'ticker': self.ticker,
+            'period': self.period,
+            'state': self.state,
+            'stage': self.stage,
+            'error': self.error,
+            'queued_s': (self.started or time.time()) - self.created,
+            'run_s': ((self.finished or time.time()) - self.started) if self.started else None,
+            'status_url': f"/api/jobs/{self.id}",
+            'events_url': f"/api/jobs/{self.id}/events",
+            'mda_url': f"/api/jobs/{self.id}/mda",
+        }
+
+
+class MDAService:
+    """
+    Warm state plus a job queue served over HTTP on asyncio streams.
+
+    Loading and chunking a job's statements and filings runs in a worker
+    thread, as do retrieval and LLM cache lookups; section generation runs
+    on the event loop, so LLM calls from every job share one concurrency
+    limit (`llm_concurrency`).
+    """
+    
+    STATEMENT_SUFFIXES = ('.csv', '.parquet', '.xlsx', '.xls', '')
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, workers: int = 2,
+                 queue_size: int = 64, store_dir: Optional[str] = "data/vector_store",
+                 jobs_dir: str = "data/jobs", output_dir: str = "output/jobs", data_dir: str = "data",
+                 llm_url: Optional[str] = None, llm_cache: Optional[str] = None,
+                 llm_concurrency: int = 8, chunk_size: int = 500, overlap: int = 100,
+                 max_body: int = 64 * 1024 * 1024, max_jobs: int = 1000, cors_origin: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.store_dir = store_dir
+        self.jobs_dir = Path(jobs_dir)
+        self.output_dir = Path(output_dir)
+        self.data_dir = data_dir
+        self.llm_url = llm_url
+        self.llm_cache = llm_cache
+        self.llm_concurrency = llm_concurrency
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.max_body = max_body
+        self.max_jobs = max_jobs
+        self.cors_origin = cors_origin
+        self.jobs = {}
+        self.queue = None
+        self._server = None
+        self._tasks = []
+        self.startup_seconds = None
+    
+    # --- lifecycle -------------------------------------------------------
+    
+    def load(self):
+        """Import the pipeline scripts and open everything shared between jobs."""
+        t0 = time.perf_counter()
+        self.setup_data = load_stage_module("1_setup_data.py")
+        self.rag = load_stage_module("2_rag_pipeline.py")
+        self.mda = load_stage_module("3_mda_generator.py")
+        self.embedder = self.rag.HashingEmbedder()
+        self.retriever = None
+        if self.store_dir and Path(self.store_dir, "store.json").exists():
+            store = self.rag.ChromaDBVectorStore.open(self.store_dir)
+            self.retriever = self.rag.HybridRetriever(store, self.rag.EmbeddingEngine(self.embedder))
+        self.llm = self.mda.HTTPLLMClient(self.llm_url) if self.llm_url else None
+        self.cache = self.mda.LLMResponseCache(self.llm_cache) if self.llm_cache else None
+        self.startup_seconds = time.perf_counter() - t0
+    
+    async def start(self) -> str:
+        """Load warm state, start the workers and listen; returns the base URL."""
+        await asyncio.to_thread(self.load)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.semaphore = asyncio.Semaphore(self.llm_concurrency)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://{self.host}:{self.port}"
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    async def serve_forever(self):
+        url = await self.start()
+        store = f"{len(self.retriever.store)} chunks" if self.retriever is not None else "none"
+        print(f"🚀 MD&A service on {url} ({self.workers} workers, queue {self.queue_size})")
+        print(f"   Warm state loaded in {self.startup_seconds:.2f}s; shared store: {store}")
+        async with self._server:
+            await self._server.serve_forever()
+    
+    # --- jobs --------------------------------------------------------------
+    
+    def submit(self, job: Job) -> Job:
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPError(503, f"Job queue is full ({self.queue_size} waiting)")
+        self.jobs[job.id] = job
+        finished = [j for j in self.jobs.values() if j.done]
+        for old in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[old.id]
+        return job
+    
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self.queue.task_done()
+    
+    async def _run_job(self, job: Job):
+        loop = asyncio.get_running_loop()
+        job.state, job.started = 'running', time.time()
+        
+        def on_stage(label: str):
+            loop.call_soon_threadsafe(job.publish, {'event': 'stage', 'stage': label})
+        
+        def on_section(key: str, section: Dict):
+            job.publish({'event': 'section', 'key': key, 'title': section['title'],
+                         'markdown': section['narrative'], 'citations': section['citations']})
+        
+        with tracer.progress(on_stage):
+            try:
+                with tracer.span('service_job', job_id=job.id, ticker=job.ticker):
+                    generator = await asyncio.to_thread(self._prepare, job)
+                    tracer.stage('mda')
+                    job.output = await generator.awrite_mda(self.output_dir / f"{job.id}.md", on_section)
+                job.mda = job.output.read_text()
+                tracer.stage('complete')
+                state, error = 'succeeded', None
+            except Exception as e:
+                state, error = 'failed', f"{type(e).__name__}: {e}"
+        # Stage events are queued with call_soon_threadsafe; let them land before the final one
+        await asyncio.sleep(0)
+        job.finish(state, error)
+    
+    def _prepare(self, job: Job):
+        """Statements -> KPIs and filings -> retriever, in a worker thread; returns the generator."""
+        rag = self.rag
+        processor = self.setup_data.FinancialDataProcessor(data_dir=self.data_dir)
+        tracer.stage('validate')
+        if job.statements:
+            processor.load_statements(job.statements, ticker=job.ticker)
+        else:
+            processor.load_sample_data()
+        tracer.stage('kpis')
+        try:
+            kpis = processor.compute_kpis(job.period)
+        except KeyError as e:
+            raise ValueError(f"Statements are missing column {e}") from None
+        
+        chunker = rag.FilingChunker(chunk_size=self.chunk_size, overlap=self.overlap)
+        tracer.stage('embeddings')
+        chunks = rag.ChunkTable.from_chunks(chunker.iter_filings(
+            {section: Path(path) for section, path in job.filings.items()}
+        ))
+        for document in job.documents:
+            chunks.extend(chunker.iter_filing_document(Path(document)))
+        
+        filters = None
+        if len(chunks):
+            retriever = rag.HybridRetriever(rag.ChromaDBVectorStore(), rag.EmbeddingEngine(self.embedder))
+            retriever.add_chunks(chunks)
+        elif self.retriever is not None:
+            # No filings uploaded: cite the shared store, narrowed to the ticker when given
+            retriever, chunks = self.retriever, self.retriever.store.chunks
+            filters = {'ticker': job.ticker} if job.ticker else None
+        else:
+            retriever = None
+        tracer.stage('index')
+        return self.mda.MDAndAGenerator(kpis, chunks, llm=self.llm, cache=self.cache,
+                                        semaphore=self.semaphore, retriever=retriever, filters=filters)
+    
+    # --- request parsing ---------------------------------------------------
+    
+    def _save_upload(self, job_dir: Path, name: str, filename: Optional[str], data: bytes) -> str:
+        """Write one uploaded statement or filing under the job's directory; returns its path."""
+        suffix = Path(filename or '').suffix.lower()
+        if name == 'filing':
+            path = job_dir / f"filing_{len(list(job_dir.glob('filing_*')))}{suffix or '.txt'}"
+        elif name not in (names := (*self.setup_data.FinancialDataProcessor.STATEMENTS, 'file')):
+            # `name` comes from the client and becomes a file name: only accept known ones
+            raise HTTPError(400, f"Unknown upload {name!r}; expected one of {', '.join(names)}")
+        elif suffix in self.STATEMENT_SUFFIXES:
+            if suffix in ('.xlsx', '.xls') and importlib.util.find_spec('openpyxl') is None:
+                raise HTTPError(415, "Excel uploads need openpyxl installed on the server; send CSV instead")
+            path = job_dir / f"{name}{suffix or '.csv'}"
+        else:
+            raise HTTPError(415, f"Statements must be CSV, Excel or Parquet, got {filename}")
+        job_dir.mkdir(parents=True, exist_ok=True)
+        if path.resolve().parent != job_dir.resolve():
+            raise HTTPError(400, f"Invalid upload name {name!r}")
+        path.write_bytes(data)
+        return str(path)
+    
+    def _create_job(self, headers: Dict[str, str], body: bytes) -> Job:
+        """Parse and queue a submission; its uploads are removed again if it is rejected."""
+        if self.queue.full():
+            raise HTTPError(503, f"Job queue is full ({self.queue_size} waiting)")
+        job_id = uuid.uuid4().hex[:12]
+        try:
+            return self.submit(self._parse_job(job_id, headers, body))
+        except BaseException:
+            shutil.rmtree(self.jobs_dir / job_id, ignore_errors=True)
+            raise
+    
+    def _parse_job(self, job_id: str, headers: Dict[str, str], body: bytes) -> Job:
+        job_dir = self.jobs_dir / job_id
+        content_type = headers.get('content-type', '')
+        fields, statements, filings, documents = {}, {}, {}, []
+        
+        if content_type.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            if not message.is_multipart():
+                raise HTTPError(400, "Malformed multipart body")
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                data = part.get_payload(decode=True) or b''
+                if part.get_filename() is None:
+                    fields[name] = data.decode('utf-8', errors='replace').strip()
+                elif name == 'filing':
+                    documents.append(self._save_upload(job_dir, name, part.get_filename(), data))
+                else:
+                    statements[name] = self._save_upload(job_dir, name, part.get_filename(), data)
+        elif content_type.startswith('application/json'):
+            try:
+                request = json.loads(body or b'{}')
+            except json.JSONDecodeError as e:
+                raise HTTPError(400, f"Invalid JSON: {e}")
+            fields = {k: request.get(k) for k in ('ticker', 'period')}
+            given = request.get('statements')
+            if isinstance(given, str):
+                statements['file'] = self._save_upload(job_dir, 'file', None, given.encode())
+            elif given:
+                for name, text in given.items():
+                    statements[name] = self._save_upload(job_dir, name, None, text.encode())
+            for section, text in (request.get('filings') or {}).items():
+                job_dir.mkdir(parents=True, exist_ok=True)
+                path = job_dir / f"section_{len(filings)}.txt"
+                path.write_text(text)
+                filings[section] = str(path)
+            for text in request.get('documents') or []:
+                documents.append(self._save_upload(job_dir, 'filing', None, text.encode()))
+        elif body:
+            raise HTTPError(415, f"Unsupported content type {content_type!r}")
+        
+        names = self.setup_data.FinancialDataProcessor.STATEMENTS
+        if 'file' in statements:
+            # One combined file: KPIEngine picks each statement's columns by name
+            statements = {name: statements['file'] for name in names}
+        elif statements and set(statements) != set(names):
+            raise HTTPError(400, f"Upload all of {', '.join(names)} or one combined 'file'")
+        return Job(job_id, fields.get('ticker') or None, fields.get('period') or None,
+                   statements or None, filings, documents)
+    
+    # --- HTTP --------------------------------------------------------------
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = await reader.readline()
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(400, f"Invalid Content-Length {headers['content-length']!r}")
+        if length > self.max_body:
+            raise HTTPError(413, f"Body larger than {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return parts[0].upper(), parts[1].split('?', 1)[0], headers, body
+    
+    def _headers(self, status: int, content_type: str, length: Optional[int] = None) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                 "Cache-Control: no-store", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        if self.cors_origin:
+            lines += [f"Access-Control-Allow-Origin: {self.cors_origin}",
+                      "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+                      "Access-Control-Allow-Headers: Content-Type"]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload,
+                       content_type: str = "application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        writer.write(self._headers(status, content_type, len(body)) + body)
+        await writer.drain()
+    
+    async def _stream_events(self, writer: asyncio.StreamWriter, job: Job, heartbeat: float = 15.0):
+        """Replay the job's events, then follow it as Server-Sent Events until it finishes."""
+        writer.write(self._headers(200, "text/event-stream"))
+        sent = 0
+        while True:
+            events = await job.wait_events(sent, heartbeat)
+            if not events:
+                writer.write(b": keep-alive\n\n")
+            for event in events:
+                writer.write(f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode())
+            sent += len(events)
+            await writer.drain()
+            if job.done and sent == len(job.events):
+                return
+    
+    def _job(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"No job {job_id}")
+        return job
+    
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str,
+                     headers: Dict[str, str], body: bytes):
+        parts = [p for p in path.split('/') if p]
+        if method == 'OPTIONS':
+            writer.write(self._headers(204, "text/plain", 0))
+            return
+        if parts == ['api', 'health']:
+            return await self._respond(writer, 200, {
+                'status': 'ok',
+                'workers': self.workers,
+                'queued': self.queue.qsize(),
+                'running': sum(j.state == 'running' for j in self.jobs.values()),
+                'jobs': len(self.jobs),
+                'store_chunks': len(self.retriever.store) if self.retriever is not None else 0,
+                'llm': self.llm_url,
+                'startup_seconds': self.startup_seconds,
+                'stages': list(STAGES.values()),
+            })
+        if parts in (['api', 'jobs'], ['api', 'process-financials']):
+            if method != 'POST':
+                raise HTTPError(405, "Use POST to submit a job")
+            job = self._create_job(headers, body)
+            return await self._respond(writer, 202, job.to_dict())
+        if len(parts) in (3, 4) and parts[:2] == ['api', 'jobs'] and method == 'GET':
+            job = self._job(parts[2])
+            if len(parts) == 3:
+                return await self._respond(writer, 200, job.to_dict())
+            if parts[3] == 'events':
+                return await self._stream_events(writer, job)
+            if parts[3] == 'mda':
+                if job.state == 'failed':
+                    raise HTTPError(500, job.error)
+                if job.mda is None:
+                    raise HTTPError(409, f"Job {job.id} is {job.state}")
+                return await self._respond(writer, 200, job.mda.encode(), "text/markdown; charset=utf-8")
+        raise HTTPError(404, f"No route for {method} {path}")
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            await self._route(writer, method, path, headers, body)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {'error': str(e)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # client went away
+        except Exception as e:
+            await self._respond(writer, 500, {'error': f"{type(e).__name__}: {e}"})
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="jobs processed at once")
+    parser.add_argument("--queue-size", type=int, default=64, help="jobs waiting before submissions get 503")
+    parser.add_argument("--store", default="data/vector_store", help="shared vector store (cited when no filings are uploaded)")
+    parser.add_argument("--llm-url", default=None, help="completion endpoint (default: built-in templates)")
+    parser.add_argument("--llm-cache", default=None, help="SQLite LLM response cache path")
+    parser.add_argument("--cors-origin", default=None, help="allow browser calls from this origin")
+    args = parser.parse_args()
+    
+    service = MDAService(host=args.host, port=args.port, workers=args.workers, queue_size=args.queue_size,
+                         store_dir=args.store, llm_url=args.llm_url, llm_cache=args.llm_cache,
+                         cors_origin=args.cors_origin)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("\n✓ Service stopped")
@@ -0,0 +1,412 @@
+"""
+Pipeline engine: a small DAG of file-based stages with content-addressed
+skipping, and a process-pool batch runner, used by 4_run_pipeline.py.
+
+Each stage declares the files/directories it reads and writes. A stage's
+key is a hash of its name, parameters and the content of every input;
+when the key and the recorded output hashes match the previous run, the
+stage is skipped. Stages whose inputs don't depend on each other run
+concurrently.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from instrumentation import tracer
+
+_MODULES = {}
+_MODULES_LOCK = threading.Lock()
+
+
+def load_stage_module(filename: str):
+    """
+    Import one of the numbered pipeline scripts (e.g. "2_rag_pipeline.py"),
+    which can't be imported by name. Modules are loaded once per process.
+    """
+    path = (Path(__file__).parent / filename).resolve()
+    with _MODULES_LOCK:
+        module = _MODULES.get(path)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(path.stem, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _MODULES[path] = module
+    return module
+
+
+class StageError(Exception):
+    """Raised when a stage fails or its declared inputs are missing."""
+
+
+class Stage:
+    """One unit of work: `fn()` reads `inputs` and writes `outputs` (paths)."""
+    
+    def __init__(self, name: str, fn: Callable[[], None], inputs: Iterable[str] = (),
+                 outputs: Iterable[str] = (), params: Optional[Dict] = None):
+        self.name = name
+        self.fn = fn
+        self.inputs = [str(p) for p in inputs]
+        self.outputs = [str(p) for p in outputs]
+        self.params = params or {}
+
+
+class ContentHasher:
+    """
+    SHA-256 of files and directory trees. File hashes are cached by
+    (size, mtime_ns) so unchanged files are not re-read.
+    """
+    
+    def __init__(self, cache: Optional[Dict[str, List]] = None):
+        self.cache = cache if cache is not None else {}
+        self._lock = threading.Lock()
+    
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path)
+        with self._lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        value = digest.hexdigest()
+        with self._lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime_ns, value]
+        return value
+    
+    def hash_path(self, path: str) -> Optional[str]:
+        """Content hash of a file or directory (names + contents); None if missing."""
+        path = Path(path)
+        if path.is_file():
+            return self.file_hash(path)
+        if not path.is_dir():
+            return None
+        digest = hashlib.sha256()
+        for file in sorted(p for p in path.rglob('*') if p.is_file()):
+            relative = file.relative_to(path)
+            if any(part.startswith('.') for part in relative.parts):
+                continue  # scratch files such as .tmp-save
+            digest.update(str(relative).encode('utf-8'))
+            digest.update(self.file_hash(file).encode('ascii'))
+        return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    Run stages in dependency order, skipping those whose inputs are unchanged.
+    A stage depends on another when one of its inputs is that stage's output.
+    """
+    
+    def __init__(self, stages: List[Stage], state_file: str = "data/.pipeline_state.json",
+                 max_workers: int = 4):
+        self.stages = {s.name: s for s in stages}
+        self.state_file = Path(state_file)
+        self.max_workers = max_workers
+        
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                producers[output] = stage.name
+        self.dependencies = {
+            s.name: {producers[i] for i in s.inputs if i in producers and producers[i] != s.name}
+            for s in stages
+        }
+        
+        self.state = {'stages': {}, 'files': {}}
+        if self.state_file.exists():
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        self.hasher = ContentHasher(self.state.setdefault('files', {}))
+        self._state_lock = threading.Lock()
+    
+    def _stage_key(self, stage: Stage) -> str:
+        digest = hashlib.sha256(stage.name.encode('utf-8'))
+        digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode('utf-8'))
+        for path in stage.inputs:
+            content = self.hasher.hash_path(path)
+            if content is None:
+                raise StageError(f"Stage {stage.name!r} is missing input {path}")
+            digest.update(path.encode('utf-8'))
+            digest.update(content.encode('ascii'))
+        return digest.hexdigest()
+    
+    def _up_to_date(self, stage: Stage, key: str) -> bool:
+        previous = self.state['stages'].get(stage.name)
+        if not previous or previous['key'] != key:
+            return False
+        return all(self.hasher.hash_path(p) == previous['outputs'].get(p) for p in stage.outputs)
+    
+    def _save_state(self):
+        # state['files'] is the hasher's cache, which other stage threads keep
+        # filling under its own lock: dump a snapshot taken under that lock
+        with self.hasher._lock:
+            state = {**self.state, 'files': dict(self.hasher.cache)}
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_file)
+    
+    def _run_stage(self, stage: Stage, force: bool) -> Dict:
+        t0 = time.perf_counter()
+        key = self._stage_key(stage)
+        if not force and self._up_to_date(stage, key):
+            return {'status': 'skipped', 'seconds': time.perf_counter() - t0}
+        
+        try:
+            with tracer.span(f"stage.{stage.name}"):
+                stage.fn()
+        except Exception as e:
+            raise StageError(f"Stage {stage.name!r} failed: {e}") from e
+        outputs = {p: self.hasher.hash_path(p) for p in stage.outputs}
+        missing = [p for p, h in outputs.items() if h is None]
+        if missing:
+            raise StageError(f"Stage {stage.name!r} did not produce {', '.join(missing)}")
+        
+        with self._state_lock:
+            self.state['stages'][stage.name] = {'key': key, 'outputs': outputs}
+            self._save_state()
+        return {'status': 'ran', 'seconds': time.perf_counter() - t0}
+    
+    def run(self, force: bool = False) -> Dict[str, Dict]:
+        """Run every stage that is out of date; returns status and seconds per stage."""
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        failure = None
+        tracer.reset_stage()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                if failure is None:
+                    for name in [n for n in pending if self.dependencies[n] <= set(results)]:
+                        # Run in a copy of this context so spans and progress scopes carry over
+                        running[pool.submit(contextvars.copy_context().run, self._run_stage,
+                                            pending.pop(name), force)] = name
+                if not running:
+                    break
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except StageError as e:
+                        failure = failure or e
+                        continue
+                    status = results[name]
+                    mark = "↷" if status['status'] == 'skipped' else "✓"
+                    print(f"  {mark} {name}: {status['status']} ({status['seconds']:.2f}s)")
+        
+        if failure is not None:
+            raise failure
+        if pending:
+            raise StageError(f"Unsatisfiable dependencies for stages: {', '.join(sorted(pending))}")
+        
+        with self._state_lock:
+            self._save_state()  # persist hashes of inputs checked by skipped stages
+        tracer.stage('complete')
+        return results
+
+
+# --- Batch mode: many companies across a process pool ---------------------
+
+_WORKER = {}
+
+
+def _init_batch_worker(config: Dict):
+    """
+    Per-process setup: load the scripts once and open shared read-only
+    state. A shared vector store is memory-mapped, so every worker reads
+    the same pages from the OS page cache instead of receiving a pickled copy.
+    """
+    _WORKER.clear()
+    _WORKER['config'] = config
+    _WORKER['setup_data'] = load_stage_module("1_setup_data.py")
+    rag = _WORKER['rag'] = load_stage_module("2_rag_pipeline.py")
+    mda = _WORKER['mda'] = load_stage_module("3_mda_generator.py")
+    # Failures a second attempt can get past; bad input fails the same way every time
+    _WORKER['transient'] = (asyncio.TimeoutError, TimeoutError, ConnectionError,
+                            sqlite3.OperationalError, mda.LLMError)
+    if config.get('store_dir'):
+        store = rag.ChromaDBVectorStore.open(config['store_dir'])
+        _WORKER['retriever'] = rag.HybridRetriever(store, rag.EmbeddingEngine())
+    if config.get('llm_cache'):
+        _WORKER['cache'] = mda.LLMResponseCache(config['llm_cache'])
+    if config.get('llm_url'):
+        _WORKER['llm'] = mda.HTTPLLMClient(config['llm_url'])
+
+
+def _filing_sections(filings) -> Dict[str, Path]:
+    """{section: path} from a mapping, or from a list of paths named by file stem."""
+    if isinstance(filings, dict):
+        return {section: Path(p) for section, p in filings.items()}
+    return {Path(p).stem: Path(p) for p in filings}
+
+
+def _run_company(job: Dict) -> Dict:
+    config = _WORKER['config']
+    setup_data, rag, mda = _WORKER['setup_data'], _WORKER['rag'], _WORKER['mda']
+    ticker, period = job['ticker'], job['period']
+    
+    processor = setup_data.FinancialDataProcessor(data_dir=config['data_dir'])
+    if job.get('statements'):
+        processor.load_statements(job['statements'], ticker=ticker)
+    else:
+        processor.load_sample_data()
+    kpis = processor.compute_kpis(period)
+    
+    retriever, filters = _WORKER.get('retriever'), {'ticker': ticker}
+    shared_rows = retriever.store.filter_rows(filters) if retriever is not None else ()
+    if len(shared_rows):
+        # The shared store already indexes this company's filings
+        chunks = []
+    else:
+        chunker = rag.FilingChunker(chunk_size=config['chunk_size'], overlap=config['overlap'])
+        chunks = rag.ChunkTable.from_chunks(
+            dict(c, ticker=ticker, period=period)
+            for c in chunker.iter_filings(_filing_sections(job.get('filings', {})))
+        )
+        # Whole 10-K documents are split into Item sections while streaming
+        for document in job.get('documents', []):
+            chunks.extend(dict(c, ticker=ticker, period=period) for c in chunker.iter_filing_document(document))
+        retriever, filters = rag.HybridRetriever(rag.ChromaDBVectorStore(), rag.EmbeddingEngine()), None
+        retriever.add_chunks(chunks)
+    
+    generator = mda.MDAndAGenerator(kpis, chunks, llm=_WORKER.get('llm'), cache=_WORKER.get('cache'),
+                                    retriever=retriever, filters=filters)
+    output = Path(config['output_dir']) / f"{ticker}_{period.replace(' ', '_')}.md"
+    generator.write_mda(output)
+    return {'chunks': len(chunks) or len(shared_rows), 'output': str(output)}
+
+
+def _run_batch(jobs: List[Dict]) -> List[Dict]:
+    """Run a slice of the manifest in one worker, retrying each company on transient failures."""
+    config = _WORKER['config']
+    results = []
+    for job in jobs:
+        result = {'ticker': job.get('ticker'), 'period': job.get('period')}
+        t0 = time.perf_counter()
+        with tracer.span('company', ticker=result['ticker'], period=result['period']) as span:
+            for attempt in range(config['retries'] + 1):
+                try:
+                    result.update(_run_company(job), status='ok', error=None)
+                    break
+                except Exception as e:
+                    result.update(status='failed', error=f"{type(e).__name__}: {e}")
+                    if not isinstance(e, _WORKER['transient']) or attempt == config['retries']:
+                        break
+                    time.sleep(config['retry_backoff'] * 2 ** attempt)
+            span.set(status=result['status'], attempts=attempt + 1)
+        result.update(attempts=attempt + 1, seconds=time.perf_counter() - t0)
+        results.append(result)
+    # Pool workers exit without running atexit hooks, so record this worker's totals now
+    tracer.flush()
+    return results
+
+
+class BatchRunner:
+    """
+    Run the MD&A pipeline for every company in a manifest across a
+    process pool. Each manifest entry is
+    {"ticker", "period", "filings": {section: path} or [paths],
+     "documents": [whole 10-K paths], "statements": {"income", "balance",
+     "cashflow": path}} (documents and statements optional; the sample
+    data is used without statements).
+    
+    Companies are sent to workers `batch_size` at a time and only short
+    result dicts come back, keeping IPC small. Companies whose ticker the
+    shared store (`store_dir`) has chunks tagged with retrieve from it;
+    the rest are chunked and indexed on their own. Transient failures
+    (timeouts, connection and LLM errors, a locked cache) are retried up
+    to `retries` times; a company that still fails, or whose input is bad,
+    is recorded and skipped; the run carries on.
+    """
+    
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 8, retries: int = 1,
+                 retry_backoff: float = 0.5, store_dir: Optional[str] = None,
+                 output_dir: str = "output/batch", data_dir: str = "data",
+                 chunk_size: int = 500, overlap: int = 100,
+                 llm_url: Optional[str] = None, llm_cache: Optional[str] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.output_dir = Path(output_dir)
+        self.config = {
+            'retries': retries,
+            'retry_backoff': retry_backoff,
+            'store_dir': store_dir,
+            'output_dir': str(output_dir),
+            'data_dir': data_dir,
+            'chunk_size': chunk_size,
+            'overlap': overlap,
+            'llm_url': llm_url,
+            'llm_cache': llm_cache,
+        }
+        self.results = []
+    
+    @staticmethod
+    def load_manifest(path: str) -> List[Dict]:
+        """Manifest entries from a JSON list or a JSON-lines file."""
+        text = Path(path).read_text()
+        if text.lstrip().startswith('['):
+            return json.loads(text)
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    
+    def run(self, jobs: List[Dict]) -> Dict:
+        """Process every job; writes batch_results.jsonl and returns a throughput summary."""
+        t0 = time.perf_counter()
+        # Import in the parent so forked workers inherit the loaded modules
+        for filename in ("1_setup_data.py", "2_rag_pipeline.py", "3_mda_generator.py"):
+            load_stage_module(filename)
+        
+        batches = [jobs[i:i + self.batch_size] for i in range(0, len(jobs), self.batch_size)]
+        self.results = []
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_batch_worker,
+                                 initargs=(self.config,)) as pool:
+            futures = {pool.submit(_run_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    self.results.extend(future.result())
+                except Exception as e:
+                    # The worker itself died (e.g. killed or out of memory)
+                    self.results.extend(
+                        {'ticker': job.get('ticker'), 'period': job.get('period'), 'status': 'failed',
+                         'error': f"{type(e).__name__}: {e}", 'attempts': 1, 'seconds': 0.0}
+                        for job in futures[future]
+                    )
+        
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.output_dir / "batch_results.jsonl", 'w') as f:
+            for result in self.results:
+                f.write(json.dumps(result) + '\n')
+        return self.summary(time.perf_counter() - t0)
+    
+    def summary(self, seconds: float) -> Dict:
+        ok = [r for r in self.results if r['status'] == 'ok']
+        chunks = sum(r.get('chunks', 0) for r in ok)
+        return {
+            'companies': len(self.results),
+            'succeeded': len(ok),
+            'failed': len(self.results) - len(ok),
+            'retried': sum(1 for r in self.results if r['attempts'] > 1),
+            'workers': self.workers,
+            'seconds': seconds,
+            'companies_per_s': len(self.results) / seconds if seconds > 0 else 0.0,
+            'chunks': chunks,
+            'chunks_per_s': chunks / seconds if seconds > 0 else 0.0,
+            'mean_company_s': sum(r['seconds'] for r in ok) / len(ok) if ok else 0.0,
+            'failures': [(r['ticker'], r['period'], r['error']) for r in self.results if r['status'] != 'ok'],
+        }
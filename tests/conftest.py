@@ -0,0 +1,43 @@
+import hashlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline_engine import load_stage_module  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def rag():
+    return load_stage_module("2_rag_pipeline.py")
+
+
+@pytest.fixture(scope="session")
+def mda():
+    return load_stage_module("3_mda_generator.py")
+
+
+@pytest.fixture
+def filing_chunks():
+    """Chunks from two 10-K sections, shaped like FilingChunker output."""
+    topics = {
+        "Item 1 - Business": ["cloud subscriptions", "enterprise customers", "hardware segment",
+                              "services revenue", "international expansion"],
+        "Item 1A - Risk Factors": ["supply chain disruption", "regulatory change", "currency exposure",
+                                   "competition from new entrants", "cyber security incidents"],
+    }
+    chunks = []
+    for source, phrases in topics.items():
+        for i, phrase in enumerate(phrases):
+            text = f"{source}: discussion of {phrase} and its effect on results in paragraph {i}. " * 3
+            chunks.append({'id': hashlib.md5(text.encode()).hexdigest()[:12], 'text': text, 'source': source,
+                           'start_pos': i * 40, 'word_count': 50, 'char_start': i * 300,
+                           'char_end': i * 300 + len(text)})
+    return chunks
+
+
+@pytest.fixture(scope="session")
+def setup_data():
+    return load_stage_module("1_setup_data.py")
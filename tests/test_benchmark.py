@@ -0,0 +1,30 @@
+import time
+import tracemalloc
+
+from benchmark import BenchmarkSuite
+
+TINY = {'tickers': 2, 'quarters': 8, 'sections': 1, 'words': 400, 'queries': 5}
+
+
+def test_latency_percentiles_come_from_the_timed_runs(monkeypatch):
+    suite = BenchmarkSuite(repeat=2)
+    store_cls = suite.rag.ChromaDBVectorStore
+    original = store_cls.retrieve_similar
+    
+    def retrieve_similar(self, *args, **kwargs):
+        if tracemalloc.is_tracing():
+            time.sleep(0.05)  # stands in for the tracemalloc overhead
+        return original(self, *args, **kwargs)
+    
+    monkeypatch.setattr(store_cls, "retrieve_similar", retrieve_similar)
+    suite.run_scale('tiny', TINY)
+    
+    result = next(r for r in suite.results if r['benchmark'] == 'retrieve_similar')
+    assert result['p50_ms'] <= result['p95_ms'] < 50
+
+
+def test_time_returns_only_the_untraced_results():
+    suite = BenchmarkSuite(repeat=3)
+    returned = suite._time('tiny', 'noop', tracemalloc.is_tracing, 1, 'calls')
+    assert returned == [False, False, False]
+    assert suite.results[-1]['benchmark'] == 'noop'
@@ -0,0 +1,49 @@
+import hashlib
+import io
+
+import pytest
+
+
+def _reference_chunks(text, source_id, chunk_size, overlap):
+    """The original in-memory FilingChunker.chunk_text."""
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk_words = words[i:i + chunk_size]
+        chunk_text = ' '.join(chunk_words).strip()
+        if len(chunk_text) > 50:
+            chunks.append({
+                'id': hashlib.md5(chunk_text.encode()).hexdigest()[:12],
+                'text': chunk_text,
+                'source': source_id,
+                'start_pos': i,
+                'word_count': len(chunk_words),
+            })
+    return chunks
+
+
+TEXTS = {
+    'prose': " ".join(f"Revenue rose {i}% on cloud\tsubscriptions,\n services and support." for i in range(200)),
+    'ragged': "  lead  \n\n" + "  ".join(f"w{i}" + "x" * (i % 17) for i in range(999)) + " 　tail end  ",
+    'short': "Too short to make a chunk.",
+}
+
+
+@pytest.mark.parametrize("name", sorted(TEXTS))
+@pytest.mark.parametrize("chunk_size,overlap", [(40, 10), (25, 0), (7, 6)])
+@pytest.mark.parametrize("buffer_size", [5, 64, 1 << 20])
+def test_streamed_chunks_match_the_in_memory_chunker(rag, name, chunk_size, overlap, buffer_size):
+    text = TEXTS[name]
+    chunker = rag.FilingChunker(chunk_size=chunk_size, overlap=overlap)
+    streamed = list(chunker.iter_chunks(io.StringIO(text), "Item 7", buffer_size=buffer_size))
+    
+    expected = _reference_chunks(text, "Item 7", chunk_size, overlap)
+    keys = ('id', 'text', 'source', 'start_pos', 'word_count')
+    assert [{k: c[k] for k in keys} for c in streamed] == expected
+    for chunk in streamed:
+        assert text[chunk['char_start']:chunk['char_end']].split() == chunk['text'].split()
+
+
+def test_overlap_must_be_smaller_than_the_chunk(rag):
+    with pytest.raises(ValueError, match="overlap"):
+        list(rag.FilingChunker(chunk_size=10, overlap=10).iter_chunks(io.StringIO("a b c"), "Item 1"))
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+
+def test_embedders_must_implement_embed(rag):
+    class Incomplete(rag.Embedder):
+        pass
+    
+    with pytest.raises(TypeError, match="embed"):
+        Incomplete()
+
+
+def test_cached_chunks_are_not_embedded_again(rag, filing_chunks, tmp_path):
+    embedder = rag.HashingEmbedder(dim=64)
+    first = rag.EmbeddingEngine.with_disk_cache(embedder, cache_dir=str(tmp_path))
+    vectors = first.embed_chunks(filing_chunks)
+    assert first.stats['embedded'] == len(filing_chunks)
+    
+    second = rag.EmbeddingEngine.with_disk_cache(embedder, cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(second.embed_chunks(filing_chunks), vectors)
+    assert second.stats['cache_hits'] == len(filing_chunks) and second.stats['embedded'] == 0
+    np.testing.assert_array_equal(vectors, embedder.embed([c['text'] for c in filing_chunks]))
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pytest
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _sections(rag, path, buffer_size):
+    parser = rag.SECFilingParser(buffer_size=buffer_size, min_section_chars=150)
+    return [(name, stream.read()) for name, stream in parser.iter_sections(path)]
+
+
+@pytest.mark.parametrize("name", ["10k_sample.html", "10k_sample.txt"])
+def test_filing_yields_each_wanted_item_once_in_order(rag, name):
+    sections = dict(_sections(rag, FIXTURES / name, 1 << 16))
+    assert list(sections) == ['Item_1_Business', 'Item_1A_Risk_Factors', 'Item_7_MD&A']
+    
+    business, risks, mda = sections.values()
+    # The table of contents entries are skipped: each section starts at its real heading
+    assert business.startswith("ITEM 1. BUSINESS") and "Risk Factors" not in business
+    assert risks.startswith("ITEM 1A. RISK FACTORS") and "supply chain disruption" in risks
+    assert mda.startswith("Item 7") and "Revenue grew 8.9%" in mda
+    # A sentence starting "Item 7 discussed" is prose, not a heading; Item 2 is dropped
+    assert "Item 7 discussed below" in business and "no single customer" in business
+    assert "headquarters" not in risks + mda
+
+
+@pytest.mark.parametrize("name", ["10k_sample.html", "10k_sample.txt"])
+@pytest.mark.parametrize("buffer_size", [7, 13, 64])
+def test_buffer_boundaries_do_not_change_the_text(rag, name, buffer_size):
+    # Small buffers split tags, comments and entities across reads
+    assert _sections(rag, FIXTURES / name, buffer_size) == _sections(rag, FIXTURES / name, 1 << 16)
+
+
+def test_html_markup_is_stripped_and_entities_decoded(rag):
+    text = ''.join(body for _, body in _sections(rag, FIXTURES / "10k_sample.html", 7))
+    assert "<" not in text and "&amp;" not in text and "&nbsp;" not in text
+    assert "AT&T" in text and "Management’s" in text and "— including GDPR" in text
+    assert "tracking" not in text and "commented-out" not in text and "font-family" not in text
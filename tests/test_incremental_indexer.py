@@ -0,0 +1,74 @@
+import pytest
+
+
+def _filings(**overrides):
+    filings = {
+        f"Item {n}": " ".join(f"section {n} sentence {i} about revenue, margins and liquidity." for i in range(60))
+        for n in range(1, 5)
+    }
+    filings.update(overrides)
+    return filings
+
+
+def _indexer(rag, path):
+    engine = rag.EmbeddingEngine(rag.HashingEmbedder(dim=32))
+    return rag.IncrementalIndexer(rag.FilingChunker(chunk_size=40, overlap=10), engine, str(path))
+
+
+def _live_keys(store):
+    return sorted(key for key, rows in store._key_index().items() for _ in rows)
+
+
+def test_update_applies_only_the_diff_in_place(rag, tmp_path):
+    path = tmp_path / "store"
+    first = _indexer(rag, path).update(_filings())
+    assert first['added'] == first['live_chunks'] > 0
+    
+    changed = _filings(**{"Item 2": _filings()["Item 2"] + " A new closing sentence on cash."})
+    stats = _indexer(rag, path).update(changed)
+    assert stats['unchanged_sections'] == 3
+    assert 0 < stats['added'] <= 2 and 0 < stats['removed'] <= 2
+    assert (path / "seg1_bm25_rows.npy").exists() and (path / "deleted_rows.npy").exists()
+    
+    del changed["Item 4"]  # tombstones a quarter of the rows, so this save compacts
+    stats = _indexer(rag, path).update(changed)
+    assert stats['removed'] == first['added'] / 4
+    assert not (path / "seg1_bm25_rows.npy").exists() and not (path / "deleted_rows.npy").exists()
+    
+    rebuilt = _indexer(rag, tmp_path / "fresh")
+    rebuilt.update(changed)
+    reopened = rag.ChromaDBVectorStore.open(str(path))
+    assert _live_keys(reopened) == _live_keys(rebuilt.store)
+    assert _indexer(rag, path).update(changed)['unchanged_sections'] == len(changed)
+
+
+def test_rerun_after_a_crash_does_not_add_rows_twice(rag, tmp_path, monkeypatch):
+    path = tmp_path / "store"
+    _indexer(rag, path).update(_filings())
+    changed = _filings(**{"Item 3": "An entirely rewritten section about segment results."})
+    
+    def crash(self):
+        raise OSError("disk full")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(rag.IndexManifest, "save", crash)
+        with pytest.raises(OSError):
+            _indexer(rag, path).update(changed)
+    
+    stats = _indexer(rag, path).update(changed)
+    assert stats['added'] == 0 and stats['already_present'] > 0
+    keys = _live_keys(rag.ChromaDBVectorStore.open(str(path)))
+    assert len(keys) == len(set(keys)) == stats['live_chunks']
+
+
+def test_update_chunks_groups_sections_by_source(rag, tmp_path):
+    chunker = rag.FilingChunker(chunk_size=40, overlap=10)
+    chunks = list(chunker.iter_filings(_filings()))
+    indexer = _indexer(rag, tmp_path / "store")
+    assert indexer.update_chunks(chunks)['added'] == len(chunks)
+    
+    edited = [dict(c, text=c['text'] + " Restated.", id=c['id'][::-1]) if c['source'] == "Item 1" else c
+              for c in chunks]
+    stats = _indexer(rag, tmp_path / "store").update_chunks(edited)
+    assert stats['unchanged_sections'] == 3
+    assert stats['added'] == stats['removed'] == sum(c['source'] == "Item 1" for c in chunks)
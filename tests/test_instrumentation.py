@@ -0,0 +1,43 @@
+import json
+import threading
+
+from instrumentation import Tracer
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_malloc_peak_is_reported_by_the_outermost_span(tmp_path):
+    tracer = Tracer(str(tmp_path / "trace.jsonl"), enabled=True, trace_malloc=True)
+    with tracer.span('outer'):
+        big = bytearray(8_000_000)
+        del big
+        with tracer.span('inner'):
+            small = bytearray(1000)
+            del small
+    tracer.configure(enabled=False)
+    
+    spans = {r['name']: r for r in _records(tmp_path / "trace.jsonl")}
+    assert 'tracemalloc_peak_mb' not in spans['inner']
+    assert spans['outer']['tracemalloc_peak_mb'] >= 8.0
+
+
+def test_samples_are_bounded(tmp_path):
+    tracer = Tracer(str(tmp_path / "trace.jsonl"), enabled=True, max_samples=100)
+    
+    def observe(offset):
+        for i in range(5000):
+            tracer.observe('latency_ms', float(offset + i))
+    
+    threads = [threading.Thread(target=observe, args=(n * 5000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(tracer.samples['latency_ms'].values) == 100
+    stats = tracer.summary()['percentiles']['latency_ms']
+    assert stats['count'] == 20000
+    assert stats['max'] == 19999.0
+    assert 5000 < stats['p50'] < 15000
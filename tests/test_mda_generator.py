@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+KPIS = {'revenue_growth_yoy': 12.5, 'gross_margin': 41.0, 'current_ratio': 1.8}
+
+
+def _generator(mda, chunks, url, **kwargs):
+    return mda.MDAndAGenerator(KPIS, chunks, llm=mda.HTTPLLMClient(url), retry_backoff=0.0, **kwargs)
+
+
+def test_generates_every_section_through_stub_server(mda, filing_chunks):
+    async def run():
+        async with mda.StubLLMServer(latency=0.01) as server:
+            document = await _generator(mda, filing_chunks, server.url).agenerate_full_mda()
+            return document, server.requests
+    
+    document, requests = asyncio.run(run())
+    assert requests == len(mda.MDAndAGenerator.SECTIONS)
+    positions = [document.index(f"### {title}") for _, title in mda.MDAndAGenerator.SECTIONS]
+    assert positions == sorted(positions)
+    assert document.startswith(mda.MDAndAGenerator.HEADER)
+    assert document.endswith(mda.MDAndAGenerator.FOOTER)
+    assert "*Citations: [" in document
+
+
+def test_failed_requests_are_retried(mda, filing_chunks):
+    async def run():
+        async with mda.StubLLMServer(latency=0.0, fail_every=2) as server:
+            sections = [key async for key, _ in _generator(mda, filing_chunks, server.url).aiter_sections()]
+            return sections, server.requests
+    
+    sections, requests = asyncio.run(run())
+    assert sections == [key for key, _ in mda.MDAndAGenerator.SECTIONS]
+    assert requests > len(sections)
+
+
+def test_cached_sections_skip_the_llm(mda, filing_chunks, tmp_path):
+    cache = mda.LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    
+    async def run():
+        async with mda.StubLLMServer(latency=0.0) as server:
+            first = await _generator(mda, filing_chunks, server.url, cache=cache).agenerate_full_mda()
+            second = await _generator(mda, filing_chunks, server.url, cache=cache).agenerate_full_mda()
+            return first, second, server.requests
+    
+    first, second, requests = asyncio.run(run())
+    assert first == second
+    assert requests == len(mda.MDAndAGenerator.SECTIONS)
+    assert cache.stats['hits'] == len(mda.MDAndAGenerator.SECTIONS)
+
+
+def test_sync_wrappers_refuse_a_running_loop(mda, filing_chunks):
+    generator = mda.MDAndAGenerator(KPIS, filing_chunks)
+    
+    async def run():
+        with pytest.raises(RuntimeError, match="aiter_mda"):
+            generator.generate_full_mda()
+        with pytest.raises(RuntimeError, match="aiter_mda"):
+            next(generator.iter_mda())
+        return ''.join([piece async for piece in generator.aiter_mda()])
+    
+    assert asyncio.run(run()) == generator.generate_full_mda()
+
+
+def test_write_mda_replaces_the_file_atomically(mda, filing_chunks, tmp_path):
+    output = tmp_path / "mda.md"
+    streamed = []
+    mda.MDAndAGenerator(KPIS, filing_chunks).write_mda(str(output), lambda key, _: streamed.append(key))
+    assert streamed == [key for key, _ in mda.MDAndAGenerator.SECTIONS]
+    assert output.read_text() == mda.MDAndAGenerator(KPIS, filing_chunks).generate_full_mda()
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_llm_clients_must_implement_acomplete(mda):
+    class Incomplete(mda.LLMClient):
+        pass
+    
+    with pytest.raises(TypeError, match="acomplete"):
+        Incomplete()
+
+
+def _words(prefix, n):
+    return ' '.join(f"{prefix}{i}" for i in range(n))
+
+
+def test_packer_keeps_within_the_injected_token_budget(mda):
+    # One token per word: a char-based cut (budget * 4 chars) would keep several times too many
+    packer = mda.ContextPacker(token_budget=30, count_tokens=lambda text: len(text.split()))
+    chunks = [{'id': f"c{i}", 'text': _words(f"w{i}_", n), 'similarity': 1.0 - i / 10}
+              for i, n in enumerate([100, 20, 12, 8])]
+    
+    packed = packer.pack(chunks)
+    assert [p['chunk_ids'] for p in packed] == [['c0']]
+    assert packed[0]['text'] == _words("w0_", 30)
+    
+    packed = packer.pack(chunks[1:])
+    assert [p['chunk_ids'] for p in packed] == [['c1'], ['c3']]
+    assert sum(packer.count_tokens(p['text']) for p in packed) <= 30
+
+
+def test_packer_drops_near_duplicates_of_better_passages(mda):
+    base = _words("risk", 40)
+    chunks = [
+        {'id': "reworded", 'text': base.replace("risk39", "changed"), 'similarity': 0.8},
+        {'id': "best", 'text': base, 'similarity': 0.9},
+        {'id': "contained", 'text': ' '.join(base.split()[10:30]), 'similarity': 0.5},
+        {'id': "distinct", 'text': _words("cash", 40), 'similarity': 0.1},
+    ]
+    packed = mda.ContextPacker(dup_threshold=0.8).pack(chunks)
+    assert [p['chunk_ids'] for p in packed] == [['best'], ['distinct']]
+
+
+def test_packer_merges_overlapping_chunks_of_one_source(mda):
+    words = _words("w", 120).split()
+    chunks = [
+        {'id': "a", 'text': ' '.join(words[0:50]), 'source': "Item 7", 'start_pos': 0, 'similarity': 0.4},
+        {'id': "c", 'text': ' '.join(words[90:120]), 'source': "Item 7", 'start_pos': 90, 'similarity': 0.2},
+        {'id': "b", 'text': ' '.join(words[40:90]), 'source': "Item 7", 'start_pos': 40, 'similarity': 0.9},
+        {'id': "x", 'text': ' '.join(words[40:90]), 'source': "Item 8", 'start_pos': 40, 'similarity': 0.3},
+    ]
+    merged = mda.ContextPacker().merge_adjacent(chunks)
+    assert [(p['source'], p['chunk_ids']) for p in merged] == [("Item 7", ['a', 'b', 'c']), ("Item 8", ['x'])]
+    # Overlapping words appear once, and the passage takes its best chunk's score
+    assert merged[0]['text'] == ' '.join(words) and merged[0]['score'] == 0.9
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+
+from instrumentation import STAGES
+from mda_service import MDAService
+
+FILINGS = {
+    "Item 1 - Business": "Enterprise customers drove subscription revenue growth across cloud segments. " * 20,
+    "Item 1A - Risk Factors": "Supply chain disruption and regulation are key risks to competition. " * 20,
+}
+
+
+def _serve(tmp_path, scenario, **kwargs):
+    """Run `scenario(service)` against a started service on an ephemeral port."""
+    async def run():
+        service = MDAService(port=0, store_dir=None, jobs_dir=str(tmp_path / "jobs"),
+                             output_dir=str(tmp_path / "out"), data_dir=str(tmp_path / "data"), **kwargs)
+        await service.start()
+        try:
+            return await scenario(service)
+        finally:
+            await service.stop()
+    
+    return asyncio.run(run())
+
+
+async def _request(service, method, path, body=b'', headers=None):
+    reader, writer = await asyncio.open_connection(service.host, service.port)
+    headers = {'Content-Length': str(len(body)), **(headers or {})}
+    head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload
+
+
+async def _submit_json(service, request):
+    status, payload = await _request(service, "POST", "/api/jobs", json.dumps(request).encode(),
+                                     {'Content-Type': "application/json"})
+    return status, json.loads(payload)
+
+
+async def _events(service, job):
+    """Follow the job's Server-Sent Events until it finishes."""
+    status, payload = await _request(service, "GET", job['events_url'])
+    assert status == 200
+    return [json.loads(line[len("data: "):]) for line in payload.decode().splitlines() if line.startswith("data: ")]
+
+
+def _multipart(parts):
+    boundary = "mda-test-boundary"
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode(), {'Content-Type': f"multipart/form-data; boundary={boundary}"}
+
+
+def test_json_job_streams_stages_and_sections(tmp_path):
+    async def scenario(service):
+        status, job = await _submit_json(service, {'ticker': "ACME", 'filings': FILINGS})
+        assert status == 202 and job['ticker'] == "ACME"
+        events = await _events(service, job)
+        status, mda = await _request(service, "GET", job['mda_url'])
+        _, state = await _request(service, "GET", job['status_url'])
+        return events, status, mda.decode(), json.loads(state)
+    
+    events, status, mda, state = _serve(tmp_path, scenario)
+    assert [e['stage'] for e in events if e['event'] == 'stage'] == list(STAGES.values())
+    sections = [e for e in events if e['event'] == 'section']
+    assert len(sections) == 4 and events[-1] == dict(events[-1], event='done', state='succeeded')
+    assert status == 200 and all(s['title'] in mda for s in sections)
+    assert state['state'] == 'succeeded' and state['stage'] == STAGES['complete']
+
+
+def test_multipart_statements_are_narrowed_to_the_ticker(setup_data, tmp_path):
+    processor = setup_data.FinancialDataProcessor(data_dir=str(tmp_path))
+    processor.load_sample_data()
+    files = []
+    for name, df in processor.statements.items():
+        both = pd.concat([df.assign(Ticker="ACME"), df.assign(Ticker="OTHR")], ignore_index=True)
+        files.append((name, f"{name}.csv", both.to_csv(index=False).encode()))
+    
+    async def scenario(service):
+        body, headers = _multipart([("ticker", None, b"ACME"), *files])
+        status, payload = await _request(service, "POST", "/api/process-financials", body, headers)
+        job = json.loads(payload)
+        events = await _events(service, job)
+        
+        body, headers = _multipart(files)  # no ticker for two companies' statements
+        _, payload = await _request(service, "POST", "/api/jobs", body, headers)
+        unnamed = json.loads(payload)
+        await _events(service, unnamed)
+        return status, job, events, await _request(service, "GET", unnamed['mda_url'])
+    
+    status, job, events, (failed_status, failed) = _serve(tmp_path, scenario)
+    assert status == 202 and events[-1]['state'] == 'succeeded'
+    assert sorted(p.name for p in (tmp_path / "jobs" / job['id']).iterdir()) == \
+        ["balance.csv", "cashflow.csv", "income.csv"]
+    assert failed_status == 500 and "ticker" in json.loads(failed)['error']
+
+
+def test_full_queue_answers_503(tmp_path):
+    async def scenario(service):
+        first = await _submit_json(service, {'ticker': "ACME"})
+        second = await _submit_json(service, {'ticker': "ACME", 'statements': "Quarter,Revenue\nQ1 2024,1\n"})
+        return first, second, len(service.jobs)
+    
+    # No workers: the first job stays queued
+    (first, _), (second, error), jobs = _serve(tmp_path, scenario, workers=0, queue_size=1)
+    assert (first, second, jobs) == (202, 503, 1)
+    assert "queue is full" in error['error']
+    assert not (tmp_path / "jobs").exists()
+
+
+@pytest.mark.parametrize("upload", ["../income", "../../evil", "income/../../evil"])
+def test_upload_names_cannot_leave_the_job_directory(tmp_path, upload):
+    async def scenario(service):
+        body, headers = _multipart([(upload, "x.csv", b"Quarter,Revenue\nQ1 2024,1\n")])
+        multipart = await _request(service, "POST", "/api/jobs", body, headers)
+        json_status, error = await _submit_json(service, {'statements': {upload: "Quarter,Revenue\n"}})
+        return multipart, json_status, error
+    
+    (multipart_status, _), json_status, error = _serve(tmp_path, scenario)
+    assert multipart_status == json_status == 400 and "Unknown upload" in error['error']
+    assert sorted(p.name for p in tmp_path.rglob("*") if p.is_file()) == []
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_bad_content_length_is_a_client_error(tmp_path, length):
+    async def scenario(service):
+        return await _request(service, "POST", "/api/jobs", b'{}',
+                              {'Content-Length': length, 'Content-Type': "application/json"})
+    
+    status, payload = _serve(tmp_path, scenario)
+    assert status == 400 and "Content-Length" in json.loads(payload)['error']
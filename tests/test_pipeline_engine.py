@@ -0,0 +1,138 @@
+import pytest
+
+import pipeline_engine
+from pipeline_engine import BatchRunner, Pipeline, Stage, StageError, load_stage_module
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "source.txt").write_text("alpha")
+    return tmp_path
+
+
+def _stages(calls, scale=1):
+    def upper():
+        calls.append('upper')
+        with open("upper.txt", 'w') as f:
+            f.write(open("source.txt").read().upper() * scale)
+    
+    def count():
+        calls.append('count')
+        with open("count.txt", 'w') as f:
+            f.write(str(len(open("upper.txt").read())))
+    
+    return [Stage("count", count, inputs=["upper.txt"], outputs=["count.txt"]),
+            Stage("upper", upper, inputs=["source.txt"], outputs=["upper.txt"], params={'scale': scale})]
+
+
+def _run(calls, scale=1, force=False):
+    results = Pipeline(_stages(calls, scale), state_file=".state.json").run(force=force)
+    return {name: r['status'] for name, r in results.items()}
+
+
+def test_unchanged_stages_are_skipped(workspace):
+    calls = []
+    assert _run(calls) == {'upper': 'ran', 'count': 'ran'}
+    assert calls == ['upper', 'count']
+    assert _run(calls) == {'upper': 'skipped', 'count': 'skipped'}
+    assert calls == ['upper', 'count']
+
+
+def test_changed_inputs_and_params_rerun_downstream(workspace):
+    calls = []
+    _run(calls)
+    (workspace / "source.txt").write_text("beta!")
+    assert _run(calls) == {'upper': 'ran', 'count': 'ran'}
+    assert (workspace / "count.txt").read_text() == "5"
+    assert _run(calls, scale=2) == {'upper': 'ran', 'count': 'ran'}
+    assert (workspace / "count.txt").read_text() == "10"
+
+
+def test_missing_or_edited_outputs_rerun_their_stage(workspace):
+    calls = []
+    _run(calls)
+    (workspace / "count.txt").unlink()
+    assert _run(calls) == {'upper': 'skipped', 'count': 'ran'}
+    (workspace / "count.txt").write_text("tampered")
+    assert _run(calls) == {'upper': 'skipped', 'count': 'ran'}
+    assert _run(calls, force=True) == {'upper': 'ran', 'count': 'ran'}
+
+
+def test_missing_input_fails_the_run(workspace):
+    (workspace / "source.txt").unlink()
+    with pytest.raises(StageError, match="missing input source.txt"):
+        _run([])
+
+
+def test_index_stage_hashes_chunking_and_embedder_settings(rag):
+    run_pipeline = load_stage_module("4_run_pipeline.py")
+    
+    def index_params(**kwargs):
+        return next(s.params for s in run_pipeline.build_stages(**kwargs) if s.name == "index")
+    
+    default = index_params()
+    assert default == index_params(embedder=rag.HashingEmbedder())
+    assert index_params(chunk_size=200) != default
+    assert index_params(overlap=10) != default
+    assert index_params(embedder=rag.HashingEmbedder(dim=64)) != default
+
+
+def test_state_saves_while_other_stages_hash_files(workspace):
+    # Stages hashing many files run while others finish and save state
+    for i in range(400):
+        (workspace / f"input_{i}.txt").write_text(str(i))
+    
+    def noop():
+        pass
+    
+    stages = [Stage(f"s{i}", noop, inputs=[f"input_{j}.txt" for j in range(i, 400, 8)]) for i in range(8)]
+    pipeline = Pipeline(stages, state_file=".state.json", max_workers=8)
+    for _ in range(5):
+        pipeline.hasher.cache.clear()
+        assert all(r['status'] == 'ran' for r in pipeline.run(force=True).values())
+
+
+@pytest.fixture
+def batch_worker(tmp_path, monkeypatch):
+    def init(**config):
+        config = {**BatchRunner(retries=2, retry_backoff=0, output_dir=str(tmp_path / "out"),
+                                data_dir=str(tmp_path / "data")).config, **config}
+        pipeline_engine._init_batch_worker(config)
+        return pipeline_engine._WORKER
+    
+    yield init
+    pipeline_engine._WORKER.clear()
+
+
+def test_batch_retries_only_transient_failures(batch_worker, monkeypatch):
+    batch_worker()
+    errors = {'ACME': FileNotFoundError("statements/acme.csv"), 'BETA': ConnectionError("reset by peer")}
+    attempts = []
+    
+    def run_company(job):
+        attempts.append(job['ticker'])
+        raise errors[job['ticker']]
+    
+    monkeypatch.setattr(pipeline_engine, "_run_company", run_company)
+    results = pipeline_engine._run_batch([{'ticker': t, 'period': "Q2 2024"} for t in errors])
+    assert [r['attempts'] for r in results] == [1, 3]
+    assert attempts == ['ACME', 'BETA', 'BETA', 'BETA']
+    assert all(r['status'] == 'failed' for r in results)
+
+
+def test_batch_uses_the_shared_store_for_tagged_tickers(batch_worker, rag, filing_chunks, tmp_path):
+    retriever = rag.HybridRetriever(rag.ChromaDBVectorStore(), rag.EmbeddingEngine())
+    retriever.add_chunks([dict(c, ticker='ACME') for c in filing_chunks])
+    retriever.store.save(str(tmp_path / "store"))
+    (tmp_path / "beta.txt").write_text("Revenue grew on cloud subscriptions and services. " * 40)
+    batch_worker(store_dir=str(tmp_path / "store"), chunk_size=50, overlap=10)
+    
+    shared = pipeline_engine._run_company({'ticker': 'ACME', 'period': "Q2 2024"})
+    own = pipeline_engine._run_company({'ticker': 'BETA', 'period': "Q2 2024",
+                                        'filings': {"Item 7 - MD&A": str(tmp_path / "beta.txt")}})
+    assert shared['chunks'] == len(filing_chunks)
+    assert 0 < own['chunks'] != len(filing_chunks)
+    shared_ids = {c['id'] for c in filing_chunks}
+    assert any(cid in (tmp_path / "out" / "ACME_Q2_2024.md").read_text() for cid in shared_ids)
+    assert not any(cid in (tmp_path / "out" / "BETA_Q2_2024.md").read_text() for cid in shared_ids)
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize("fmt", ["npz", "parquet"])
+def test_table_store_keeps_nulls_in_text_columns(setup_data, tmp_path, fmt):
+    if fmt == "parquet" and not setup_data.HAS_PARQUET:
+        pytest.skip("pyarrow not installed")
+    frame = pd.DataFrame({'Ticker': ['AAA', None, 'CCC'], 'Revenue': [1.0, np.nan, 3.0]})
+    store = setup_data.ColumnarTableStore(str(tmp_path / "tables"))
+    store.write({'statements': frame}, fmt=fmt)
+    
+    loaded = setup_data.ColumnarTableStore(str(tmp_path / "tables")).read('statements')
+    assert loaded['Ticker'].tolist() == ['AAA', None, 'CCC']
+    assert loaded['Revenue'].isna().tolist() == [False, True, False]
+    assert store.read('statements', ['Revenue'])['Revenue'].iloc[0] == 1.0
+
+
+
+@pytest.mark.parametrize("fmt", ["npz", "parquet"])
+def test_load_kpis_reads_the_export_and_tolerates_no_kpis(setup_data, tmp_path, fmt):
+    if fmt == "parquet" and not setup_data.HAS_PARQUET:
+        pytest.skip("pyarrow not installed")
+    processor = setup_data.FinancialDataProcessor(data_dir=str(tmp_path))
+    processor.load_sample_data()
+    path = processor.export_analysis(fmt=fmt)
+    assert setup_data.load_kpis(str(path)) == {}
+    
+    kpis = processor.compute_kpis()
+    path = processor.export_analysis(fmt=fmt)
+    assert setup_data.load_kpis(str(path)) == pytest.approx(kpis)
+
+def test_append_quarter_without_prior_deltas_uses_loaded_history(setup_data, tmp_path):
+    processor = setup_data.FinancialDataProcessor(data_dir=str(tmp_path))
+    processor.load_sample_data()
+    history = {name: df.iloc[:-1].reset_index(drop=True) for name, df in processor.statements.items()}
+    latest = {name: df.iloc[-1:].reset_index(drop=True) for name, df in processor.statements.items()}
+    
+    full = {name: df.iloc[-1:].reset_index(drop=True) for name, df in processor.compute_yoy_qoq_deltas().items()}
+    processor.statements, processor.delta_engines = history, {}
+    appended = processor.append_quarter(latest)
+    
+    assert appended['income_qoq']['Revenue_QoQ_%'].notna().all()
+    for name, deltas in appended.items():
+        pd.testing.assert_frame_equal(deltas.reset_index(drop=True), full[name])
+
+
+def _statements(rows):
+    """Statements from (ticker, quarter, revenue, cogs, net_income, equity) tuples."""
+    ticker, quarter, revenue, cogs, net_income, equity = (list(col) for col in zip(*rows))
+    return {
+        'income': pd.DataFrame({'Ticker': ticker, 'Quarter': quarter, 'Revenue': revenue, 'COGS': cogs,
+                                'Operating_Expense': [10.0] * len(rows), 'Net_Income': net_income}),
+        'balance': pd.DataFrame({'Ticker': ticker, 'Quarter': quarter, 'Total_Liabilities': [50.0] * len(rows),
+                                 'Shareholders_Equity': equity, 'Current_Ratio': [1.5] * len(rows)}),
+        'cashflow': pd.DataFrame({'Ticker': ticker, 'Quarter': quarter, 'Operating_Cash_Flow': [5.0] * len(rows)}),
+    }
+
+
+def _scalar_kpis(revenue, cogs, net_income, equity, prior_revenue=None):
+    """The per-quarter formulas KPIEngine replaced, evaluated one quarter at a time."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        revenue, equity = np.float64(revenue), np.float64(equity)
+        kpis = {
+            'Gross_Margin_%': (revenue - cogs) / revenue * 100,
+            'Operating_Margin_%': (revenue - cogs - 10.0) / revenue * 100,
+            'Net_Margin_%': net_income / revenue * 100,
+            'Debt_to_Equity': 50.0 / equity,
+            'Current_Ratio': 1.5,
+            'ROE_%': net_income / equity * 100,
+        }
+        if prior_revenue is not None:
+            kpis['YoY_Revenue_Growth_%'] = (revenue - prior_revenue) / np.float64(prior_revenue) * 100
+    return kpis
+
+
+def test_safe_div_gives_nan_where_the_scalar_code_gave_inf(setup_data):
+    out = setup_data._safe_div([1.0, 0.0, 3.0, np.nan, 4.0], [2.0, 0.0, 0.0, 1.0, np.nan])
+    np.testing.assert_array_equal(out, [0.5, np.nan, np.nan, np.nan, np.nan])
+    
+    rows = [('AAA', 'Q1 2024', 100.0, 40.0, 12.0, 80.0),
+            ('AAA', 'Q2 2024', 0.0, 5.0, -3.0, 0.0)]
+    kpis = setup_data.KPIEngine.compute(*_statements(rows).values())
+    for (*_, revenue, cogs, net_income, equity), (_, row) in zip(rows, kpis.iterrows()):
+        for name, expected in _scalar_kpis(revenue, cogs, net_income, equity).items():
+            if np.isfinite(expected):
+                assert row[name] == pytest.approx(expected)
+            else:
+                assert np.isnan(row[name])
+
+
+def test_kpi_engine_matches_scalar_formulas_per_ticker_with_gaps(setup_data):
+    rows = [('BBB', f'Q{q} {y}', 100.0 + 10 * i, 30.0 + i, 8.0 + i, 70.0 + i)
+            for i, (y, q) in enumerate([(2023, 1), (2023, 2), (2023, 4), (2024, 1), (2024, 3)])]
+    rows += [('AAA', '2023Q1', 200.0, 90.0, 20.0, 100.0), ('AAA', '2024Q1', 260.0, 100.0, 30.0, 120.0)]
+    kpis = setup_data.KPIEngine.compute(*_statements(rows).values())
+    
+    assert kpis['Ticker'].tolist() == ['AAA'] * 2 + ['BBB'] * 5
+    revenue = {(t, q): r for t, q, r, *_ in rows}
+    for (_, row), (ticker, quarter, *values) in zip(kpis.iterrows(), sorted(rows, key=lambda r: r[0])):
+        assert (row['Ticker'], row['Quarter']) == (ticker, quarter)
+        year = int(quarter[-4:]) if quarter.startswith('Q') else int(quarter[:4])
+        prior = (quarter[:3] + str(year - 1)) if quarter.startswith('Q') else f"{year - 1}{quarter[4:]}"
+        expected = _scalar_kpis(*values, prior_revenue=revenue.get((ticker, prior)))
+        for name, value in expected.items():
+            assert row[name] == pytest.approx(value)
+        # A missing prior-year quarter gives no growth figure, never a neighbouring quarter's
+        assert np.isnan(row['YoY_Revenue_Growth_%']) == ('YoY_Revenue_Growth_%' not in expected)
+
+
+def test_compute_kpis_needs_a_ticker_for_multi_ticker_statements(setup_data, tmp_path):
+    processor = setup_data.FinancialDataProcessor(data_dir=str(tmp_path))
+    processor.statements = _statements([('AAA', 'Q1 2024', 100.0, 40.0, 12.0, 80.0),
+                                        ('BBB', 'Q1 2024', 300.0, 60.0, 30.0, 90.0),
+                                        ('BBB', 'Q2 2024', 310.0, 62.0, 31.0, 91.0)])
+    with pytest.raises(ValueError, match="2 tickers"):
+        processor.compute_kpis()
+    with pytest.raises(ValueError, match="ticker 'CCC'"):
+        processor.compute_kpis(ticker='CCC')
+    
+    assert processor.compute_kpis(ticker='AAA')['Net_Margin_%'] == pytest.approx(12.0)
+    assert processor.compute_kpis(ticker='BBB')['Net_Margin_%'] == pytest.approx(10.0)
+    assert processor.compute_kpis('Q1 2024', ticker='BBB')['Net_Margin_%'] == pytest.approx(10.0)
+
+
+def _revenue(quarters, ticker='AAA'):
+    return pd.DataFrame({'Ticker': ticker, 'Quarter': [q for q, _ in quarters],
+                         'Revenue': [r for _, r in quarters]})
+
+
+def test_delta_engine_keeps_the_last_row_of_a_duplicated_quarter(setup_data):
+    reported = _revenue([('Q1 2024', 100.0), ('Q2 2024', 110.0), ('2024Q2', 120.0), ('Q3 2024', 132.0)])
+    deltas = setup_data.DeltaEngine().compute(reported)
+    
+    assert deltas['Quarter'].tolist() == ['Q1 2024', '2024Q2', 'Q3 2024']
+    assert deltas['Revenue_QoQ_%'].tolist()[1:] == pytest.approx([20.0, 10.0])
+
+
+def test_restated_quarter_replaces_its_row_and_refreshes_later_deltas(setup_data, tmp_path):
+    quarters = [f'Q{q} {y}' for y in (2023, 2024) for q in range(1, 5)]
+    history = _revenue([(q, 100.0 + 10 * i) for i, q in enumerate(quarters)])
+    restated = _revenue([('Q3 2024', 200.0)])
+    
+    processor = setup_data.FinancialDataProcessor(data_dir=str(tmp_path))
+    processor.statements = {'income': history}
+    assert set(processor.compute_yoy_qoq_deltas()) == {'income_qoq'}
+    appended = processor.append_quarter({'income': restated})['income_qoq']
+    
+    corrected = history.copy()
+    corrected.loc[corrected['Quarter'] == 'Q3 2024', 'Revenue'] = 200.0
+    expected = setup_data.DeltaEngine().compute(corrected)
+    
+    # The restated quarter and the one after it (whose QoQ lags against it)
+    assert appended['Quarter'].tolist() == ['Q3 2024', 'Q4 2024']
+    pd.testing.assert_frame_equal(appended.reset_index(drop=True), expected.iloc[-2:].reset_index(drop=True))
+    pd.testing.assert_frame_equal(processor.statements['income'].sort_values('Quarter', key=lambda q: q.str[3:] + q.str[:2])
+                                  .reset_index(drop=True), corrected)
+    
+    frame = processor.delta_engines['income'].frame
+    assert len(frame) == len(quarters)
+    pd.testing.assert_frame_equal(frame.set_index('Quarter').loc[quarters].reset_index(),
+                                  expected.set_index('Quarter').loc[quarters].reset_index())
@@ -0,0 +1,320 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+
+def _store(rag, chunks, **kwargs):
+    engine = rag.EmbeddingEngine(rag.HashingEmbedder(dim=64))
+    store = rag.ChromaDBVectorStore(**kwargs)
+    store.add_documents(chunks, engine.embed_chunks(chunks))
+    return store, engine
+
+
+def _random_rows(n, dim=32, seed=0, clusters=None):
+    """Synthetic chunks with random (optionally clustered) embeddings."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    if clusters:
+        centers = rng.normal(size=(clusters, dim)).astype(np.float32) * 4
+        vectors += centers[rng.integers(clusters, size=n)]
+    chunks = [{'id': hashlib.md5(f"chunk {i}".encode()).hexdigest()[:12], 'text': f"chunk {i}",
+               'source': f"Item {i % 3}"} for i in range(n)]
+    return chunks, vectors
+
+
+def _nearest_text(store, engine, chunk):
+    query = engine.embedder.embed([chunk['text']])[0]
+    return store.retrieve_similar(query, top_k=1)[0]['text']
+
+
+def test_save_and_open_round_trip(rag, filing_chunks, tmp_path):
+    store, engine = _store(rag, filing_chunks, quantization='int8')
+    store.save(str(tmp_path / "store"))
+    opened = rag.ChromaDBVectorStore.open(str(tmp_path / "store"))
+    
+    assert len(opened) == len(filing_chunks)
+    assert [dict(row) for row in opened.chunks] == [dict(row) for row in store.chunks]
+    np.testing.assert_allclose(opened.embeddings, store.embeddings)
+    for chunk in filing_chunks:
+        assert _nearest_text(opened, engine, chunk) == chunk['text']
+
+
+def test_save_discards_an_interrupted_save(rag, filing_chunks, tmp_path):
+    store, engine = _store(rag, filing_chunks)
+    scratch = tmp_path / "store" / ".tmp-save"
+    scratch.mkdir(parents=True)
+    np.save(scratch / "field_period.npy", np.zeros(3, dtype=np.int32))
+    (scratch / "store.json").write_text("{")
+    
+    store.save(str(tmp_path / "store"))
+    assert not scratch.exists() and not (tmp_path / "store" / "field_period.npy").exists()
+    opened = rag.ChromaDBVectorStore.open(str(tmp_path / "store"))
+    assert [dict(row) for row in opened.chunks] == [dict(row) for row in store.chunks]
+
+
+def test_delete_and_compact_keep_rows_aligned(rag, filing_chunks, tmp_path):
+    store, engine = _store(rag, filing_chunks)
+    doomed = filing_chunks[1::3]
+    assert store.delete((c['source'], c['id']) for c in doomed) == len(doomed)
+    kept = [c for c in filing_chunks if c not in doomed]
+    
+    for chunk in kept:
+        assert _nearest_text(store, engine, chunk) == chunk['text']
+    store.compact()
+    assert len(store) == len(kept)
+    assert list(store.documents) == [c['text'] for c in kept]
+    for chunk in kept:
+        assert _nearest_text(store, engine, chunk) == chunk['text']
+    
+    store.save(str(tmp_path / "store"))
+    opened = rag.ChromaDBVectorStore.open(str(tmp_path / "store"))
+    assert list(opened.documents) == [c['text'] for c in kept]
+
+
+def test_store_copies_added_chunk_tables(rag, filing_chunks):
+    engine = rag.EmbeddingEngine(rag.HashingEmbedder(dim=64))
+    table = rag.ChunkTable.from_chunks(filing_chunks[:4])
+    store = rag.ChromaDBVectorStore()
+    store.add_documents(table, engine.embed_chunks(table))
+    store.add_documents(filing_chunks[4:], engine.embed_chunks(filing_chunks[4:]))
+    assert len(table) == 4
+    assert len(store) == len(filing_chunks)
+
+
+def test_chunk_ids_are_stored_as_digest_bytes(rag, filing_chunks):
+    table = rag.ChunkTable.from_chunks(filing_chunks)
+    assert table.ids.dtype.itemsize == rag.CHUNK_ID_BYTES
+    assert [row['id'] for row in table] == [c['id'] for c in filing_chunks]
+    assert [cid for _, cid in table.source_ids()] == [c['id'] for c in filing_chunks]
+    
+    # Other ids are hashed into the fixed-width column, and match by their stored form
+    table.append(dict(filing_chunks[0], id="doc-1/para-3"))
+    stored = rag.ChunkTable.stored_id("doc-1/para-3")
+    assert table[-1]['id'] == stored and len(stored) == 2 * rag.CHUNK_ID_BYTES
+    assert rag.ChunkTable.stored_id(filing_chunks[0]['id']) == filing_chunks[0]['id']
+    
+    store, _ = _store(rag, [dict(c, id=f"doc-{i}") for i, c in enumerate(filing_chunks)])
+    assert store.delete([(filing_chunks[0]['source'], "doc-0")]) == 1
+
+
+def test_take_copies_rows_in_order(rag, filing_chunks):
+    table = rag.ChunkTable.from_chunks(filing_chunks)
+    for rows in ([], [4], [0, 1, 2, 7, 8, 9], [9, 3, 4, 5, 0], list(range(len(filing_chunks)))):
+        taken = table.take(np.array(rows, dtype=np.int64))
+        assert [dict(row) for row in taken] == [dict(table[r]) for r in rows]
+
+
+def test_empty_store_starts_small(rag):
+    store = rag.ChromaDBVectorStore(dim=384)
+    assert store.embeddings.nbytes == 0
+    assert store._matrix.nbytes + store.chunks._blob.nbytes < 1024
+
+
+def _retriever(rag, chunks):
+    retriever = rag.HybridRetriever(rag.ChromaDBVectorStore(), rag.EmbeddingEngine(rag.HashingEmbedder(dim=64)))
+    retriever.add_chunks(chunks)
+    return retriever
+
+
+def _hybrid_texts(retriever, query, **kwargs):
+    return [r['text'] for r in retriever.retrieve(query, top_k=3, **kwargs)]
+
+
+def test_bm25_follows_compaction(rag, filing_chunks, tmp_path):
+    retriever = _retriever(rag, filing_chunks)
+    doomed = filing_chunks[:3]
+    retriever.store.delete((c['source'], c['id']) for c in doomed)
+    retriever.store.compact()
+    
+    for chunk in filing_chunks[3:]:
+        phrase = chunk['text'].split(': ', 1)[1].split(' and its')[0]
+        results = retriever.retrieve(phrase, top_k=3)
+        assert chunk['text'] == results[0]['text']
+        lexical_rows, _ = retriever.lexical.search(phrase, 1)
+        assert retriever.store.chunks.text(int(lexical_rows[0])) == chunk['text']
+    assert all(c['text'] not in _hybrid_texts(retriever, "supply chain cloud regulatory") for c in doomed)
+
+
+def test_bm25_is_saved_with_the_store(rag, filing_chunks, tmp_path):
+    retriever = _retriever(rag, filing_chunks)
+    retriever.store.delete([(filing_chunks[0]['source'], filing_chunks[0]['id'])])
+    retriever.store.save(str(tmp_path / "store"))
+    assert (tmp_path / "store" / "bm25_rows.npy").exists()
+    
+    opened = rag.ChromaDBVectorStore.open(str(tmp_path / "store"))
+    assert opened.lexical is not None and len(opened.lexical) == len(opened)
+    reopened = rag.HybridRetriever(opened, retriever.engine)
+    for query in ("enterprise customers", "currency exposure", "paragraph 3"):
+        assert reopened.retrieve(query, top_k=3) == retriever.retrieve(query, top_k=3)
+    
+    more = [dict(c, id=c['id'][::-1], text=c['text'] + " Updated outlook.") for c in filing_chunks[:2]]
+    reopened.add_chunks(more)
+    assert reopened.retrieve("updated outlook", top_k=1)[0]['text'] in {c['text'] for c in more}
+
+
+def test_retrieved_chunks_merge_in_the_packer(rag, mda, filing_chunks):
+    retriever = _retriever(rag, filing_chunks)
+    results = retriever.retrieve("discussion of results", top_k=5, filters={'source': "Item 1 - Business"})
+    assert all({'start_pos', 'word_count'} <= set(r) for r in results)
+    
+    passages = mda.ContextPacker().merge_adjacent(results)
+    assert len(passages) < len(results)
+    assert sorted(cid for p in passages for cid in p['chunk_ids']) == sorted(r['chunk_id'] for r in results)
+    
+    vector_results = retriever.store.retrieve_similar(
+        retriever.engine.embedder.embed(["discussion of results"])[0], top_k=3)
+    assert all(r['start_pos'] == next(c for c in filing_chunks if c['id'] == r['chunk_id'])['start_pos']
+               for r in vector_results)
+
+
+def test_filters_narrow_the_search(rag, filing_chunks):
+    store, engine = _store(rag, filing_chunks)
+    risk = "Item 1A - Risk Factors"
+    query = engine.embedder.embed(["cloud subscriptions"])[0]
+    results = store.retrieve_similar(query, top_k=3, filters={'source': risk})
+    assert results and all(r['source'] == risk for r in results)
+
+
+def test_packer_keeps_the_hybrid_ranking(rag, mda, filing_chunks):
+    class QueryEmbedder(rag.Embedder):
+        """Every text embeds to one fixed query vector."""
+        dim = len(filing_chunks)
+        
+        def embed(self, texts):
+            vector = np.zeros(self.dim, dtype=np.float32)
+            vector[[0, 3, 9, 5]] = [1.0, 0.9, 0.8, 0.7]
+            return np.tile(vector, (len(texts), 1))
+    
+    store = rag.ChromaDBVectorStore()
+    store.add_documents(filing_chunks, np.eye(len(filing_chunks), dtype=np.float32))
+    retriever = rag.HybridRetriever(store, rag.EmbeddingEngine(QueryEmbedder()), candidates=4)
+    # Vector ranking is rows 0, 3, 9, 5; only row 7 mentions currency
+    results = retriever.retrieve("currency exposure", top_k=4)
+    ids = [c['id'] for c in filing_chunks]
+    assert [ids.index(r['chunk_id']) for r in results] == [0, 7, 3, 9]
+    assert results[1]['similarity'] == 0.0
+    
+    packed = mda.ContextPacker().pack(results)
+    assert [p['chunk_ids'] for p in packed] == [[r['chunk_id']] for r in results]
+
+
+def test_saving_back_in_place_appends_segments(rag, filing_chunks, tmp_path):
+    path = tmp_path / "store"
+    retriever = _retriever(rag, filing_chunks[:4])
+    retriever.store.build_index(rag.IVFIndex(n_lists=2))
+    retriever.store.save(str(path))
+    
+    writer = rag.ChromaDBVectorStore.open(str(path), writable=True)
+    appender = rag.HybridRetriever(writer, retriever.engine)
+    appender.add_chunks(filing_chunks[4:7])
+    writer.save(str(path))  # outgrows the first save's files, which are rewritten with spare rows
+    inode = (path / "embeddings.npy").stat().st_ino
+    
+    writer = rag.ChromaDBVectorStore.open(str(path), writable=True)
+    appender = rag.HybridRetriever(writer, retriever.engine)
+    appender.add_chunks(filing_chunks[7:])
+    assert isinstance(writer._matrix, np.memmap)  # added straight into the spare rows
+    writer.delete([(filing_chunks[0]['source'], filing_chunks[0]['id'])])
+    writer.save(str(path))
+    assert (path / "embeddings.npy").stat().st_ino == inode
+    assert (path / "seg2_bm25_rows.npy").exists() and (path / "seg2_ivf_ids.npy").exists()
+    
+    opened = rag.ChromaDBVectorStore.open(str(path))
+    assert [dict(row) for row in opened.chunks] == [dict(c) for c in filing_chunks]
+    assert opened.live_count == len(filing_chunks) - 1
+    np.testing.assert_allclose(opened.embeddings, _store(rag, filing_chunks)[0].embeddings, rtol=1e-6)
+    listed = np.concatenate([opened.index._list_ids(n) for n in range(opened.index.n_lists)])
+    assert sorted(listed.tolist()) == list(range(len(filing_chunks)))
+    
+    expected = _retriever(rag, filing_chunks)
+    expected.store.delete([(filing_chunks[0]['source'], filing_chunks[0]['id'])])
+    reopened = rag.HybridRetriever(opened, retriever.engine)
+    for query in ("enterprise customers", "currency exposure", "paragraph 3"):
+        rows, scores = opened.lexical.search(query, 5, exclude=opened._deleted_rows)
+        expected_rows, expected_scores = expected.lexical.search(query, 5, exclude=expected.store._deleted_rows)
+        assert rows.tolist() == expected_rows.tolist()
+        np.testing.assert_allclose(scores, expected_scores)
+        assert reopened.retrieve(query, top_k=1) == expected.retrieve(query, top_k=1)
+    
+    more = [dict(c, id=c['id'][::-1], text=c['text'] + " Updated outlook.") for c in filing_chunks[:2]]
+    reopened.add_chunks(more)  # a read-only open copies before appending
+    assert reopened.retrieve("updated outlook", top_k=1)[0]['text'] in {c['text'] for c in more}
+
+
+def test_batched_retrieval_matches_per_query_cosine(rag):
+    chunks, vectors = _random_rows(300)
+    store = rag.ChromaDBVectorStore()
+    store.add_documents(chunks, vectors)
+    queries = np.random.default_rng(1).normal(size=(12, vectors.shape[1])).astype(np.float32)
+    
+    cosine = (queries @ vectors.T) / np.outer(np.linalg.norm(queries, axis=1), np.linalg.norm(vectors, axis=1))
+    batched = store.retrieve_similar_many(queries, top_k=5)
+    for query, scores, results in zip(queries, cosine, batched):
+        single = store.retrieve_similar(query, top_k=5)
+        assert [r['chunk_id'] for r in results] == [r['chunk_id'] for r in single]
+        expected = np.argsort(-scores)[:5]
+        assert [r['text'] for r in single] == [chunks[i]['text'] for i in expected]
+        np.testing.assert_allclose([r['similarity'] for r in single], scores[expected], rtol=1e-5)
+        np.testing.assert_allclose([r['similarity'] for r in results], scores[expected], rtol=1e-5)
+
+
+def test_ivf_recall_against_exact_search(rag):
+    chunks, vectors = _random_rows(3000, clusters=24)
+    store = rag.ChromaDBVectorStore(index=rag.IVFIndex(n_lists=16, nprobe=4, min_train_size=1000))
+    store.add_documents(chunks, vectors)
+    assert store.index.is_trained and store.index.list_sizes().sum() == len(chunks)
+    
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.choice(len(vectors), 50, replace=False)] + rng.normal(size=(50, vectors.shape[1])) * 0.5
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = [set(np.argsort(-(normalized @ q))[:10].tolist()) for q in queries]
+    
+    def recall(nprobe):
+        found = [{int(r['text'].split()[1]) for r in store.retrieve_similar(q, top_k=10, nprobe=nprobe)}
+                 for q in queries]
+        return sum(len(f & e) for f, e in zip(found, exact)) / (10 * len(queries))
+    
+    assert recall(16) == 1.0  # probing every list is exact
+    assert recall(4) >= 0.9
+    assert recall(1) <= recall(4)
+    report = {r['nprobe']: r['recall@10'] for r in store.recall_report(queries, nprobe_values=(4, 16))}
+    assert report[16] == 1.0 and report[4] >= 0.9
+
+
+def test_quantizers_must_implement_encode_and_score(rag):
+    with pytest.raises(TypeError):
+        rag._Quantizer(8)
+    
+    class SignOnly(rag._Quantizer):
+        def _encode(self, vectors):
+            return {'signs': np.sign(vectors).astype(np.int8)}
+    
+    with pytest.raises(TypeError):
+        SignOnly(8)
+
+
+def test_quantized_recall_and_exact_rerank(rag):
+    chunks, vectors = _random_rows(2000, dim=64, clusters=20)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=50)] + rng.normal(size=(50, 64)).astype(np.float32)
+    
+    recall = {}
+    for factor in (1, 8):
+        store = rag.ChromaDBVectorStore(rerank_factor=factor)
+        store.add_documents(chunks, vectors)
+        recall[factor] = {r['mode']: r['recall@10'] for r in store.quantization_report(queries, top_k=10)}
+    assert recall[8]['float32'] == 1.0
+    assert recall[8]['int8'] >= 0.98 and recall[8]['binary'] >= 0.85
+    # A deeper re-rank is what recovers binary recall
+    assert recall[1]['binary'] < recall[8]['binary']
+    
+    store.quantize('int8')
+    exact = rag.ChromaDBVectorStore()
+    exact.add_documents(chunks, vectors)
+    for query in queries[:10]:
+        results = store.retrieve_similar(query, top_k=5)
+        by_id = {r['chunk_id']: r['similarity'] for r in exact.retrieve_similar(query, top_k=len(chunks))}
+        # Survivors are re-scored against the float32 rows, not the codes
+        np.testing.assert_allclose([r['similarity'] for r in results], [by_id[r['chunk_id']] for r in results],
+                                   rtol=1e-5)